@@ -3,15 +3,38 @@ Manga Library Server - Main Application
 Main entry point for the manga server
 """
 
-from flask import Flask, render_template, jsonify, send_file, request
+from flask import Flask, render_template, jsonify, request, Response, g
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
 from pathlib import Path
+from urllib.parse import quote
+from datetime import datetime, timezone
+import cProfile
+import fcntl
+import hashlib
+import io
+import mimetypes
 import os
+import pstats
+import re
+import threading
+import time
+import zipfile
 
-from scripts.library_scanner import LibraryScanner
+from scripts.library_index import LibraryIndex
+from scripts.library_watcher import LibraryWatcher
+from scripts.analysis_cache import AnalysisCache
+from scripts.analysis_worker import AnalysisWorker
 from scripts.metadata_manager import MetadataManager
+from scripts.search_index import SearchIndex
 from scripts.chapter_reader import ChapterReader
 from scripts.cover_selector import CoverSelector
 from scripts.settings_manager import SettingsManager
+from scripts.user_store import UserStore
+from scripts.image_cache import ImageCache
+from scripts.chapter_archive import ArchiveReader, FileRangeReader, is_archive
+from scripts.metrics import metrics
 
 app = Flask(__name__, 
             template_folder='templates',
@@ -20,13 +43,230 @@ app = Flask(__name__,
 # Configuration
 MANGA_ROOT = os.environ.get('MANGA_ROOT', './manga')
 app.config['MANGA_ROOT'] = MANGA_ROOT
+# Seconds between filesystem checks of the library index
+LIBRARY_REFRESH_INTERVAL = float(os.environ.get('LIBRARY_REFRESH_INTERVAL', '10'))
+# Threads traversing series in parallel during a refresh (helps on NFS/SMB)
+LIBRARY_SCAN_WORKERS = int(os.environ.get('LIBRARY_SCAN_WORKERS', '8'))
+# Push filesystem changes into the index instead of checking on requests:
+# 'inotify' (polls if unavailable), 'poll' (e.g. network mounts) or 'off'
+LIBRARY_WATCH = os.environ.get('LIBRARY_WATCH', 'off').lower()
+# Seconds between full rescans when the watcher polls
+LIBRARY_POLL_INTERVAL = float(os.environ.get('LIBRARY_POLL_INTERVAL', '300'))
+# Background analysis processes (0 disables pre-analysis)
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+ANALYSIS_QUEUE_SIZE = int(os.environ.get('ANALYSIS_QUEUE_SIZE', '1000'))
+# Extract a chapter's page features in one vectorized batch (ChapterFeatures):
+# faster, but its features drift slightly from the per-page ones and a few
+# near-tie chapters pair differently
+PAIRING_BATCH = os.environ.get('PAIRING_BATCH', 'off').lower() in ('1', 'true', 'yes', 'on')
+# Disk budget for generated thumbnails
+THUMBNAIL_CACHE_MB = int(os.environ.get('THUMBNAIL_CACHE_MB', '512'))
+# Thumbnail widths we generate; requested widths snap up to one of these
+THUMBNAIL_WIDTHS = (160, 320, 480)
+# Disk budget and worker threads for reader-sized page derivatives
+DERIVATIVE_CACHE_MB = int(os.environ.get('DERIVATIVE_CACHE_MB', '2048'))
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', '2'))
+# Page widths the reader may request (?w=); others snap up to one of these
+READER_WIDTHS = (480, 720, 1080, 1440, 1920, 2560)
+# Browser cache lifetime for page images (seconds, default 30 days)
+IMAGE_MAX_AGE = int(os.environ.get('IMAGE_MAX_AGE', 30 * 24 * 3600))
+# Who sends image bytes: 'direct' (this server, via sendfile where the WSGI
+# server supports it), 'x-accel' (nginx X-Accel-Redirect) or 'x-sendfile'
+# (Apache/lighttpd X-Sendfile). Archive members are always sent directly
+IMAGE_DELIVERY = os.environ.get('IMAGE_DELIVERY', 'direct').lower()
+# X-Accel-Redirect URIs are IMAGE_ACCEL_PREFIX/manga/<path> and
+# IMAGE_ACCEL_PREFIX/data/<path>; map both to internal nginx locations
+IMAGE_ACCEL_PREFIX = os.environ.get('IMAGE_ACCEL_PREFIX', '/_internal').rstrip('/')
+ACCEL_ROOTS = {'manga': Path(MANGA_ROOT).resolve(), 'data': Path('data').resolve()}
+# Requests sent with an X-Profile header are run under cProfile when enabled;
+# those slower than PROFILE_SLOW_MS are summarised in the log and saved to PROFILE_DIR
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '').lower() in ('1', 'true', 'yes', 'on')
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '200'))
+PROFILE_DIR = Path('data/profiles')
+# Once a server process is up, warm it in the background: read the library
+# index and compile the templates, and (in the process running the
+# background work) select missing covers ahead of chapter analysis
+WARMUP = os.environ.get('WARMUP', 'on').lower() not in ('0', 'false', 'no', 'off')
+# Held by the one server process that scans, watches and analyses the library
+BACKGROUND_LOCK = 'data/background.lock'
+# Seconds reading positions are held in memory before being written together
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '2'))
+# There are no logins: users are told apart by the X-User header or this
+# cookie (set by opening any page with ?user=<name>). Requests without a
+# user read and change the global settings and the 'default' user's progress
+USER_COOKIE = 'manga_user'
+USER_NAME = re.compile(r'^[\w.@-]{1,64}$')
+# Largest page /api/library returns for ?limit=
+LIBRARY_PAGE_MAX = 500
+# Most chapter manifests /api/chapters returns in one response
+CHAPTER_BATCH_MAX = 10
+# /api/library ?sort= keys and their default order (descending or not)
+LIBRARY_SORTS = {
+    'name': (lambda s: s['name'], False),
+    'chapters': (lambda s: s['chapter_count'], True),
+    'added': (lambda s: s['added_at'], True),
+}
 
 # Initialize components
-scanner = LibraryScanner(MANGA_ROOT)
+# Every process (server workers, analysis pool) shares its metrics through here
+metrics.configure('data/metrics')
+# Shared so each CBZ/ZIP central directory is parsed once
+archive_reader = ArchiveReader()
+library_index = LibraryIndex(MANGA_ROOT, refresh_interval=LIBRARY_REFRESH_INTERVAL,
+                             archive_reader=archive_reader, scan_workers=LIBRARY_SCAN_WORKERS)
+analysis_cache = AnalysisCache(archive_reader=archive_reader)
+library_watcher = LibraryWatcher(MANGA_ROOT, library_index, mode=LIBRARY_WATCH,
+                                 poll_interval=LIBRARY_POLL_INTERVAL)
 metadata_manager = MetadataManager()
-reader = ChapterReader(MANGA_ROOT)
-cover_selector = CoverSelector(MANGA_ROOT)
+search_index = SearchIndex(library_index, metadata_manager)
+reader = ChapterReader(MANGA_ROOT, library_index, analysis_cache, pairing_batch=PAIRING_BATCH)
+analysis_worker = AnalysisWorker(MANGA_ROOT, library_index, analysis_cache,
+                                 workers=ANALYSIS_WORKERS, queue_size=ANALYSIS_QUEUE_SIZE,
+                                 pairing_batch=PAIRING_BATCH)
+cover_selector = CoverSelector(MANGA_ROOT, analysis_cache, scanner=library_index.scanner,
+                               library_index=library_index)
 settings_manager = SettingsManager()
+user_store = UserStore(flush_interval=PROGRESS_FLUSH_INTERVAL)
+thumbnail_cache = ImageCache('data/thumbnails', max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024,
+                             workers=TRANSCODE_WORKERS, archive_reader=archive_reader)
+derivative_cache = ImageCache('data/derivatives', max_bytes=DERIVATIVE_CACHE_MB * 1024 * 1024,
+                              workers=TRANSCODE_WORKERS, archive_reader=archive_reader)
+
+_background_lock = None
+
+def start_background(shared=False):
+    """
+    Start the library scan, watcher and analysis pool without blocking startup
+    With several server processes (shared=True) only the first to take
+    BACKGROUND_LOCK runs them; the others follow the shared index
+    Returns True if this process runs the background work
+    """
+    global _background_lock
+    lock_file = open(BACKGROUND_LOCK, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        # Another process keeps the index current; pick up its changes on requests
+        library_index.watched = True
+        # ... and runs the analysis pool: hand analysis to it instead of doing it inline
+        analysis_worker.remote = analysis_worker.workers > 0
+        if WARMUP:
+            threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+        return False
+    # Kept open for the life of the process, and the lock with it
+    _background_lock = lock_file
+    metrics.remove_stale()
+    
+    # The analysis pool forks, so it has to start before any other thread
+    analysis_worker.start()
+    if LIBRARY_WATCH != 'off':
+        library_watcher.start()
+    elif shared:
+        # Other processes never refresh themselves: poll at the request-path interval
+        library_watcher.mode = 'poll'
+        library_watcher.poll_interval = LIBRARY_REFRESH_INTERVAL
+        library_watcher.start()
+    # Requests are served from the existing index while the library is scanned
+    threading.Thread(target=refresh_library, name='library-refresh', daemon=True).start()
+    return True
+
+def refresh_library():
+    """Bring the index up to date with the disk, then warm up on the result"""
+    library_index.refresh()
+    if WARMUP:
+        warm_up(covers=True)
+
+def warm_up(covers=False):
+    """
+    Do the work the first requests would otherwise wait for: read every
+    series and chapter order from the index, build the search index and
+    compile the templates
+    With covers=True also select smart covers that aren't cached yet (on
+    the analysis pool when it runs, else here)
+    """
+    with metrics.timer('manga_warmup_seconds'):
+        for template in ('index.html', 'series.html', 'reader.html'):
+            app.jinja_env.get_template(template)
+        library = library_index.get_library()
+        for series_info in library:
+            library_index.get_chapter_order(series_info['name'])
+        search_index.ensure_built()
+        if not covers:
+            return
+        for series_info in library:
+            meta = metadata_manager.get_metadata(series_info['name'])
+            if meta:
+                series_info.update(meta)
+            try:
+                apply_cover(series_info, verify=False)
+            except Exception as e:
+                print(f"Warning: Could not select cover for {series_info['name']}: {e}")
+
+def stop_background():
+    """
+    Stop the watcher and analysis pool and write batched metadata/settings
+    edits (e.g. when a server worker exits)
+    """
+    library_watcher.stop()
+    analysis_worker.stop()
+    metadata_manager.flush()
+    settings_manager.flush()
+    user_store.flush()
+
+@app.before_request
+def sync_shared_state():
+    """Pick up metadata and settings saved by other server processes (a stat each per API call)"""
+    if request.path.startswith('/api/'):
+        metadata_manager.sync()
+        settings_manager.sync()
+
+# One profiled request at a time: profilers can't nest across threads
+_profile_lock = threading.Lock()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if REQUEST_PROFILING and 'X-Profile' in request.headers and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request(response):
+    """Observe request latency; finish (and dump, if slow) a profiled request"""
+    elapsed = time.perf_counter() - g.request_start
+    metrics.observe('manga_http_request_seconds', elapsed, endpoint=request.endpoint or 'unmatched')
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+        response.headers['X-Profile-Time'] = f"{elapsed * 1000:.1f}ms"
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            dump_profile(profiler, elapsed)
+    return response
+
+@app.teardown_request
+def release_profiler(exc):
+    # after_request is skipped when a view raises
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+def dump_profile(profiler, elapsed):
+    """Print a cProfile summary of a slow request and keep the raw profile"""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{elapsed * 1000:.0f}ms.prof"
+    profiler.dump_stats(PROFILE_DIR / name)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(25)
+    print(f"Slow request {request.method} {request.full_path} took {elapsed * 1000:.0f} ms "
+          f"(profile: {PROFILE_DIR / name})\n{summary.getvalue()}")
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics, merged across server and analysis processes"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/')
 def index():
@@ -35,53 +275,187 @@ def index():
 
 @app.route('/api/library')
 def get_library():
-    """Get all series in library"""
-    series_list = scanner.scan_library()
-    # Enhance with metadata and smart covers
+    """
+    Get series in library
+    ?offset=&limit= return one page (the full count is in X-Total-Count),
+    ?sort=name|chapters|added|relevance with ?order=asc|desc orders the series
+    (relevance, the default with ?q=, ranks by search score),
+    ?q= filters with the search index and ?fields=name,cover,... keeps only
+    those keys per series (e.g. to leave out the chapter list)
+    """
+    library_index.ensure_fresh()
+    etag = library_etag(query=request.query_string)
+    if not is_resource_modified(request.environ, etag=etag):
+        return not_modified(etag)
+    
+    query = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'relevance' if query else 'name')
+    if sort == 'relevance' and not query:
+        sort = 'name'
+    if sort not in LIBRARY_SORTS and sort != 'relevance':
+        return jsonify({'error': f'Unsupported sort: {sort}'}), 400
+    sort_key, descending = LIBRARY_SORTS.get(sort, (None, False))
+    if 'order' in request.args:
+        descending = request.args['order'] == 'desc'
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = min(max(limit, 0), LIBRARY_PAGE_MAX)
+    fields = request.args.get('fields')
+    
+    summaries = library_index.get_series_summaries()
+    if query:
+        # Search results come ranked best first
+        rank = {m[0]: i for i, m in enumerate(search_index.search(query, limit=None))}
+        summaries = [s for s in summaries if s['name'] in rank]
+        if sort == 'relevance':
+            sort_key = lambda s: rank[s['name']]
+    # Name first so ties keep a stable alphabetical order
+    summaries.sort(key=lambda s: s['name'])
+    if sort != 'name' or descending:
+        summaries.sort(key=sort_key, reverse=descending)
+    page = summaries[offset:offset + limit if limit is not None else None]
+    
+    # Only the requested page gets chapter lists, metadata and covers
+    series_list = library_index.get_library_page(s['name'] for s in page)
     for series in series_list:
         meta = metadata_manager.get_metadata(series['name'])
         if meta:
             series.update(meta)
-        # Get smart cover if no custom cover set
-        if not series.get('cover') or not series.get('custom_cover'):
-            smart_cover = cover_selector.get_best_cover(series['name'])
-            if smart_cover:
-                series['cover'] = smart_cover
-    return jsonify(series_list)
+        apply_cover(series, verify=False)
+    if fields:
+        keep = set(fields.split(','))
+        series_list = [{k: v for k, v in series.items() if k in keep} for series in series_list]
+    
+    # Covers selected inline above change the state the ETag is built from
+    response = json_response(series_list, library_etag(query=request.query_string))
+    response.headers['X-Total-Count'] = str(len(summaries))
+    return response
 
 @app.route('/api/series/<path:series_name>')
 def get_series(series_name):
     """Get details for a specific series"""
-    series_info = scanner.get_series_info(series_name)
+    library_index.ensure_fresh()
+    series_info = library_index.get_series_info(series_name)
     if series_info:
+        etag = library_etag(series_name)
+        if not is_resource_modified(request.environ, etag=etag):
+            return not_modified(etag)
+        
+        analysis_worker.prioritize_series(series_name)
         meta = metadata_manager.get_metadata(series_name)
         if meta:
             series_info.update(meta)
-        # Get smart cover
-        if not series_info.get('cover') or not series_info.get('custom_cover'):
-            smart_cover = cover_selector.get_best_cover(series_name)
-            if smart_cover:
-                series_info['cover'] = smart_cover
+        apply_cover(series_info, verify=True)
         # Format series name nicely
         series_info['display_name'] = format_series_name(series_name)
-        return jsonify(series_info)
+        return json_response(series_info, library_etag(series_name))
     return jsonify({'error': 'Series not found'}), 404
 
+@app.route('/api/search')
+def search_series():
+    """
+    Search series names, alternate titles, author and genres
+    ?q=<query>&limit=<n>; tolerates typos and matches word prefixes
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), LIBRARY_PAGE_MAX)
+    if not query:
+        return jsonify({'query': query, 'results': []})
+    
+    library_index.ensure_fresh()
+    matches = search_index.search(query, limit=limit)
+    series_by_name = {s['name']: s for s in library_index.get_library_page(m[0] for m in matches)}
+    results = []
+    for series_name, score, field in matches:
+        series = series_by_name.get(series_name)
+        if series is None:
+            continue
+        meta = metadata_manager.get_metadata(series_name)
+        if meta:
+            series.update(meta)
+        apply_cover(series, verify=False)
+        results.append({
+            'name': series_name,
+            'display_name': format_series_name(series_name),
+            'chapter_count': series['chapter_count'],
+            'cover': series['cover'],
+            'score': round(score, 3),
+            'matched': field
+        })
+    return jsonify({'query': query, 'results': results})
+
 @app.route('/api/chapter/<path:series_name>/<chapter_num>')
 def get_chapter(series_name, chapter_num):
     """Get chapter images"""
-    chapter_data = reader.get_chapter_pages(series_name, chapter_num)
+    library_index.ensure_fresh()
+    chapter_name = reader.resolve_chapter(series_name, chapter_num)
+    if chapter_name:
+        etag = chapter_etag(series_name, chapter_name)
+        if not is_resource_modified(request.environ, etag=etag):
+            return not_modified(etag)
+        analysis_worker.prioritize_series(series_name)
+    
+    chapter_data = reader.get_chapter_pages(series_name, chapter_num,
+                                            cached_only=analysis_worker.active)
     if chapter_data:
-        return jsonify(chapter_data)
+        # Pairs computed by this request change the state the ETag is built from
+        return json_response(chapter_data, chapter_etag(series_name, chapter_data['chapter']))
     return jsonify({'error': 'Chapter not found'}), 404
 
+@app.route('/api/chapters/<path:series_name>/<chapter_num>')
+def get_chapter_batch(series_name, chapter_num):
+    """
+    Manifests for ?count=N chapters in reading order starting at chapter_num,
+    for prefetching; built from cached analysis only (see 'pairs_pending')
+    """
+    library_index.ensure_fresh()
+    count = request.args.get('count', 3, type=int)
+    count = min(max(count, 1), CHAPTER_BATCH_MAX)
+    
+    # The ETag comes from the index alone, so revalidations build no manifests
+    names = reader.get_chapter_names(series_name, chapter_num, count)
+    if names is None:
+        return jsonify({'error': 'Chapter not found'}), 404
+    etag = state_etag('chapters', series_name, chapter_num, count,
+                      [chapter_etag(series_name, name) for name in names])
+    if not is_resource_modified(request.environ, etag=etag):
+        return not_modified(etag)
+    
+    manifests = reader.get_chapter_range(series_name, chapter_num, count)
+    if manifests is None:
+        return jsonify({'error': 'Chapter not found'}), 404
+    if any(m.get('pairs_pending') for m in manifests):
+        analysis_worker.prioritize_series(series_name)
+    return json_response({'series_name': series_name, 'chapters': manifests}, etag)
+
 @app.route('/api/image/<path:image_path>')
 def serve_image(image_path):
-    """Serve manga page images"""
-    full_path = Path(MANGA_ROOT) / image_path
-    if full_path.exists() and full_path.is_file():
-        return send_file(full_path)
-    return jsonify({'error': 'Image not found'}), 404
+    """
+    Serve manga page images
+    ?w=<width>&fmt=webp|jpeg returns a downscaled, re-encoded copy
+    Pages of CBZ/ZIP chapters are addressed as series/chapter.cbz/<entry>
+    """
+    resolved = resolve_image_path(image_path)
+    if not resolved:
+        return jsonify({'error': 'Image not found'}), 404
+    full_path, member = resolved
+    
+    if 'w' not in request.args and 'fmt' not in request.args:
+        etag, last_modified = image_validators(full_path, member)
+        return (image_not_modified(etag, last_modified)
+                or send_image(full_path, etag, last_modified, member=member))
+    
+    return serve_resized(full_path, member, derivative_cache, READER_WIDTHS, READER_WIDTHS[-1])
+
+@app.route('/api/thumbnail/<path:image_path>')
+def serve_thumbnail(image_path):
+    """Serve a resized cover/page thumbnail (?w=<width>&fmt=webp|jpeg)"""
+    resolved = resolve_image_path(image_path)
+    if not resolved:
+        return jsonify({'error': 'Image not found'}), 404
+    full_path, member = resolved
+    return serve_resized(full_path, member, thumbnail_cache, THUMBNAIL_WIDTHS, THUMBNAIL_WIDTHS[1])
 
 @app.route('/series/<path:series_name>')
 def series_view(series_name):
@@ -97,13 +471,340 @@ def reader_view(series_name, chapter_num):
 
 @app.route('/api/settings', methods=['GET', 'POST'])
 def handle_settings():
-    """Get or update settings"""
+    """Get or update settings (the user's own, over the global defaults, when there is a user)"""
+    user = current_user()
+    if request.method == 'POST':
+        settings_dict = request.get_json(silent=True)
+        if not isinstance(settings_dict, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        if user:
+            user_store.update_settings(user, {key: value for key, value in settings_dict.items()
+                                              if key in settings_manager.default_settings})
+        else:
+            settings_manager.update_settings(settings_dict)
+    
+    settings = settings_manager.get_all_settings()
+    if user:
+        settings.update(user_store.get_settings(user))
     if request.method == 'GET':
-        return jsonify(settings_manager.get_all_settings())
-    elif request.method == 'POST':
-        settings_dict = request.get_json()
-        settings_manager.update_settings(settings_dict)
-        return jsonify({'success': True, 'settings': settings_manager.get_all_settings()})
+        return jsonify(settings)
+    return jsonify({'success': True, 'settings': settings})
+
+@app.route('/api/progress', methods=['POST'])
+def record_progress():
+    """
+    Remember where the user is: {"series": ..., "chapter": ..., "page": n, "page_count": n}
+    Sent on page turns; positions are written in batches
+    """
+    data = request.get_json(silent=True) or {}
+    series_name, chapter_name, page = data.get('series'), data.get('chapter'), data.get('page')
+    page_count = data.get('page_count')
+    if (not isinstance(series_name, str) or not isinstance(chapter_name, str)
+            or not isinstance(page, int) or page < 1
+            or (page_count is not None and not isinstance(page_count, int))):
+        return jsonify({'error': 'Expected series, chapter and page'}), 400
+    if library_index.get_chapter_order(series_name).index_of(chapter_name) is None:
+        return jsonify({'error': 'Chapter not found'}), 404
+    user_store.record_progress(current_user() or 'default', series_name, chapter_name, page, page_count)
+    return '', 204
+
+@app.route('/api/progress/<path:series_name>')
+def get_progress(series_name):
+    """The user's last position in a series"""
+    progress = user_store.get_progress(current_user() or 'default', series_name)
+    if progress is None:
+        return jsonify({'error': 'Not started'}), 404
+    return jsonify(with_resume_point(progress))
+
+@app.route('/api/continue')
+def continue_reading():
+    """The user's most recently read series (?limit=, default 10) with where to resume"""
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    recent = user_store.recent(current_user() or 'default', limit)
+    series = {s['name']: s for s in library_index.get_library_page(p['series'] for p in recent)}
+    results = []
+    for progress in recent:
+        series_info = series.get(progress['series'])
+        if series_info is None:
+            continue
+        meta = metadata_manager.get_metadata(series_info['name'])
+        if meta:
+            series_info.update(meta)
+        apply_cover(series_info, verify=False)
+        results.append({**with_resume_point(progress),
+                        'display_name': format_series_name(series_info['name']),
+                        'cover': series_info['cover'],
+                        'chapter_count': series_info['chapter_count']})
+    return jsonify(results)
+
+def current_user():
+    """The requesting user's name, or None"""
+    name = request.headers.get('X-User') or request.cookies.get(USER_COOKIE)
+    if name and USER_NAME.match(name):
+        return name
+    return None
+
+@app.after_request
+def remember_user(response):
+    """Pages opened with ?user=<name> set the user cookie"""
+    name = request.args.get('user')
+    if name and USER_NAME.match(name) and not request.path.startswith('/api/'):
+        response.set_cookie(USER_COOKIE, name, max_age=10 * 365 * 86400, samesite='Lax')
+    return response
+
+def with_resume_point(progress):
+    """
+    Add resume_chapter/resume_page: the saved position, or the start of the
+    next chapter once the saved chapter was read to the end
+    """
+    resume_chapter, resume_page = progress['chapter'], progress['page']
+    chapter_finished = bool(progress['page_count']) and progress['page'] >= progress['page_count']
+    if chapter_finished:
+        next_chapter = library_index.get_chapter_order(progress['series']).neighbours(progress['chapter'])[1]
+        if next_chapter:
+            resume_chapter, resume_page = next_chapter, 1
+    return {**progress, 'chapter_finished': chapter_finished,
+            'resume_chapter': resume_chapter, 'resume_page': resume_page}
+
+@app.route('/api/metadata', methods=['POST'])
+def bulk_update_metadata():
+    """
+    Edit metadata of many series in one write
+    Body: {"<series>": {"author": "...", "genres": [...]}, "<series>": null, ...};
+    fields set to null are removed and null series lose all their metadata
+    """
+    try:
+        updated = metadata_manager.bulk_update(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'updated': updated})
+
+def apply_cover(series_info, verify):
+    """
+    Set series_info['cover'] to the custom cover, else the smart cover
+    With verify=False only already-cached smart covers are used; misses are
+    queued for the background worker and keep the first-page cover meanwhile
+    While the analysis pool runs (in this process or another) covers are
+    never selected inline, verified or not
+    """
+    if series_info.get('custom_cover'):
+        series_info['cover'] = series_info['custom_cover']
+        return
+    
+    series_name = series_info['name']
+    first_chapter = series_info['chapters'][0]
+    if verify:
+        smart_cover = cover_selector.get_cover(series_name, first_chapter,
+                                               cached_only=analysis_worker.active)
+    else:
+        smart_cover = cover_selector.get_cached_cover(series_name, first_chapter)
+    if smart_cover is None:
+        if analysis_worker.active:
+            analysis_worker.submit_cover(series_name)
+        elif not verify:
+            smart_cover = cover_selector.get_cover(series_name, first_chapter)
+    if smart_cover:
+        series_info['cover'] = smart_cover
+
+def serve_resized(full_path, member, cache, widths, default_width):
+    """Serve a cached derivative of full_path (or its archive member) at one of the allowed widths"""
+    requested = request.args.get('w', default_width, type=int)
+    width = next((w for w in widths if w >= requested), widths[-1])
+    fmt = request.args.get('fmt') or preferred_format()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in ImageCache.FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    # Validators come from the source page, so a 304 skips transcoding
+    etag, last_modified = image_validators(full_path, member, variant=f"-{width}{fmt}")
+    response = image_not_modified(etag, last_modified)
+    if response is None:
+        try:
+            resized_path = cache.get_resized(full_path, width, fmt, member=member)
+        except Exception as e:
+            print(f"Warning: Could not resize {full_path}: {e}")
+            etag, last_modified = image_validators(full_path, member)
+            return send_image(full_path, etag, last_modified, member=member)
+        response = send_image(resized_path, etag, last_modified, mimetype=cache.mimetype(fmt))
+    if 'fmt' not in request.args:
+        response.vary.add('Accept')
+    return response
+
+def image_validators(path, member=None, variant=''):
+    """
+    Strong ETag (size + mtime, plus variant for derivatives) and Last-Modified
+    Archive members add the entry's CRC, so they only change with their own bytes
+    """
+    st = path.stat()
+    etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    if member is not None:
+        etag += f"-{archive_reader.get_info(path, member).CRC:x}"
+    return etag + variant, datetime.fromtimestamp(st.st_mtime, timezone.utc)
+
+def image_not_modified(etag, last_modified):
+    """304 response if the client's copy is current (no file is opened), else None"""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return not_modified(etag, max_age=IMAGE_MAX_AGE, last_modified=last_modified)
+
+def send_image(full_path, etag, last_modified, mimetype=None, member=None):
+    """
+    Send an image with its validators and a long-lived Cache-Control
+    Single byte ranges are honoured; files and stored archive members go out
+    as a file window the WSGI server can sendfile(), or via the reverse proxy
+    Compressed archive members are streamed whole from the archive
+    """
+    mimetype = mimetype or mimetypes.guess_type(member or full_path.name)[0]
+    if member is None and IMAGE_DELIVERY != 'direct':
+        response = proxy_image(full_path, mimetype, etag, last_modified)
+    else:
+        response = stream_image(full_path, mimetype, etag, last_modified, member)
+    if response.status_code == 416:
+        return response
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    return response
+
+def stream_image(full_path, mimetype, etag, last_modified, member=None):
+    """Response streaming a file or archive member, honouring a single Range"""
+    if member is None:
+        extent = (0, full_path.stat().st_size)
+    else:
+        extent = archive_reader.stored_extent(full_path, member)
+    if extent is None:
+        # Compressed entries can't be windowed, so ranges are ignored (allowed by RFC 9110)
+        metrics.inc('manga_images_served_total', delivery='decompressed')
+        size = archive_reader.get_info(full_path, member).file_size
+        response = Response(wrap_file(request.environ, archive_reader.open(full_path, member)),
+                            mimetype=mimetype, direct_passthrough=True)
+        response.content_length = size
+        return response
+    
+    offset, size = extent
+    status, start, stop = 200, 0, size
+    byte_range = requested_range(size, etag, last_modified)
+    if byte_range is False:
+        response = Response(status=416)
+        response.content_range = ContentRange('bytes', None, None, size)
+        return response
+    if byte_range is not None:
+        status, (start, stop) = 206, byte_range
+    
+    metrics.inc('manga_images_served_total', delivery='direct')
+    stream = FileRangeReader(full_path, offset + start, stop - start)
+    response = Response(wrap_file(request.environ, stream), status=status,
+                        mimetype=mimetype, direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, stop, size)
+    return response
+
+def requested_range(size, etag, last_modified):
+    """
+    (start, stop) of a satisfiable single-range request, None to send the
+    whole body, or False if the range can't be satisfied (416)
+    """
+    header = request.range
+    if header is None or len(header.ranges) != 1:
+        return None
+    # If-Range: only send part of the image if it's still the version the client has
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None and if_range.date != last_modified.replace(microsecond=0):
+        return None
+    byte_range = header.range_for_length(size)
+    return False if byte_range is None else byte_range
+
+def proxy_image(full_path, mimetype, etag, last_modified):
+    """Empty response telling the reverse proxy which file to send"""
+    metrics.inc('manga_images_served_total', delivery=IMAGE_DELIVERY)
+    response = Response(mimetype=mimetype)
+    if IMAGE_DELIVERY == 'x-sendfile':
+        response.headers['X-Sendfile'] = str(full_path.resolve())
+        return response
+    resolved = full_path.resolve()
+    for name, root in ACCEL_ROOTS.items():
+        if root in resolved.parents:
+            relative = resolved.relative_to(root).as_posix()
+            response.headers['X-Accel-Redirect'] = f"{IMAGE_ACCEL_PREFIX}/{name}/{quote(relative)}"
+            return response
+    # Outside the mapped roots (shouldn't happen): send it ourselves
+    return stream_image(full_path, mimetype, etag, last_modified)
+
+def state_etag(*state):
+    """ETag for a JSON response built from the state it was derived from"""
+    return hashlib.sha1(repr(state).encode('utf-8')).hexdigest()
+
+def library_etag(series_name=None, query=b''):
+    """ETag for library/series responses: index, metadata and cover state"""
+    return state_etag('library', series_name, query, library_index.get_generation(),
+                      metadata_manager.revision, analysis_cache.covers_state())
+
+def chapter_etag(series_name, chapter_name):
+    """
+    ETag for a chapter response: index state, when its pairs were stored and
+    whether its page sizes are (both are filled in without a new generation)
+    """
+    return state_etag('chapter', series_name, chapter_name, library_index.get_generation(),
+                      analysis_cache.get_updated_at(f"{series_name}/{chapter_name}"),
+                      library_index.has_page_sizes(series_name, chapter_name))
+
+def json_response(payload, etag):
+    """JSON response that browsers must revalidate with If-None-Match"""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def not_modified(etag, max_age=None, last_modified=None):
+    response = Response(status=304)
+    response.set_etag(etag)
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+def resolve_image_path(image_path):
+    """
+    Resolve a library-relative image path, refusing anything outside MANGA_ROOT
+    Returns (path, member) where member is the entry name for a page inside a
+    CBZ/ZIP chapter (path is then the archive) and None otherwise, or None if
+    there is no such image
+    """
+    root = Path(os.path.abspath(MANGA_ROOT))
+    # Lexical check so symlinked series directories keep working
+    full_path = Path(os.path.normpath(root / image_path))
+    if root not in full_path.parents:
+        return None
+    if full_path.is_file():
+        return full_path, None
+    
+    # series/chapter.cbz/<entry>: find the archive component
+    parts = full_path.relative_to(root).parts
+    for i in range(1, len(parts)):
+        archive_path = root.joinpath(*parts[:i])
+        if is_archive(archive_path) and archive_path.is_file():
+            member = '/'.join(parts[i:])
+            try:
+                if archive_reader.get_info(archive_path, member) is not None:
+                    return archive_path, member
+            except (OSError, zipfile.BadZipFile):
+                pass
+            break
+    return None
+
+def preferred_format():
+    """WebP for browsers that accept it, JPEG otherwise"""
+    return 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
 
 def format_series_name(name):
     """Format series name from filepath"""
@@ -112,4 +813,8 @@ def format_series_name(name):
 if __name__ == '__main__':
     print(f"Starting Manga Server...")
     print(f"Manga root directory: {MANGA_ROOT}")
+    print("Development server; for production run: gunicorn -c gunicorn.conf.py app:app")
+    # Only the reloader child serves requests; don't start a pool in the watcher
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
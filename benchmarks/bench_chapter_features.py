@@ -0,0 +1,84 @@
+"""
+Chapter Features Benchmark - MangaPagePairer per-page vs batch extraction
+Generates a synthetic library and reports per-page extraction time for the
+original one-page-at-a-time path and the ChapterFeatures batch path (on one
+and on several decode threads), plus how closely the batch features and
+the resulting page pairs agree with the per-page path
+
+Synthetic pages carry little left/right white-space signal, so a few
+chapters can pair differently when their most "confident" page is a
+near-tie; real chapters give clearer margins
+
+Usage: python benchmarks/bench_chapter_features.py [--chapters N] [--pages N]
+       [--workers N] [--library DIR]
+"""
+
+from pathlib import Path
+import argparse
+import os
+import tempfile
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic_library import generate_library, load_manifest
+from scripts.chapter_features import FEATURES
+from scripts.page_pairer import MangaPagePairer
+
+def list_chapters(library):
+    return [chapter for series in sorted(Path(library).iterdir()) if series.is_dir()
+            for chapter in sorted(series.iterdir())]
+
+def run(chapters, **pairer_options):
+    """(seconds, pages, [(pairs, features)] per chapter) for one extraction path"""
+    results = []
+    pages = 0
+    start = time.perf_counter()
+    for chapter in chapters:
+        pairer = MangaPagePairer(str(chapter), **pairer_options)
+        results.append((pairer.pair_pages(), pairer.get_page_features()))
+        pages += len(pairer.image_files)
+    return time.perf_counter() - start, pages, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=24)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='decode threads for the threaded batch run')
+    parser.add_argument('--library', help='existing library to use (generated if missing)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        library = Path(args.library) if args.library else Path(tmp) / 'manga'
+        if load_manifest(library) is None:
+            generate_library(library, series=max(args.chapters // 5, 1), chapters=5,
+                             pages=args.pages, spreads=0.08, fillers=0.05, archives=0.3)
+        chapters = list_chapters(library)[:args.chapters]
+
+        # Untimed pass so every run reads from the page cache
+        run(chapters[:2])
+        baseline_time, pages, baseline = run(chapters, batch=False)
+        print(f"{len(chapters)} chapters, {pages} pages")
+        print(f"{'per-page':<22}{baseline_time / pages * 1000:8.2f} ms/page")
+
+        runs = [('batch, 1 thread', 1)]
+        if args.workers > 1:
+            runs.append((f'batch, {args.workers} threads', args.workers))
+        for label, workers in runs:
+            elapsed, _, results = run(chapters, batch=True, workers=workers)
+            same = sum(a[0] == b[0] for a, b in zip(baseline, results))
+            deviation = {name: 0.0 for name in FEATURES}
+            for (_, features_a), (_, features_b) in zip(baseline, results):
+                for page_a, page_b in zip(features_a, features_b):
+                    if page_a is None or page_b is None:
+                        continue
+                    for name in FEATURES:
+                        deviation[name] = max(deviation[name], abs(page_a[name] - page_b[name]))
+            print(f"{label:<22}{elapsed / pages * 1000:8.2f} ms/page  "
+                  f"{baseline_time / elapsed:5.2f}x  same pairs {same}/{len(chapters)}  "
+                  f"max deviation " + ', '.join(f"{k} {v:.3f}" for k, v in deviation.items()))
+
+if __name__ == '__main__':
+    main()
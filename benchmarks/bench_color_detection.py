@@ -0,0 +1,90 @@
+"""
+Color Detection Benchmark - CoverSelector._is_color_image before/after
+Generates synthetic color and grayscale pages and reports per-image time
+for the legacy pure-Python check and the current NumPy implementation
+
+Usage: python benchmarks/bench_color_detection.py [--pages N] [--width W] [--height H]
+"""
+
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from scripts.cover_selector import CoverSelector
+
+def legacy_is_color_image(image_path):
+    """The original implementation, kept here as the baseline"""
+    with Image.open(image_path) as img:
+        if img.mode not in ('RGB', 'RGBA'):
+            if img.mode == 'L' or img.mode == '1':
+                return False
+            img = img.convert('RGB')
+        img_small = img.resize((100, 100), Image.LANCZOS)
+        pixels = list(img_small.getdata())
+        color_pixels = 0
+        total_checked = 0
+        for pixel in pixels[:1000]:
+            total_checked += 1
+            if len(pixel) >= 3:
+                r, g, b = pixel[0], pixel[1], pixel[2]
+                if max(abs(r - g), abs(g - b), abs(r - b)) > 15:
+                    color_pixels += 1
+        return (color_pixels / total_checked) * 100 > 5.0
+
+def generate_corpus(directory, pages, width, height):
+    """Write alternating color / grayscale-in-RGB JPEG pages"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(pages):
+        # Smooth low-frequency blobs compress like real artwork, unlike pure noise
+        if i % 2 == 0:
+            blobs = rng.integers(0, 256, (24, 16, 3), dtype=np.uint8)
+        else:
+            gray = rng.integers(0, 256, (24, 16), dtype=np.uint8)
+            # Saved as RGB so the mode check can't short-circuit it
+            blobs = np.stack([gray] * 3, axis=-1)
+        page = Image.fromarray(blobs).resize((width, height), Image.BILINEAR)
+        path = Path(directory) / f"{i:03d}.jpg"
+        page.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def time_per_image(func, paths, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            func(path)
+        best = min(best, time.perf_counter() - start)
+    return best / len(paths)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=2400)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_corpus(tmp, args.pages, args.width, args.height)
+        selector = CoverSelector(tmp)
+
+        agree = sum(legacy_is_color_image(p) == selector._is_color_image(p) for p in paths)
+        legacy = time_per_image(legacy_is_color_image, paths, args.repeat)
+        current = time_per_image(selector._is_color_image, paths, args.repeat)
+
+    print(f"pages: {args.pages} ({args.width}x{args.height} JPEG, half color)")
+    print(f"legacy:    {legacy * 1000:8.2f} ms/image")
+    print(f"vectorized:{current * 1000:8.2f} ms/image")
+    print(f"speedup:   {legacy / current:8.1f}x")
+    print(f"agreement: {agree}/{len(paths)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Library Scan Benchmark - LibraryScanner before/after
+Generates a synthetic series/chapter tree (100k chapters by default) and
+reports filesystem syscalls and wall time for the legacy pathlib scanner,
+the scandir scanner (sequential and threaded) and a no-change index refresh
+
+Syscalls are counted by wrapping os.stat/lstat/scandir/listdir, which is
+everything pathlib and the scanners call; DirEntry type checks are free on
+filesystems that report d_type. --latency adds a delay to every counted call
+to mimic a network mount (NFS/SMB), where the threaded scan pays off
+
+Usage: python benchmarks/bench_library_scan.py [--series N] [--chapters N]
+       [--pages N] [--workers N] [--latency MS] [--root DIR]
+"""
+
+from pathlib import Path
+import argparse
+import os
+import re
+import tempfile
+import threading
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from scripts.library_scanner import LibraryScanner
+from scripts.library_index import LibraryIndex
+
+COUNTED = ('stat', 'lstat', 'scandir', 'listdir')
+
+class LegacyScanner:
+    """The original pathlib scanner, kept here as the baseline"""
+    def __init__(self, manga_root):
+        self.manga_root = Path(manga_root)
+        self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+    def scan_library(self):
+        series_list = []
+        for series_dir in sorted(self.manga_root.iterdir()):
+            if series_dir.is_dir():
+                series_info = self._get_series_basic_info(series_dir)
+                if series_info:
+                    series_list.append(series_info)
+        return series_list
+
+    def _get_series_basic_info(self, series_path):
+        chapters = self._get_chapters(series_path)
+        if not chapters:
+            return None
+        pages = self._get_chapter_pages(series_path / chapters[0])
+        cover_path = str(Path(series_path.name) / chapters[0] / pages[0]) if pages else None
+        return {'name': series_path.name, 'chapter_count': len(chapters),
+                'chapters': chapters, 'cover': cover_path}
+
+    def _get_chapters(self, series_path):
+        chapters = []
+        for chapter_dir in series_path.iterdir():
+            if chapter_dir.is_dir() and self._has_images(chapter_dir):
+                chapters.append(chapter_dir.name)
+        return sorted(chapters, key=self._extract_chapter_number)
+
+    def _has_images(self, directory):
+        for file in directory.iterdir():
+            if file.is_file() and file.suffix.lower() in self.image_extensions:
+                return True
+        return False
+
+    def _get_chapter_pages(self, chapter_path):
+        pages = []
+        for file in chapter_path.iterdir():
+            if file.is_file() and file.suffix.lower() in self.image_extensions:
+                pages.append(file.name)
+        return sorted(pages, key=self._natural_sort_key)
+
+    def _extract_chapter_number(self, chapter_name):
+        match = re.search(r'(\d+(?:\.\d+)?)', chapter_name)
+        return float(match.group(1)) if match else 0
+
+    def _natural_sort_key(self, filename):
+        return [int(text) if text.isdigit() else text.lower()
+                for text in re.split(r'(\d+)', filename)]
+
+class SyscallCounter:
+    """Counts (and optionally delays) filesystem calls made through the os module"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.counts = dict.fromkeys(COUNTED, 0)
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def __enter__(self):
+        for name in COUNTED:
+            original = getattr(os, name)
+            self._originals[name] = original
+            setattr(os, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+
+    def _wrap(self, name, original):
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.counts[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return original(*args, **kwargs)
+        return counted
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+def generate_tree(root, series, chapters, pages):
+    """Write series-N/chapter-N/NN.jpg (empty files: only listings are measured)"""
+    for s in range(series):
+        for c in range(1, chapters + 1):
+            chapter_dir = Path(root) / f"series-{s:05d}" / f"chapter-{c}"
+            chapter_dir.mkdir(parents=True)
+            for p in range(1, pages + 1):
+                (chapter_dir / f"{p:02d}.jpg").touch()
+
+def measure(label, func, latency):
+    with SyscallCounter(latency) as counter:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    detail = ', '.join(f"{name} {count}" for name, count in counter.counts.items() if count)
+    print(f"{label:<24}{elapsed:9.2f} s {counter.total:10d} syscalls  ({detail})")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--series', type=int, default=1000)
+    parser.add_argument('--chapters', type=int, default=100, help='chapters per series')
+    parser.add_argument('--pages', type=int, default=3, help='pages per chapter')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='ms added per syscall')
+    parser.add_argument('--root', help='reuse/create the tree here instead of a temp dir')
+    args = parser.parse_args()
+    latency = args.latency / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(args.root or Path(tmp) / 'manga')
+        if not root.exists():
+            start = time.perf_counter()
+            generate_tree(root, args.series, args.chapters, args.pages)
+            print(f"generated {args.series * args.chapters} chapters in "
+                  f"{time.perf_counter() - start:.1f} s")
+
+        print(f"tree: {root} (latency {args.latency:g} ms/syscall)")
+        legacy = measure('legacy pathlib', LegacyScanner(root).scan_library, latency)
+        sequential = measure('scandir, 1 thread', LibraryScanner(root, workers=1).scan_library, latency)
+        threaded = measure(f"scandir, {args.workers} threads",
+                           LibraryScanner(root, workers=args.workers).scan_library, latency)
+
+        index = LibraryIndex(root, db_file=Path(tmp) / 'library.db', scan_workers=args.workers)
+        measure('index: initial refresh', index.refresh, latency)
+        measure('index: no-change refresh', index.refresh, latency)
+
+    same = legacy == sequential == threaded
+    print(f"results identical: {same}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Load Test - Requests/sec against a running server
+Hits the image and chapter endpoints with concurrent clients and reports
+throughput and latency percentiles per endpoint, e.g. to compare the
+development server (python app.py) with gunicorn -c gunicorn.conf.py app:app
+
+Targets are discovered from /api/library; --mixed runs both endpoints at
+once to show whether image requests queue behind chapter requests
+
+Usage: python benchmarks/load_test.py [--url URL] [--concurrency N]
+       [--duration S] [--series N] [--mixed]
+"""
+
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import urlopen
+import argparse
+import itertools
+import json
+import threading
+import time
+
+def get_json(url):
+    with urlopen(url, timeout=30) as response:
+        return json.load(response)
+
+def discover(base_url, series_limit):
+    """(chapter URLs, image URLs) for the first series_limit series"""
+    library = get_json(f"{base_url}/api/library?limit={series_limit}&fields=name,chapters")
+    chapter_urls, image_urls = [], []
+    for series in library:
+        for chapter in series['chapters'][:5]:
+            url = f"{base_url}/api/chapter/{quote(series['name'])}/{quote(chapter)}"
+            chapter_urls.append(url)
+            if len(image_urls) < 500:
+                pages = get_json(url)['pages']
+                image_urls.extend(f"{base_url}/api/image/{quote(p)}" for p in pages)
+    return chapter_urls, image_urls
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency, size, ok):
+        with self._lock:
+            if ok:
+                self.latencies.append(latency)
+                self.bytes += size
+            else:
+                self.errors += 1
+
+    def report(self, label, elapsed):
+        done = sorted(self.latencies)
+        if not done:
+            print(f"{label:<10} no successful requests ({self.errors} errors)")
+            return
+        pct = lambda p: done[min(int(len(done) * p), len(done) - 1)] * 1000
+        print(f"{label:<10}{len(done) / elapsed:9.1f} req/s  p50 {pct(0.5):7.1f} ms  "
+              f"p95 {pct(0.95):7.1f} ms  p99 {pct(0.99):7.1f} ms  "
+              f"{self.bytes / elapsed / 1e6:7.1f} MB/s  errors {self.errors}")
+
+def client(urls, stats, deadline):
+    for url in urls:
+        if time.monotonic() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            with urlopen(url, timeout=60) as response:
+                size = len(response.read())
+            stats.record(time.perf_counter() - start, size, True)
+        except (HTTPError, URLError, OSError):
+            stats.record(0, 0, False)
+
+def run(label_urls, concurrency, duration):
+    """Run concurrency clients per endpoint for duration seconds"""
+    deadline = time.monotonic() + duration
+    results = []
+    threads = []
+    for label, urls in label_urls:
+        stats = Stats()
+        results.append((label, stats))
+        for i in range(concurrency):
+            # Each client walks the URL list from its own offset, forever
+            offset = (i * len(urls)) // concurrency
+            cycle = itertools.islice(itertools.cycle(urls), offset, None)
+            threads.append(threading.Thread(target=client, args=(cycle, stats, deadline)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for label, stats in results:
+        stats.report(label, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients per endpoint')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per run')
+    parser.add_argument('--series', type=int, default=20, help='series to draw URLs from')
+    parser.add_argument('--mixed', action='store_true',
+                        help='also run image and chapter clients at the same time')
+    args = parser.parse_args()
+    base_url = args.url.rstrip('/')
+
+    chapter_urls, image_urls = discover(base_url, args.series)
+    if not chapter_urls or not image_urls:
+        raise SystemExit("No chapters found; is the library empty?")
+    print(f"{base_url}: {len(chapter_urls)} chapters, {len(image_urls)} images, "
+          f"{args.concurrency} clients, {args.duration:g} s per run")
+
+    run([('image', image_urls)], args.concurrency, args.duration)
+    run([('chapter', chapter_urls)], args.concurrency, args.duration)
+    if args.mixed:
+        print("mixed:")
+        run([('image', image_urls), ('chapter', chapter_urls)], args.concurrency, args.duration)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+Benchmark Suite - Timing and memory of the hot paths on a synthetic library
+Runs each scenario --repeat times (after one untimed warm-up unless it is a
+cold scenario) and reports the median, spread and peak Python allocation
+(tracemalloc, measured in a separate run so it doesn't skew the timings).
+Results go to a JSON file that --compare diffs against an earlier run
+
+Scenarios (cold = nothing cached in data/, warm = caches populated):
+  scan_library           LibraryScanner.scan_library over the whole library
+  index_refresh_cold     LibraryIndex.refresh into an empty database
+  index_refresh_warm     LibraryIndex.refresh with nothing changed on disk
+  pair_pages_cold        MangaPagePairer.pair_pages, decoding every page
+  pair_pages_batch       the same with ChapterFeatures batch extraction (batch=True)
+  pair_pages_features    pair_pages with page features from a previous run
+  pairs_cached           ChapterReader pair lookup served by the AnalysisCache
+  cover_cold             CoverSelector.get_best_cover for every series
+  cover_warm             CoverSelector.get_cover served by the AnalysisCache
+  api_*_cold / api_*     Flask endpoints through the test client, first
+                         request on an empty data/ and then repeated
+
+The operating system's page cache is warm in every scenario (dropping it
+needs root), so "cold" means cold application caches
+
+Usage: python benchmarks/run_benchmarks.py [--library DIR] [--output FILE]
+       [--compare FILE] [--repeat N] [--only NAME,...] [generator options]
+"""
+
+from pathlib import Path
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic_library import add_arguments, generate_library, load_manifest, options_from_args
+from scripts.analysis_cache import AnalysisCache
+from scripts.chapter_archive import ArchiveReader
+from scripts.chapter_reader import ChapterReader
+from scripts.cover_selector import CoverSelector
+from scripts.library_index import LibraryIndex
+from scripts.library_scanner import LibraryScanner
+from scripts.page_pairer import MangaPagePairer
+
+class Suite:
+    def __init__(self, library, work_dir, repeat, only=None):
+        self.library = Path(library)
+        self.work_dir = Path(work_dir)
+        self.repeat = repeat
+        self.only = only
+        self.results = {}
+
+    def _data_dir(self, name):
+        """A fresh, empty data directory for one scenario"""
+        path = self.work_dir / name
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True)
+        return path
+
+    def measure(self, name, func, setup=None, ops=1, warmup=True):
+        """
+        Time func() repeat times; setup() runs untimed before each call
+        (cold scenarios use it to clear state). ops is the number of items
+        each call handles, for per-item times
+        """
+        if self.only and name not in self.only:
+            return
+        setup = setup or (lambda: None)
+        if warmup:
+            setup()
+            func()
+        runs = []
+        for _ in range(self.repeat):
+            setup()
+            gc.collect()
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+
+        setup()
+        gc.collect()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        median = statistics.median(runs)
+        self.results[name] = {
+            'runs_s': [round(r, 6) for r in runs],
+            'median_s': round(median, 6),
+            'min_s': round(min(runs), 6),
+            'max_s': round(max(runs), 6),
+            'stdev_s': round(statistics.stdev(runs), 6) if len(runs) > 1 else 0.0,
+            'ops': ops,
+            'per_op_ms': round(median / ops * 1000, 3) if ops else None,
+            'peak_alloc_bytes': peak,
+        }
+        print(f"{name:<26}{median * 1000:10.1f} ms  ({ops} ops, {median / max(ops, 1) * 1000:8.2f} ms/op, "
+              f"stdev {self.results[name]['stdev_s'] * 1000:.1f} ms, peak {peak / 1e6:.1f} MB)")
+
+    # -------------------------------------------------
+    # Scenarios
+    # -------------------------------------------------
+    def run_library(self):
+        scanner = LibraryScanner(self.library)
+        series_count = len(scanner.list_series())
+        self.measure('scan_library', scanner.scan_library, ops=series_count)
+
+        state = {}
+        def fresh_index():
+            if 'index' in state:
+                state.pop('index').conn.close()
+            data_dir = self._data_dir('index-cold')
+            state['index'] = LibraryIndex(self.library, db_file=data_dir / 'library.db')
+        self.measure('index_refresh_cold', lambda: state['index'].refresh(),
+                     setup=fresh_index, ops=series_count, warmup=False)
+
+        index = LibraryIndex(self.library, db_file=self._data_dir('index-warm') / 'library.db')
+        index.refresh()
+        self.measure('index_refresh_warm', index.refresh, ops=series_count)
+        state.pop('index').conn.close()
+        return index
+
+    def run_pairing(self, index, chapter_limit):
+        chapters = list(index.iter_chapters())[:chapter_limit]
+        paths = [self.library / series / chapter for series, chapter in chapters]
+
+        def pair_all(known=None, batch=False):
+            for path in paths:
+                MangaPagePairer(str(path), known_features=(known or {}).get(path), batch=batch).pair_pages()
+        self.measure('pair_pages_cold', pair_all, ops=len(paths), warmup=False)
+        self.measure('pair_pages_batch', lambda: pair_all(batch=True), ops=len(paths), warmup=False)
+
+        features = {}
+        for path in paths:
+            pairer = MangaPagePairer(str(path))
+            pairer.pair_pages()
+            features[path] = pairer.get_features_by_name()
+        self.measure('pair_pages_features', lambda: pair_all(features), ops=len(paths))
+
+        analysis_cache = AnalysisCache(self._data_dir('pairs') / 'analysis.db',
+                                       archive_reader=ArchiveReader())
+        reader = ChapterReader(self.library, index, analysis_cache)
+        def cached_pairs():
+            for (series, chapter), path in zip(chapters, paths):
+                reader._get_pairs(series, chapter, path,
+                                  index.get_chapter_order(series).mtime_of(chapter))
+        self.measure('pairs_cached', cached_pairs, ops=len(paths))
+
+    def run_covers(self, index):
+        names = series_names(index)
+        selector = CoverSelector(self.library, library_index=index)
+        def select_all():
+            for series in names:
+                selector.get_best_cover(series)
+        self.measure('cover_cold', select_all, ops=len(names), warmup=False)
+
+        cached = CoverSelector(self.library, AnalysisCache(self._data_dir('covers') / 'analysis.db'),
+                               library_index=index)
+        def cached_all():
+            for series in names:
+                cached.get_cover(series, index.get_chapters(series)[0])
+        self.measure('cover_warm', cached_all, ops=len(names))
+
+    def run_api(self, index):
+        """Endpoints through Flask's test client, with app.py's data/ in the work dir"""
+        data_root = self._data_dir('api')
+        os.environ.update({'MANGA_ROOT': str(self.library.resolve()), 'ANALYSIS_WORKERS': '0',
+                           'LIBRARY_WATCH': 'off'})
+        os.chdir(data_root)
+        sys.path.insert(0, str(REPO_ROOT))
+        import app as app_module
+        client = app_module.app.test_client()
+
+        series = series_names(index)[0]
+        chapter = index.get_chapters(series)[0]
+        page = index.get_chapter_pages(series, chapter)[0]
+        endpoints = {
+            'api_library': '/api/library?limit=50',
+            'api_series': f'/api/series/{series}',
+            'api_chapter': f'/api/chapter/{series}/{chapter}',
+            'api_image': f'/api/image/{series}/{chapter}/{page}',
+            'api_image_resized': f'/api/image/{series}/{chapter}/{page}?w=800&fmt=webp',
+        }
+        def get(url):
+            response = client.get(url)
+            response.get_data()
+            if response.status_code != 200:
+                raise RuntimeError(f"{url}: HTTP {response.status_code}")
+            response.close()
+
+        # The first request of each endpoint pays for the index scan, pairing,
+        # covers and derivatives; one sample, as it can't be repeated in-process
+        for name, url in endpoints.items():
+            if self.only and f"{name}_cold" not in self.only:
+                continue
+            start = time.perf_counter()
+            get(url)
+            elapsed = time.perf_counter() - start
+            self.results[f"{name}_cold"] = {'runs_s': [round(elapsed, 6)], 'median_s': round(elapsed, 6),
+                                            'min_s': round(elapsed, 6), 'max_s': round(elapsed, 6),
+                                            'stdev_s': 0.0, 'ops': 1, 'per_op_ms': round(elapsed * 1000, 3),
+                                            'peak_alloc_bytes': None}
+            print(f"{name + '_cold':<26}{elapsed * 1000:10.1f} ms  (first request)")
+        for name, url in endpoints.items():
+            self.measure(name, lambda url=url: [get(url) for _ in range(20)], ops=20)
+        # data/ is removed with the work dir, so don't flush metrics there at exit
+        app_module.metrics.directory = None
+
+def series_names(index):
+    return sorted(summary['name'] for summary in index.get_series_summaries())
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold):
+    """Print per-item median changes per scenario; returns the scenarios slower than threshold"""
+    print(f"\ncompared with {old.get('revision')} ({old.get('timestamp')}):")
+    if old.get('library', {}).get('options') != new['library'].get('options'):
+        print("  warning: generated with different library options; timings may not be comparable")
+    regressions = []
+    for name, result in new['scenarios'].items():
+        before = old['scenarios'].get(name)
+        if before is None:
+            print(f"  {name:<26}      new")
+            continue
+        # Per item, so runs over different chapter counts still compare
+        old_ms, new_ms = before['per_op_ms'], result['per_op_ms']
+        change = (new_ms - old_ms) / old_ms if old_ms else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<26}{old_ms:10.2f} -> {new_ms:10.2f} ms/op ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--library', help='existing library to use (generated if missing)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results JSON to diff against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown (fraction) reported as a regression by --compare')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--pair-chapters', type=int, default=10, help='chapters to pair per run')
+    parser.add_argument('--only', help='comma-separated scenario names')
+    parser.add_argument('--skip-api', action='store_true', help='leave out the Flask endpoints')
+    add_arguments(parser)
+    args = parser.parse_args()
+    output = Path(args.output).resolve()
+    only = set(args.only.split(',')) if args.only else None
+
+    with tempfile.TemporaryDirectory(prefix='manga-bench-') as tmp:
+        library = Path(args.library) if args.library else Path(tmp) / 'manga'
+        manifest = load_manifest(library)
+        if manifest is None:
+            start = time.perf_counter()
+            manifest = generate_library(library, **options_from_args(args))
+            print(f"generated {library} in {time.perf_counter() - start:.1f} s")
+        counts = manifest['counts']
+        print(f"library: {counts['series']} series, {counts['chapters']} chapters, "
+              f"{counts['pages']} pages; {args.repeat} runs per scenario\n")
+
+        suite = Suite(library, Path(tmp) / 'data', args.repeat, only)
+        index = suite.run_library()
+        suite.run_pairing(index, args.pair_chapters)
+        suite.run_covers(index)
+        if not args.skip_api:
+            suite.run_api(index)
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'library': manifest,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'scenarios': suite.results,
+    }
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), results, args.threshold)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} scenario(s) slower than {args.threshold:.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Startup Budget - Import time of the app and cold start to first response
+Measures, in fresh interpreters:
+  import      `python -X importtime -c "import app"`: total, the slowest
+              direct imports, and whether any of the lazily loaded
+              image-analysis modules (OpenCV, NumPy, PIL) were imported
+  first       a server process started on an empty data/ directory, from
+              launch to the first /api/library response
+  restart     the same with the index already built and --cache-files
+              derivatives on disk (an ordinary restart or a new gunicorn
+              worker), median of --runs
+
+Exits non-zero when the import or restart time is over its budget or an
+image-analysis module is imported at startup
+
+Usage: python benchmarks/startup_budget.py [--library DIR] [--runs N]
+       [--cache-files N] [--import-budget-ms MS] [--response-budget-ms MS]
+       [generator options]
+"""
+
+from pathlib import Path
+import argparse
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic_library import add_arguments, generate_library, load_manifest, options_from_args
+
+# Loaded on first use only; importing app must not pull them in
+LAZY_MODULES = ('cv2', 'numpy', 'PIL')
+
+# What a server process runs (the development server in place of gunicorn)
+SERVER = """
+import sys
+import app
+from werkzeug.serving import make_server
+app.start_background()
+make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=True).serve_forever()
+"""
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def child_env(library):
+    env = dict(os.environ, MANGA_ROOT=str(library), PYTHONPATH=str(REPO_ROOT))
+    env.pop('PYTHONPROFILEIMPORTTIME', None)
+    return env
+
+def measure_import(library, work_dir):
+    """(total ms, [(cumulative ms, module)] imported directly by app, lazy modules loaded)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=work_dir, env=child_env(library), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+    total = 0.0
+    direct = []
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, module = int(match[2]) / 1000, len(match[3]), match[4]
+        if module == 'app':
+            total = cumulative
+        elif depth == 3:
+            # Nested one level under app (importtime indents by two per level)
+            direct.append((cumulative, module))
+        if module.split('.')[0] in LAZY_MODULES:
+            loaded.add(module.split('.')[0])
+    return total, sorted(direct, reverse=True), sorted(loaded)
+
+def fill_image_caches(data_dir, files):
+    """Stand-in thumbnails and derivatives, as a server that ran for a while has"""
+    for i in range(files):
+        cache = data_dir / ('thumbnails' if i % 4 == 0 else 'derivatives')
+        path = cache / f"{i % 256:02x}" / f"{i:040x}.webp"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'\0' * 1024)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def measure_first_response(library, work_dir, path, timeout=30):
+    """Milliseconds from launching a server process to its first 200 response for path"""
+    port = free_port()
+    url = f'http://127.0.0.1:{port}{path}'
+    start = time.perf_counter()
+    # Own process group, so the analysis pool goes down with the server
+    server = subprocess.Popen([sys.executable, '-c', SERVER, str(port)], cwd=work_dir,
+                              env=child_env(library), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited:\n{server.stderr.read().decode()[-2000:]}")
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except (ConnectionError, urllib.error.URLError):
+                time.sleep(0.005)
+        raise RuntimeError(f"no response from {url} within {timeout}s")
+    finally:
+        os.killpg(server.pid, signal.SIGKILL)
+        server.wait()
+        server.stderr.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--library', help='existing library to use (generated if missing)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--cache-files', type=int, default=20000,
+                        help='cached thumbnails/derivatives on disk for the restart runs')
+    parser.add_argument('--path', default='/api/library?limit=60&fields=name,cover,chapter_count',
+                        help='request timed for the first response')
+    parser.add_argument('--import-budget-ms', type=float, default=300)
+    parser.add_argument('--response-budget-ms', type=float, default=500)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        library = Path(args.library) if args.library else Path(tmp) / 'manga'
+        if load_manifest(library) is None:
+            generate_library(library, **options_from_args(args))
+        work_dir = Path(tmp) / 'server'
+        work_dir.mkdir()
+
+        first = measure_first_response(library, work_dir, args.path)
+        # Let the first process's scan finish so restarts find a built index
+        subprocess.run([sys.executable, '-c', 'import app; app.library_index.refresh()'],
+                       cwd=work_dir, env=child_env(library), check=True)
+        fill_image_caches(work_dir / 'data', args.cache_files)
+        restarts = [measure_first_response(library, work_dir, args.path) for _ in range(args.runs)]
+        imports = [measure_import(library, work_dir) for _ in range(args.runs)]
+
+    import_ms = statistics.median(total for total, _, _ in imports)
+    restart_ms = statistics.median(restarts)
+    _, direct, loaded = imports[0]
+    print(f"import app      {import_ms:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    for cumulative, module in direct[:8]:
+        print(f"  {module:<28}{cumulative:8.1f} ms")
+    print(f"first response  {first:8.1f} ms  (empty data/)")
+    print(f"restart         {restart_ms:8.1f} ms  (budget {args.response_budget_ms:.0f} ms, "
+          f"min {min(restarts):.1f}, max {max(restarts):.1f})")
+
+    failures = []
+    if loaded:
+        failures.append(f"imported at startup: {', '.join(loaded)}")
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import time {import_ms:.0f} ms over budget")
+    if restart_ms > args.response_budget_ms:
+        failures.append(f"first response {restart_ms:.0f} ms over budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
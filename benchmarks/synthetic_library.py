@@ -0,0 +1,188 @@
+"""
+Synthetic Library - Generates manga libraries for benchmarks
+Writes series-name/chapter-N folders (or CBZ archives) of manga-like pages:
+white pages with inked panels, a share of colour first pages (for cover
+selection), landscape double spreads and black filler pages (for pairing)
+
+Output is fully determined by the options and --seed. A fixed number of
+page variants is drawn per kind and reused, so large libraries are quick
+to write; the options are saved to synthetic_library.json in the root
+
+Usage: python benchmarks/synthetic_library.py ROOT [--series N] [--chapters N]
+       [--pages N] [--width W] [--height H] [--color-covers F] [--spreads F]
+       [--fillers F] [--archives F] [--format jpg|png] [--seed N]
+"""
+
+from pathlib import Path
+import argparse
+import io
+import json
+import time
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+MANIFEST = 'synthetic_library.json'
+
+DEFAULTS = {
+    'series': 20,
+    'chapters': 10,
+    'pages': 20,
+    'width': 1000,
+    'height': 1500,
+    'color_covers': 0.5,   # share of series whose first page is in colour
+    'spreads': 0.05,       # share of pages that are double spreads (twice as wide)
+    'fillers': 0.03,       # share of pages that are black fillers
+    'archives': 0.0,       # share of chapters written as CBZ archives
+    'format': 'jpg',
+    'variants': 12,        # distinct encoded images per page kind
+    'seed': 0,
+}
+
+def _draw_page(rng, width, height, color=False):
+    """A white page with inked panel borders and shaded panel contents"""
+    page = np.full((height, width), 255, dtype=np.uint8)
+    margin = width // 20
+    gutter = max(width // 60, 4)
+    border = max(width // 300, 2)
+    rows = int(rng.integers(2, 5))
+    cuts = np.sort(rng.uniform(0.2, 0.8, rows - 1))
+    edges = [margin] + [margin + int(c * (height - 2 * margin)) for c in cuts] + [height - margin]
+    for top, bottom in zip(edges, edges[1:]):
+        columns = int(rng.integers(1, 4))
+        splits = [margin] + sorted(int(x) for x in rng.integers(2 * margin, width - 2 * margin, columns - 1)) + [width - margin]
+        for left, right in zip(splits, splits[1:]):
+            y0, y1 = top + gutter, bottom - gutter
+            x0, x1 = left + gutter, right - gutter
+            if y1 - y0 <= 2 * border or x1 - x0 <= 2 * border:
+                continue
+            page[y0:y1, x0:x1] = 0
+            # Screentone-like gradient plus noise inside the border
+            inner = page[y0 + border:y1 - border, x0 + border:x1 - border]
+            shade = np.linspace(rng.uniform(120, 255), rng.uniform(120, 255), inner.shape[1])
+            noise = rng.normal(0, 18, inner.shape)
+            inner[:] = np.clip(shade + noise, 0, 255).astype(np.uint8)
+    if not color:
+        return Image.fromarray(page, 'L')
+    tint = rng.uniform(0.4, 1.0, 3)
+    rgb = (page[..., None] * tint).astype(np.uint8)
+    return Image.fromarray(rgb, 'RGB')
+
+def _draw_filler(rng, width, height):
+    """A (nearly) black page with faint noise"""
+    noise = rng.normal(12, 6, (height, width))
+    return Image.fromarray(np.clip(noise, 0, 255).astype(np.uint8), 'L')
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'png':
+        image.save(buffer, 'PNG')
+    else:
+        image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def _variants(rng, options):
+    """Encoded page images per kind: page, color, spread, filler"""
+    width, height, count = options['width'], options['height'], options['variants']
+    image_format = options['format']
+    return {
+        'page': [_encode(_draw_page(rng, width, height), image_format) for _ in range(count)],
+        'color': [_encode(_draw_page(rng, width, height, color=True), image_format) for _ in range(count)],
+        'spread': [_encode(_draw_page(rng, width * 2, height), image_format) for _ in range(count)],
+        'filler': [_encode(_draw_filler(rng, width, height), image_format) for _ in range(max(count // 4, 1))],
+    }
+
+def generate_library(root, **options):
+    """
+    Write a synthetic library under root (see DEFAULTS for options)
+    Returns the options used plus counts of what was written
+    """
+    options = {**DEFAULTS, **options}
+    unknown = set(options) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(options['seed'])
+    variants = _variants(rng, options)
+    ext = options['format']
+    counts = {'series': 0, 'chapters': 0, 'archives': 0, 'pages': 0,
+              'color_covers': 0, 'spreads': 0, 'fillers': 0, 'bytes': 0}
+
+    for s in range(options['series']):
+        series_path = root / f"series-{s:04d}"
+        series_path.mkdir(exist_ok=True)
+        color_cover = rng.random() < options['color_covers']
+        counts['series'] += 1
+        counts['color_covers'] += color_cover
+        for c in range(1, options['chapters'] + 1):
+            pages = []
+            for p in range(1, options['pages'] + 1):
+                if c == 1 and p == 1 and color_cover:
+                    kind = 'color'
+                elif p > 1 and rng.random() < options['spreads']:
+                    kind = 'spread'
+                elif p > 1 and rng.random() < options['fillers']:
+                    kind = 'filler'
+                else:
+                    kind = 'page'
+                counts['spreads'] += kind == 'spread'
+                counts['fillers'] += kind == 'filler'
+                pool = variants[kind]
+                pages.append((f"{p:03d}.{ext}", pool[int(rng.integers(len(pool)))]))
+            counts['chapters'] += 1
+            counts['pages'] += len(pages)
+            counts['bytes'] += sum(len(data) for _, data in pages)
+
+            if rng.random() < options['archives']:
+                counts['archives'] += 1
+                # Stored: images are already compressed
+                with zipfile.ZipFile(series_path / f"chapter-{c}.cbz", 'w', zipfile.ZIP_STORED) as zf:
+                    for name, data in pages:
+                        zf.writestr(name, data)
+                continue
+            chapter_path = series_path / f"chapter-{c}"
+            chapter_path.mkdir(exist_ok=True)
+            for name, data in pages:
+                (chapter_path / name).write_bytes(data)
+
+    summary = {'options': options, 'counts': counts}
+    (root / MANIFEST).write_text(json.dumps(summary, indent=2))
+    return summary
+
+def load_manifest(root):
+    """The summary generate_library saved in root, or None"""
+    try:
+        return json.loads((Path(root) / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+
+def add_arguments(parser):
+    """Generator options as command line flags (shared with run_benchmarks.py)"""
+    for name, default in DEFAULTS.items():
+        flag = '--' + name.replace('_', '-')
+        if name == 'format':
+            parser.add_argument(flag, default=default, choices=('jpg', 'png'))
+        else:
+            parser.add_argument(flag, type=type(default), default=default)
+
+def options_from_args(args):
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='directory to write the library to')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = generate_library(args.root, **options_from_args(args))
+    counts = summary['counts']
+    print(f"{args.root}: {counts['series']} series, {counts['chapters']} chapters "
+          f"({counts['archives']} CBZ), {counts['pages']} pages, {counts['spreads']} spreads, "
+          f"{counts['fillers']} fillers, {counts['color_covers']} colour covers, "
+          f"{counts['bytes'] / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s")
+
+if __name__ == '__main__':
+    main()
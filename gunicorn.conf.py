@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration - production server for the manga server
+Run: gunicorn -c gunicorn.conf.py app:app
+Worker processes each serve requests on a pool of threads, so image
+requests don't queue behind slow chapter/pairing requests. One worker
+(whichever takes data/background.lock) scans, watches and analyses the
+library; the others share its SQLite index and on-disk caches
+"""
+
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+# Worker processes and request threads per process
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, min(os.cpu_count() or 2, 4))))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', '8'))
+# Seconds a worker may go silent before it is restarted (threads keep it
+# alive while single requests run long) and may take to finish on shutdown
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+# Components open SQLite connections and thread pools, so each worker
+# imports the app itself rather than inheriting one from the master
+preload_app = False
+accesslog = os.environ.get('WEB_ACCESS_LOG') or None
+
+def post_worker_init(worker):
+    """Hand the background work to the first worker that takes the lock"""
+    from app import start_background
+    if start_background(shared=True):
+        worker.log.info("Worker %s runs the library scan, watcher and analysis", worker.pid)
+
+def worker_exit(server, worker):
+    from app import stop_background
+    stop_background()
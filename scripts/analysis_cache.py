@@ -0,0 +1,294 @@
+"""
+Analysis Cache - Persistent store for image analysis results
+Caches page pairs and per-page features for each chapter, and the smart
+cover for each series, keyed by a fingerprint of the chapter's files
+(names + sizes + mtimes). Pairs also record the chapter's mtime in the
+library index, so requests can look them up without touching the disk.
+Also carries analysis requests from server processes to the one running
+the analysis pool
+"""
+
+from pathlib import Path
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from chapter_archive import ArchiveReader, is_archive
+
+# Bumped when stored pairs/features can no longer be trusted
+# (2: pages are decoded at full resolution again)
+ANALYSIS_VERSION = 2
+
+class AnalysisCache:
+    def __init__(self, db_file='data/analysis.db', archive_reader=None):
+        self.db_file = Path(db_file)
+        self.archive_reader = archive_reader or ArchiveReader()
+        self._lock = threading.Lock()
+        self.conn = self._connect()
+
+    def _connect(self):
+        """Open the cache database and create tables if needed"""
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chapter_analysis (
+                chapter TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                pairs TEXT NOT NULL,
+                features TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                mtime_ns INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS series_covers (
+                series TEXT PRIMARY KEY,
+                chapter TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                cover TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS analysis_requests (
+                kind TEXT NOT NULL,
+                series TEXT NOT NULL,
+                requested_at REAL NOT NULL,
+                PRIMARY KEY (kind, series)
+            ) WITHOUT ROWID;
+        """)
+        self._migrate(conn)
+        conn.commit()
+        return conn
+
+    def _migrate(self, conn):
+        """
+        Drop chapter analyses stored by an older analysis version, and add
+        columns to caches created before they existed
+        """
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(chapter_analysis)')}
+        if 'mtime_ns' not in columns:
+            conn.execute('ALTER TABLE chapter_analysis ADD COLUMN mtime_ns INTEGER')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < ANALYSIS_VERSION:
+            conn.execute('DELETE FROM chapter_analysis')
+            conn.execute(f'PRAGMA user_version = {ANALYSIS_VERSION}')
+
+    def fingerprint_chapter(self, chapter_path):
+        """
+        Fingerprint a chapter directory from its file names, sizes and mtimes
+        (archive entry names, sizes and CRCs for CBZ/ZIP chapters)
+        Returns (fingerprint, signatures) where signatures maps
+        file name -> [size, mtime_ns or crc]
+        """
+        if is_archive(chapter_path):
+            signatures = self.archive_reader.signatures(chapter_path)
+        else:
+            signatures = {}
+            with os.scandir(chapter_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        st = entry.stat()
+                        signatures[entry.name] = [st.st_size, st.st_mtime_ns]
+
+        digest = hashlib.sha1()
+        for name in sorted(signatures):
+            size, mtime_ns = signatures[name]
+            digest.update(f"{name}\0{size}\0{mtime_ns}\n".encode('utf-8'))
+        return digest.hexdigest(), signatures
+
+    def get_pairs(self, chapter_key, fingerprint):
+        """Get cached page pairs, or None if missing or stale"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT fingerprint, pairs FROM chapter_analysis WHERE chapter = ?',
+                (chapter_key,)
+            ).fetchone()
+        if row is None or row[0] != fingerprint:
+            return None
+        return json.loads(row[1])
+
+    def get_indexed_pairs(self, chapter_key, mtime_ns):
+        """
+        Get cached page pairs if they were stored for this index mtime of the
+        chapter, or None; a lookup only, nothing on disk is read
+        """
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT mtime_ns, pairs FROM chapter_analysis WHERE chapter = ?',
+                (chapter_key,)
+            ).fetchone()
+        if row is None or mtime_ns is None or row[0] != mtime_ns:
+            return None
+        return json.loads(row[1])
+
+    def mark_indexed(self, chapter_key, fingerprint, mtime_ns):
+        """
+        Record that a chapter's stored analysis (still matching fingerprint)
+        is current for this index mtime, e.g. after the directory was touched
+        """
+        with self._lock:
+            self.conn.execute(
+                'UPDATE chapter_analysis SET mtime_ns = ?, updated_at = ? '
+                'WHERE chapter = ? AND fingerprint = ? AND mtime_ns IS NOT ?',
+                (mtime_ns, time.time(), chapter_key, fingerprint, mtime_ns)
+            )
+            self.conn.commit()
+
+    def get_updated_at(self, chapter_key):
+        """When the chapter's analysis was last stored, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT updated_at FROM chapter_analysis WHERE chapter = ?', (chapter_key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_reusable_features(self, chapter_key, signatures):
+        """
+        Get stored features for pages whose file signature is unchanged
+        Lets a re-analysis after a partial change skip decoding untouched pages
+        """
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT features FROM chapter_analysis WHERE chapter = ?',
+                (chapter_key,)
+            ).fetchone()
+        if row is None:
+            return {}
+
+        reusable = {}
+        for name, entry in json.loads(row[0]).items():
+            if signatures.get(name) == entry['signature']:
+                reusable[name] = entry['features']
+        return reusable
+
+    def store_pairs(self, chapter_key, fingerprint, signatures, pairs, page_features,
+                    mtime_ns=None):
+        """
+        Store page pairs and per-page features for a chapter
+        page_features maps file name -> feature record; mtime_ns is the
+        chapter's mtime in the library index (see get_indexed_pairs)
+        """
+        features = {
+            name: {'signature': signatures.get(name), 'features': record}
+            for name, record in page_features.items()
+        }
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO chapter_analysis '
+                '(chapter, fingerprint, pairs, features, updated_at, mtime_ns) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (chapter_key, fingerprint, json.dumps(pairs), json.dumps(features), time.time(),
+                 mtime_ns)
+            )
+            self.conn.commit()
+
+    def get_cover(self, series_name, first_chapter, fingerprint=None):
+        """
+        Get the cached cover for a series, or None if missing or stale
+        Without a fingerprint only the first chapter name is checked, which
+        needs no filesystem access
+        """
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT chapter, fingerprint, cover FROM series_covers WHERE series = ?',
+                (series_name,)
+            ).fetchone()
+        if row is None or row[0] != first_chapter:
+            return None
+        if fingerprint is not None and row[1] != fingerprint:
+            return None
+        return row[2]
+
+    def store_cover(self, series_name, first_chapter, fingerprint, cover):
+        """Store the selected cover for a series"""
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO series_covers '
+                '(series, chapter, fingerprint, cover, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (series_name, first_chapter, fingerprint, cover, time.time())
+            )
+            self.conn.commit()
+
+    def covers_state(self):
+        """Token that changes whenever any stored cover changes"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT count(*), max(updated_at) FROM series_covers'
+            ).fetchone()
+        return f"{row[0]}-{row[1]}"
+
+    def cached_covers(self):
+        """Set of series names that have a stored cover (fresh or not)"""
+        with self._lock:
+            return {r[0] for r in self.conn.execute('SELECT series FROM series_covers')}
+
+    def cached_chapters(self):
+        """Set of chapter keys that have stored results (fresh or not)"""
+        with self._lock:
+            return {r[0] for r in self.conn.execute('SELECT chapter FROM chapter_analysis')}
+
+    def analysed_chapters(self, series_name):
+        """
+        {chapter name: index mtime_ns stored with its results} for a series'
+        chapters that have stored results (fresh or not)
+        """
+        # A range over the primary key: chapter keys are '<series>/<chapter>'
+        # and '0' sorts right after '/'
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT chapter, mtime_ns FROM chapter_analysis WHERE chapter > ? AND chapter < ?',
+                (f"{series_name}/", f"{series_name}0")
+            ).fetchall()
+        return {chapter[len(series_name) + 1:]: mtime_ns for chapter, mtime_ns in rows}
+
+    def request_analysis(self, kind, series_name):
+        """
+        Ask the process running the analysis pool to queue a series' cover
+        (kind 'cover') or move its chapters to the front (kind 'series')
+        """
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO analysis_requests (kind, series, requested_at) '
+                'VALUES (?, ?, ?)', (kind, series_name, time.time())
+            )
+            self.conn.commit()
+
+    def take_requests(self):
+        """Remove and return pending (kind, series_name) requests, oldest first"""
+        with self._lock:
+            # Polled often: only take the write lock when there is something to take
+            if self.conn.execute('SELECT 1 FROM analysis_requests LIMIT 1').fetchone() is None:
+                return []
+            # Read and delete in one write transaction so no request is lost
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self.conn.execute(
+                    'SELECT kind, series FROM analysis_requests ORDER BY requested_at'
+                ).fetchall()
+                if rows:
+                    self.conn.execute('DELETE FROM analysis_requests')
+            finally:
+                self.conn.commit()
+        return rows
+
+    def invalidate_chapter(self, chapter_key):
+        """Drop cached results for a chapter"""
+        with self._lock:
+            self.conn.execute('DELETE FROM chapter_analysis WHERE chapter = ?', (chapter_key,))
+            self.conn.commit()
+
+    def invalidate_series(self, series_name):
+        """Drop cached results for every chapter of a series and its cover"""
+        prefix = f"{series_name}/"
+        with self._lock:
+            self.conn.execute(
+                'DELETE FROM chapter_analysis WHERE substr(chapter, 1, ?) = ?',
+                (len(prefix), prefix)
+            )
+            self.conn.execute('DELETE FROM series_covers WHERE series = ?', (series_name,))
+            self.conn.commit()
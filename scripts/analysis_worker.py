@@ -0,0 +1,344 @@
+"""
+Analysis Worker - Background pre-analysis of new and changed chapters
+Runs MangaPagePairer and CoverSelector on a process pool ahead of time
+(and probes page sizes alongside) so readers don't pay for OpenCV/PIL or
+page header reads inside the request thread. Server processes without
+the pool (remote) pass their requests to the one with it through the
+analysis cache
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from cover_selector import CoverSelector
+from metrics import metrics
+
+# Lower value runs first
+PRIORITY_OPEN_SERIES = 0
+PRIORITY_CHANGED = 10
+PRIORITY_BACKFILL = 20
+
+# Seconds between checks for requests from other server processes, and
+# idle seconds before backfilling anything dropped while the queue was full
+REQUEST_POLL_INTERVAL = 1.0
+BACKFILL_INTERVAL = 30.0
+
+def analyze_chapter(chapter_path, known_features, batch=False):
+    """Pair a chapter's pages (runs inside a pool process)"""
+    # OpenCV/NumPy load on a pool process's first job, not in the server
+    from page_pairer import MangaPagePairer
+    try:
+        # Pool processes already run side by side, so each decodes on one thread
+        pairer = MangaPagePairer(chapter_path, known_features=known_features,
+                                 batch=batch, workers=1)
+        pairs = pairer.pair_pages()
+        return pairs, pairer.get_features_by_name()
+    finally:
+        # Pool processes exit without running atexit, and may sit idle
+        # for long after their last job
+        metrics.flush()
+
+def init_pool_process(metrics_directory):
+    """Share metrics from pool processes that didn't inherit the server's setup"""
+    if metrics_directory is not None:
+        metrics.configure(metrics_directory)
+
+def select_cover(manga_root, series_name):
+    """Pick a series' smart cover (runs inside a pool process)"""
+    try:
+        return CoverSelector(manga_root).get_best_cover(series_name)
+    finally:
+        metrics.flush()
+
+class AnalysisWorker:
+    def __init__(self, manga_root, library_index, analysis_cache, workers=2, queue_size=1000,
+                 pairing_batch=False):
+        self.manga_root = Path(manga_root)
+        self.library_index = library_index
+        self.analysis_cache = analysis_cache
+        self.workers = workers
+        # Passed to MangaPagePairer as batch (see PAIRING_BATCH in app.py)
+        self.pairing_batch = pairing_batch
+        self._queue = queue.PriorityQueue(maxsize=queue_size)
+        self._pending = {}  # job key ('chapter', series, chapter) / ('cover', series) -> priority
+        # series name -> the ChapterOrder it was last prioritised with
+        self._prioritized = {}
+        # Set when another server process runs the pool: jobs are then
+        # requested from it instead of run here
+        self.remote = False
+        # (kind, series name) -> the ChapterOrder it was last requested with
+        self._requested = {}
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max(workers, 1))
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+
+        library_index.add_listener(self._on_index_event)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def active(self):
+        """True if analysis runs in the background, in this process or another"""
+        return self.running or self.remote
+
+    def start(self):
+        """Start the process pool and dispatcher thread (no-op if workers is 0)"""
+        if self.workers <= 0 or self.running:
+            return
+        self._executor = self._create_executor()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='analysis-dispatcher', daemon=True)
+        self._thread.start()
+        self.backfill()
+
+    def stop(self):
+        """Stop dispatching and shut the pool down"""
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _create_executor(self, context='fork'):
+        # Fork context launches every worker on the first submit, so forcing
+        # that here forks before the dispatcher or request threads exist
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(context),
+            initializer=init_pool_process,
+            initargs=(metrics.directory,)
+        )
+        executor.submit(int).result()
+        return executor
+
+    # -------------------------------------------------
+    # Queueing
+    # -------------------------------------------------
+    def submit_chapter(self, series_name, chapter_name, priority=PRIORITY_CHANGED):
+        """Queue a chapter for page pairing; returns False if the queue is full"""
+        return self._submit(('chapter', series_name, chapter_name), priority)
+
+    def submit_cover(self, series_name, priority=PRIORITY_CHANGED):
+        """Queue a series for cover selection; returns False if the queue is full"""
+        if self.remote:
+            return self._request('cover', series_name)
+        return self._submit(('cover', series_name), priority)
+
+    def _submit(self, key, priority):
+        # A job already queued at a lower priority is queued again so the
+        # better priority wins; the stale copy is skipped once it's cached
+        with self._lock:
+            queued = self._pending.get(key)
+            if queued is not None and queued <= priority:
+                return True
+            try:
+                self._queue.put_nowait((priority, next(self._order), key))
+            except queue.Full:
+                return False
+            self._pending[key] = priority
+        return True
+
+    def prioritize_series(self, series_name):
+        """
+        Move a series' chapters that have no stored analysis or page sizes
+        (e.g. of the one being read) to the front; a no-op until the series
+        changes again
+        """
+        if self.remote:
+            self._request('series', series_name)
+            return
+        if not self.running:
+            return
+        # The index hands out a new ChapterOrder whenever the series changes
+        order = self.library_index.get_chapter_order(series_name)
+        with self._lock:
+            if self._prioritized.get(series_name) is order:
+                return
+        analysed = self.analysis_cache.analysed_chapters(series_name)
+        unsized = self.library_index.get_unsized_chapters(series_name)
+        for chapter_name, mtime_ns in zip(order.names, order.mtimes):
+            # Stored for another index mtime: requests won't use it until checked
+            if analysed.get(chapter_name) == mtime_ns and (series_name, chapter_name) not in unsized:
+                continue
+            if not self.submit_chapter(series_name, chapter_name, PRIORITY_OPEN_SERIES):
+                return  # queue full: try again on the next call
+        with self._lock:
+            self._prioritized[series_name] = order
+
+    def _request(self, kind, series_name):
+        """Pass a job to the process running the pool, once per series change"""
+        order = self.library_index.get_chapter_order(series_name)
+        with self._lock:
+            if self._requested.get((kind, series_name)) is order:
+                return True
+            self._requested[(kind, series_name)] = order
+        self.analysis_cache.request_analysis(kind, series_name)
+        return True
+
+    def _take_requests(self):
+        """Queue what other server processes asked for"""
+        for kind, series_name in self.analysis_cache.take_requests():
+            if kind == 'cover':
+                self.submit_cover(series_name)
+            else:
+                self.prioritize_series(series_name)
+
+    def backfill(self):
+        """Queue chapters and covers that have no cached analysis yet, as capacity allows"""
+        cached_covers = self.analysis_cache.cached_covers()
+        cached = self.analysis_cache.cached_chapters()
+        unsized = self.library_index.get_unsized_chapters()
+        for series_name, chapter_name in self.library_index.iter_chapters():
+            if series_name not in cached_covers:
+                cached_covers.add(series_name)
+                if not self.submit_cover(series_name, PRIORITY_BACKFILL):
+                    break
+            if f"{series_name}/{chapter_name}" in cached and (series_name, chapter_name) not in unsized:
+                continue
+            if not self.submit_chapter(series_name, chapter_name, PRIORITY_BACKFILL):
+                break
+
+    def _on_index_event(self, event, series_name, chapter_name):
+        if event == 'chapter_changed' and self.running:
+            self.submit_chapter(series_name, chapter_name)
+            # Cheap no-op unless this is (now) the series' first chapter
+            self.submit_cover(series_name)
+        elif event == 'chapter_removed':
+            self.analysis_cache.invalidate_chapter(f"{series_name}/{chapter_name}")
+        elif event == 'series_removed' and not self.remote:
+            # (a remote process hears of removals the pool's process already handled)
+            self.analysis_cache.invalidate_series(series_name)
+            with self._lock:
+                self._prioritized.pop(series_name, None)
+
+    # -------------------------------------------------
+    # Dispatching
+    # -------------------------------------------------
+    def _run(self):
+        idle_since = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self._take_requests()
+            except Exception as e:
+                print(f"Warning: Could not read analysis requests: {e}")
+            try:
+                priority, _, key = self._queue.get(timeout=REQUEST_POLL_INTERVAL)
+            except queue.Empty:
+                if time.monotonic() - idle_since >= BACKFILL_INTERVAL:
+                    # Idle: pick up anything dropped while the queue was full
+                    self.backfill()
+                    idle_since = time.monotonic()
+                continue
+            idle_since = time.monotonic()
+
+            with self._lock:
+                if self._pending.get(key) == priority:
+                    del self._pending[key]
+
+            self._slots.acquire()
+            try:
+                if key[0] == 'cover':
+                    self._dispatch_cover(key[1])
+                else:
+                    self._dispatch_chapter(key[1], key[2])
+            except Exception as e:
+                self._slots.release()
+                print(f"Warning: Could not analyze {'/'.join(key[1:])}: {e}")
+
+    def _submit_to_pool(self, func, *args):
+        try:
+            return self._executor.submit(func, *args)
+        except BrokenProcessPool:
+            # A worker died; replace the pool and retry once. Threads run by
+            # now, so the new workers come from a forkserver, not this process
+            self._executor = self._create_executor('forkserver')
+            return self._executor.submit(func, *args)
+
+    def _store_page_sizes(self, series_name, chapter_name):
+        """Probe and index a chapter's page sizes, which manifests only read"""
+        try:
+            self.library_index.get_page_sizes(series_name, chapter_name)
+        except Exception as e:
+            print(f"Warning: Could not probe page sizes of {series_name}/{chapter_name}: {e}")
+
+    def _dispatch_chapter(self, series_name, chapter_name):
+        """Submit a chapter to the pool unless its cached analysis is current"""
+        chapter_key = f"{series_name}/{chapter_name}"
+        chapter_path = self.manga_root / series_name / chapter_name
+        if not chapter_path.exists():
+            self._slots.release()
+            return
+
+        # Read before fingerprinting: if the chapter changes in between, the
+        # stored mtime is the older one and requests miss rather than go stale
+        mtime_ns = self.library_index.get_chapter_order(series_name).mtime_of(chapter_name)
+        fingerprint, signatures = self.analysis_cache.fingerprint_chapter(chapter_path)
+        if self.analysis_cache.get_pairs(chapter_key, fingerprint) is not None:
+            self._slots.release()
+            self.analysis_cache.mark_indexed(chapter_key, fingerprint, mtime_ns)
+            self._store_page_sizes(series_name, chapter_name)
+            return
+
+        known_features = self.analysis_cache.get_reusable_features(chapter_key, signatures)
+        future = self._submit_to_pool(analyze_chapter, str(chapter_path), known_features,
+                                      self.pairing_batch)
+
+        def _done(fut):
+            self._slots.release()
+            try:
+                pairs, page_features = fut.result()
+            except Exception as e:
+                metrics.inc('manga_analysis_jobs_total', kind='chapter', result='error')
+                print(f"Warning: Could not analyze chapter {chapter_key}: {e}")
+                return
+            metrics.inc('manga_analysis_jobs_total', kind='chapter', result='ok')
+            self.analysis_cache.store_pairs(
+                chapter_key, fingerprint, signatures, pairs, page_features, mtime_ns
+            )
+            # The pages were just read, so their headers are in the page cache
+            self._store_page_sizes(series_name, chapter_name)
+
+        future.add_done_callback(_done)
+
+    def _dispatch_cover(self, series_name):
+        """Submit a series to the pool unless its cover matches its first chapter"""
+        chapters = self.library_index.get_chapters(series_name)
+        if not chapters:
+            self._slots.release()
+            return
+
+        first_chapter = chapters[0]
+        fingerprint, _ = self.analysis_cache.fingerprint_chapter(
+            self.manga_root / series_name / first_chapter
+        )
+        if self.analysis_cache.get_cover(series_name, first_chapter, fingerprint) is not None:
+            self._slots.release()
+            return
+
+        future = self._submit_to_pool(select_cover, str(self.manga_root), series_name)
+
+        def _done(fut):
+            self._slots.release()
+            try:
+                cover = fut.result()
+            except Exception as e:
+                metrics.inc('manga_analysis_jobs_total', kind='cover', result='error')
+                print(f"Warning: Could not select cover for {series_name}: {e}")
+                return
+            metrics.inc('manga_analysis_jobs_total', kind='cover', result='ok')
+            self.analysis_cache.store_cover(series_name, first_chapter, fingerprint, cover)
+
+        future.add_done_callback(_done)
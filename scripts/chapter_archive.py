@@ -0,0 +1,174 @@
+"""
+Chapter Archive - Read-only access to CBZ/ZIP chapter archives
+Keeps each archive's central directory (and an open handle) cached so
+pages can be listed and served straight from the archive. Stored entries
+(and byte ranges of plain files) are exposed as FileRangeReader windows,
+which a WSGI server can hand to sendfile()
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+import io
+import os
+import struct
+import threading
+import zipfile
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from metrics import metrics
+
+ARCHIVE_EXTENSIONS = {'.cbz', '.zip'}
+
+# Fixed part of a ZIP local file header; name and extra lengths sit at 26..30
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+def is_archive(path):
+    """True if path names a chapter archive (by extension)"""
+    return Path(path).suffix.lower() in ARCHIVE_EXTENSIONS
+
+class FileRangeReader(io.RawIOBase):
+    """
+    Raw reader over size bytes of a file starting at offset, e.g. an
+    uncompressed (stored) archive entry or the Range a client asked for
+    Reads go straight to the file, so nothing is extracted or copied
+    """
+    def __init__(self, path, offset, size):
+        # Unbuffered, so the descriptor's position always matches ours
+        self._file = open(path, 'rb', buffering=0)
+        self._start = offset
+        self._size = size
+        self._pos = 0
+        self._file.seek(offset)
+
+    @property
+    def size(self):
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        """Descriptor positioned at the current read position (for sendfile)"""
+        return self._file.fileno()
+
+    def readinto(self, buffer):
+        remaining = self._size - self._pos
+        if remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:remaining]
+        count = self._file.readinto(view)
+        self._pos += count
+        return count
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._size
+        self._pos = min(max(pos, 0), self._size)
+        self._file.seek(self._start + self._pos)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+class ArchiveReader:
+    def __init__(self, max_open=32):
+        # archive path -> ((size, mtime_ns), ZipFile, {name: ZipInfo}, {name: data offset})
+        self._archives = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_open = max_open
+
+    def _get(self, archive_path):
+        """Cached central directory for an archive, reloaded if the file changed"""
+        archive_path = str(archive_path)
+        st = os.stat(archive_path)
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._archives.get(archive_path)
+            hit = cached is not None and cached[0] == key
+            metrics.cache('archive_directory', hit)
+            if hit:
+                self._archives.move_to_end(archive_path)
+                return cached
+            if cached is not None:
+                # Entries still being streamed keep their own reference open
+                cached[1].close()
+
+            zf = zipfile.ZipFile(archive_path)
+            entries = {info.filename: info for info in zf.infolist() if not info.is_dir()}
+            cached = (key, zf, entries, {})
+            self._archives[archive_path] = cached
+            while len(self._archives) > self.max_open:
+                _, evicted = self._archives.popitem(last=False)
+                evicted[1].close()
+            return cached
+
+    def list_images(self, archive_path, image_extensions):
+        """Names of image entries in an archive (unsorted)"""
+        _, _, entries, _ = self._get(archive_path)
+        return [name for name in entries
+                if os.path.splitext(name)[1].lower() in image_extensions]
+
+    def get_info(self, archive_path, name):
+        """ZipInfo for an entry, or None if the archive has no such entry"""
+        _, _, entries, _ = self._get(archive_path)
+        return entries.get(name)
+
+    def signatures(self, archive_path):
+        """Map of entry name -> [size, crc] (the archive counterpart of size + mtime)"""
+        _, _, entries, _ = self._get(archive_path)
+        return {name: [info.file_size, info.CRC] for name, info in entries.items()}
+
+    def read(self, archive_path, name):
+        """Read an entry fully into memory"""
+        _, zf, entries, _ = self._get(archive_path)
+        return zf.read(entries[name])
+
+    def open(self, archive_path, name):
+        """
+        Open an entry for streaming
+        Stored entries are read directly from the archive file; compressed
+        entries are decompressed on the fly
+        """
+        extent = self.stored_extent(archive_path, name)
+        if extent is None:
+            _, zf, entries, _ = self._get(archive_path)
+            return zf.open(entries[name])
+        return FileRangeReader(archive_path, *extent)
+
+    def stored_extent(self, archive_path, name):
+        """
+        (offset, size) of a stored entry's bytes within the archive file, or
+        None for compressed/encrypted entries (which must be decompressed)
+        """
+        _, _, entries, offsets = self._get(archive_path)
+        info = entries[name]
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            return None
+        offset = offsets.get(name)
+        if offset is None:
+            offset = self._data_offset(archive_path, info)
+            offsets[name] = offset
+        return offset, info.file_size
+
+    def _data_offset(self, archive_path, info):
+        """Where an entry's data starts: after its local header, name and extra field"""
+        with open(archive_path, 'rb') as f:
+            f.seek(info.header_offset)
+            header = f.read(LOCAL_HEADER_SIZE)
+        if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        return info.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len
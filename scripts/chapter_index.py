@@ -0,0 +1,84 @@
+"""
+Chapter Index - Sorted chapter ordering for a series
+One ordering (chapter number, then name) shared by the scanner, library
+index, chapter reader and cover selector. ChapterOrder holds a series'
+chapters pre-sorted so lookups are a dict hit or a bisect, not a re-sort
+"""
+
+from bisect import bisect_left
+import re
+
+CHAPTER_NUMBER = re.compile(r'(\d+(?:\.\d+)?)')
+
+def chapter_number(chapter_name):
+    """Extract chapter number for sorting (0 if the name has none)"""
+    match = CHAPTER_NUMBER.search(chapter_name)
+    if match:
+        return float(match.group(1))
+    return 0
+
+def chapter_sort_key(chapter_name):
+    """Order chapters numerically; the name breaks ties deterministically"""
+    return chapter_number(chapter_name), chapter_name
+
+class ChapterOrder:
+    def __init__(self, entries):
+        """
+        entries: (number, name, page_count, mtime_ns) tuples already in
+        chapter_sort_key order (e.g. from an ORDER BY number, name query)
+        """
+        self.numbers = [entry[0] for entry in entries]
+        self.names = [entry[1] for entry in entries]
+        self.page_counts = [entry[2] for entry in entries]
+        self.mtimes = [entry[3] for entry in entries]
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, chapter_name):
+        """Position of a chapter in reading order, or None"""
+        return self._positions.get(chapter_name)
+
+    def mtime_of(self, chapter_name):
+        """The index's mtime_ns of a chapter, or None"""
+        i = self._positions.get(chapter_name)
+        return None if i is None else self.mtimes[i]
+
+    def neighbours(self, chapter_name):
+        """(previous, next) chapter names around a chapter (None at the ends)"""
+        i = self._positions.get(chapter_name)
+        if i is None:
+            return None, None
+        prev_name = self.names[i - 1] if i > 0 else None
+        next_name = self.names[i + 1] if i + 1 < len(self.names) else None
+        return prev_name, next_name
+
+    def find_number(self, number):
+        """First chapter with exactly this chapter number, or None (bisect)"""
+        i = bisect_left(self.numbers, number)
+        if i < len(self.numbers) and self.numbers[i] == number:
+            return self.names[i]
+        return None
+
+    def find(self, chapter_num):
+        """
+        Find the chapter name for a requested chapter number or name:
+        exact 'chapter-N' or name, then the chapter number, then a substring
+        """
+        for candidate in (f"chapter-{chapter_num}", chapter_num):
+            if candidate in self._positions:
+                return candidate
+
+        try:
+            name = self.find_number(float(chapter_num))
+        except ValueError:
+            name = None
+        if name is not None:
+            return name
+
+        # Try to find chapter with similar name
+        for chapter_name in self.names:
+            if chapter_num in chapter_name:
+                return chapter_name
+        return None
@@ -11,72 +11,140 @@ import os
 
 # Add scripts directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
-from page_pairer import MangaPagePairer
+from metrics import metrics
 
 class ChapterReader:
-    def __init__(self, manga_root):
+    def __init__(self, manga_root, library_index, analysis_cache, pairing_batch=False):
         self.manga_root = Path(manga_root)
-        self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-        
-    def get_chapter_pages(self, series_name, chapter_num):
-        """Get all pages for a specific chapter"""
-        chapter_path = self.manga_root / series_name / f"chapter-{chapter_num}"
-        
-        # Try exact match first
-        if not chapter_path.exists():
-            # Try to find chapter with similar name
-            series_path = self.manga_root / series_name
-            if series_path.exists():
-                for chapter_dir in series_path.iterdir():
-                    if chapter_dir.is_dir() and chapter_num in chapter_dir.name:
-                        chapter_path = chapter_dir
-                        break
-        
-        if not chapter_path.exists() or not chapter_path.is_dir():
+        self.library_index = library_index
+        self.analysis_cache = analysis_cache
+        # Passed to MangaPagePairer as batch (see PAIRING_BATCH in app.py)
+        self.pairing_batch = pairing_batch
+        
+    def get_chapter_pages(self, series_name, chapter_num, cached_only=False):
+        """
+        Get all pages for a specific chapter; with cached_only, uncached
+        pairs and page sizes are left to the analysis worker (see get_chapter_range)
+        """
+        order = self.library_index.get_chapter_order(series_name)
+        chapter_name = order.find(chapter_num)
+        if chapter_name is None:
             return None
+        return self._build_manifest(series_name, chapter_name, order, cached_only)
+    
+    def get_chapter_names(self, series_name, chapter_num, count):
+        """
+        Names of up to count chapters in reading order starting at
+        chapter_num (index lookups only), or None if it doesn't exist
+        """
+        order = self.library_index.get_chapter_order(series_name)
+        chapter_name = order.find(chapter_num)
+        if chapter_name is None:
+            return None
+        start = order.index_of(chapter_name)
+        return list(order.names[start:start + count])
+    
+    def get_chapter_range(self, series_name, chapter_num, count):
+        """
+        Manifests for up to count chapters in reading order, starting at
+        chapter_num, built from cached data only: chapters whose pairs aren't
+        cached yet get sequential pairs and 'pairs_pending': True, and
+        page_sizes is None until the analysis worker has probed them
+        Returns None if the start chapter doesn't exist
+        """
+        names = self.get_chapter_names(series_name, chapter_num, count)
+        if names is None:
+            return None
+        
+        order = self.library_index.get_chapter_order(series_name)
+        manifests = []
+        for name in names:
+            manifest = self._build_manifest(series_name, name, order, cached_only=True)
+            if manifest:
+                manifests.append(manifest)
+        return manifests
+    
+    def _build_manifest(self, series_name, chapter_name, order, cached_only=False):
+        """Pages, page pairs and navigation of one chapter (None if it has no pages)"""
+        chapter_path = self.manga_root / series_name / chapter_name
+        page_names = self.library_index.get_chapter_pages(series_name, chapter_name)
         
-        pages = []
-        for file in sorted(chapter_path.iterdir(), key=self._natural_sort_key):
-            if file.is_file() and file.suffix.lower() in self.image_extensions:
-                # Create relative path from manga root
-                rel_path = str(Path(series_name) / chapter_path.name / file.name)
-                pages.append(rel_path)
+        # Create relative paths from manga root
+        pages = [str(Path(series_name) / chapter_name / name) for name in page_names or []]
         
         if not pages:
             return None
         
         # Get page pairs for dual mode
-        page_pairs = []
+        pairs = None
         try:
-            pairer = MangaPagePairer(str(chapter_path))
-            pairs = pairer.pair_pages()
-            # Convert pairs to use relative paths
-            for pair in pairs:
-                pair_paths = [str(Path(series_name) / chapter_path.name / p) for p in pair]
-                page_pairs.append(pair_paths)
+            pairs = self._get_pairs(series_name, chapter_name, chapter_path,
+                                    order.mtime_of(chapter_name), cached_only)
         except Exception as e:
             print(f"Warning: Could not generate page pairs: {e}")
+        
+        if pairs is not None:
+            # Convert pairs to use relative paths
+            page_pairs = [[str(Path(series_name) / chapter_name / p) for p in pair]
+                          for pair in pairs]
+        else:
             # Fallback: simple sequential pairing
-            page_pairs = []
-            for i in range(0, len(pages), 2):
-                if i + 1 < len(pages):
-                    page_pairs.append([pages[i], pages[i + 1]])
-                else:
-                    page_pairs.append([pages[i]])
+            page_pairs = [pages[i:i + 2] for i in range(0, len(pages), 2)]
         
         # Get navigation info
-        nav_info = self._get_navigation_info(series_name, chapter_path.name)
+        nav_info = self._get_navigation_info(order, chapter_name)
         
-        return {
+        manifest = {
             'series_name': series_name,
-            'chapter': chapter_path.name,
-            'chapter_display': self.format_chapter_name(chapter_path.name),
+            'chapter': chapter_name,
+            'chapter_display': self.format_chapter_name(chapter_name),
             'pages': pages,
             'page_pairs': page_pairs,
             'page_count': len(pages),
+            # [width, height] per page, so clients can lay pages out before they load
+            'page_sizes': self.library_index.get_page_sizes(series_name, chapter_name, cached_only),
             'pair_count': len(page_pairs),
             'navigation': nav_info
         }
+        if pairs is None and cached_only:
+            # The analysis worker will pair it; clients refetch before dual-page use
+            manifest['pairs_pending'] = True
+        return manifest
+    
+    def _get_pairs(self, series_name, chapter_name, chapter_path, mtime_ns, cached_only=False):
+        """
+        Get page pairs from the analysis cache (checked against the chapter's
+        mtime in the index, without reading the disk), running the pairer on
+        a miss (or returning None on a miss when cached_only)
+        """
+        chapter_key = f"{series_name}/{chapter_name}"
+        pairs = self.analysis_cache.get_indexed_pairs(chapter_key, mtime_ns)
+        metrics.cache('pairs', pairs is not None)
+        if pairs is not None or cached_only:
+            return pairs
+        
+        # Only reached without a background worker: the stored analysis may
+        # still match the files if just the directory was touched
+        fingerprint, signatures = self.analysis_cache.fingerprint_chapter(chapter_path)
+        pairs = self.analysis_cache.get_pairs(chapter_key, fingerprint)
+        if pairs is not None:
+            self.analysis_cache.mark_indexed(chapter_key, fingerprint, mtime_ns)
+            return pairs
+        
+        known_features = self.analysis_cache.get_reusable_features(chapter_key, signatures)
+        # Imported on the first uncached chapter: most processes never need OpenCV
+        from page_pairer import MangaPagePairer
+        pairer = MangaPagePairer(str(chapter_path), known_features=known_features,
+                                 batch=self.pairing_batch)
+        pairs = pairer.pair_pages()
+        self.analysis_cache.store_pairs(
+            chapter_key, fingerprint, signatures, pairs, pairer.get_features_by_name(), mtime_ns
+        )
+        return pairs
+    
+    def resolve_chapter(self, series_name, chapter_num):
+        """Get the chapter directory name for a chapter number/name, or None"""
+        return self.library_index.get_chapter_order(series_name).find(chapter_num)
     
     def format_chapter_name(self, chapter_name):
         """Format chapter name for display"""
@@ -95,65 +163,28 @@ class ChapterReader:
         # Fallback: format the name nicely
         return chapter_name.replace('-', ' ').replace('_', ' ').title()
     
-    def _get_navigation_info(self, series_name, current_chapter):
-        """Get previous/next chapter info"""
-        series_path = self.manga_root / series_name
-        
-        if not series_path.exists():
-            return {}
-        
-        # Get all chapters
-        chapters = []
-        for chapter_dir in series_path.iterdir():
-            if chapter_dir.is_dir() and self._has_images(chapter_dir):
-                chapters.append(chapter_dir.name)
-        
-        # Sort chapters
-        chapters = sorted(chapters, key=self._extract_chapter_number)
-        
-        # Find current chapter index
-        try:
-            current_idx = chapters.index(current_chapter)
-        except ValueError:
+    def _get_navigation_info(self, order, current_chapter):
+        """Get previous/next chapter info from a series' ChapterOrder"""
+        current_idx = order.index_of(current_chapter)
+        if current_idx is None:
             return {}
         
         nav = {}
+        prev_chapter, next_chapter = order.neighbours(current_chapter)
         
         # Previous chapter
-        if current_idx > 0:
-            prev_chapter = chapters[current_idx - 1]
+        if prev_chapter is not None:
             nav['prev_chapter'] = prev_chapter
-            nav['prev_chapter_num'] = self._extract_chapter_number(prev_chapter)
+            nav['prev_chapter_num'] = order.numbers[current_idx - 1]
             nav['prev_chapter_display'] = self.format_chapter_name(prev_chapter)
         
         # Next chapter
-        if current_idx < len(chapters) - 1:
-            next_chapter = chapters[current_idx + 1]
+        if next_chapter is not None:
             nav['next_chapter'] = next_chapter
-            nav['next_chapter_num'] = self._extract_chapter_number(next_chapter)
+            nav['next_chapter_num'] = order.numbers[current_idx + 1]
             nav['next_chapter_display'] = self.format_chapter_name(next_chapter)
         
-        nav['total_chapters'] = len(chapters)
+        nav['total_chapters'] = len(order)
         nav['current_index'] = current_idx + 1
         
         return nav
-    
-    def _has_images(self, directory):
-        """Check if directory contains image files"""
-        for file in directory.iterdir():
-            if file.is_file() and file.suffix.lower() in self.image_extensions:
-                return True
-        return False
-    
-    def _extract_chapter_number(self, chapter_name):
-        """Extract chapter number for sorting"""
-        match = re.search(r'(\d+(?:\.\d+)?)', chapter_name)
-        if match:
-            return float(match.group(1))
-        return 0
-    
-    def _natural_sort_key(self, path):
-        """Natural sorting key for paths"""
-        filename = path.name
-        return [int(text) if text.isdigit() else text.lower() 
-                for text in re.split(r'(\d+)', filename)]
\ No newline at end of file
@@ -4,14 +4,33 @@ Finds first non-black-and-white image from first chapter
 """
 
 from pathlib import Path
-from PIL import Image
-import re
+import io
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from chapter_archive import is_archive
+from library_scanner import LibraryScanner
+from metrics import metrics
 
 class CoverSelector:
-    def __init__(self, manga_root):
+    def __init__(self, manga_root, analysis_cache=None,
+                 color_threshold=15, min_color_ratio=0.05, sample_size=100, scanner=None,
+                 library_index=None):
         self.manga_root = Path(manga_root)
-        self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+        self.analysis_cache = analysis_cache
+        # When given, the first chapter comes from the index's chapter order (no listing)
+        self.library_index = library_index
+        # Shared scanning engine, so chapters are found and ordered like the index
+        self.scanner = scanner or LibraryScanner(manga_root, workers=1)
+        # A pixel is "color" if any two channels differ by more than color_threshold
+        self.color_threshold = color_threshold
+        # Fraction of color pixels needed to call the whole image color
+        self.min_color_ratio = min_color_ratio
+        # Images are analysed as a sample_size x sample_size thumbnail
+        self.sample_size = sample_size
         
+    @metrics.timer('manga_cover_selection_seconds')
     def get_best_cover(self, series_name):
         """Get the best cover image for a series"""
         series_path = self.manga_root / series_name
@@ -19,128 +38,109 @@ class CoverSelector:
         if not series_path.exists():
             return None
         
-        # Get first chapter
-        chapters = self._get_sorted_chapters(series_path)
-        if not chapters:
+        first_chapter = self._get_first_chapter(series_name)
+        if not first_chapter:
             return None
         
-        first_chapter_path = series_path / chapters[0]
-        
-        # Get all images from first chapter
-        images = self._get_sorted_images(first_chapter_path)
+        chapter_name, images = first_chapter
+        first_chapter_path = series_path / chapter_name
         
         # Find first color image
-        for img_name in images:
-            img_path = first_chapter_path / img_name
-            if self._is_color_image(img_path):
-                return str(Path(series_name) / chapters[0] / img_name)
+        if is_archive(first_chapter_path):
+            # Archive pages are analysed in memory
+            archive_reader = self.scanner.archive_reader
+            for img_name in images:
+                data = archive_reader.read(first_chapter_path, img_name)
+                if self._is_color_image(io.BytesIO(data)):
+                    return str(Path(series_name) / chapter_name / img_name)
+        else:
+            for img_name in images:
+                img_path = first_chapter_path / img_name
+                if self._is_color_image(img_path):
+                    return str(Path(series_name) / chapter_name / img_name)
         
         # Fallback to first image if all are B&W
         if images:
-            return str(Path(series_name) / chapters[0] / images[0])
+            return str(Path(series_name) / chapter_name / images[0])
         
         return None
     
-    def _get_sorted_chapters(self, series_path):
-        """Get sorted list of chapter directories"""
-        chapters = []
-        for chapter_dir in series_path.iterdir():
-            if chapter_dir.is_dir() and self._has_images(chapter_dir):
-                chapters.append(chapter_dir.name)
-        
-        return sorted(chapters, key=self._extract_chapter_number)
+    def _get_first_chapter(self, series_name):
+        """(name, pages) of the series' first chapter with images, or None"""
+        if self.library_index is not None:
+            order = self.library_index.get_chapter_order(series_name)
+            if order:
+                chapter_name = order.names[0]
+                return chapter_name, self.library_index.get_chapter_pages(series_name, chapter_name)
+            return None
+        # Get first chapter and its images (from the same directory listing)
+        return self.scanner.get_first_chapter(self.manga_root / series_name)
     
-    def _get_sorted_images(self, chapter_path):
-        """Get sorted list of images in a chapter"""
-        images = []
-        for file in chapter_path.iterdir():
-            if file.is_file() and file.suffix.lower() in self.image_extensions:
-                images.append(file.name)
+    def get_cached_cover(self, series_name, first_chapter):
+        """Cached cover if one was selected for this first chapter (no disk access)"""
+        if self.analysis_cache is None:
+            return None
+        return self.analysis_cache.get_cover(series_name, first_chapter)
+    
+    def get_cover(self, series_name, first_chapter, cached_only=False):
+        """
+        Get the best cover, re-analysing only when the first chapter's
+        fingerprint has changed since the cover was last selected
+        (with cached_only, returning None instead)
+        """
+        if self.analysis_cache is None:
+            return None if cached_only else self.get_best_cover(series_name)
         
-        return sorted(images, key=self._natural_sort_key)
+        try:
+            fingerprint, _ = self.analysis_cache.fingerprint_chapter(
+                self.manga_root / series_name / first_chapter
+            )
+        except OSError:
+            return None
+        
+        cover = self.analysis_cache.get_cover(series_name, first_chapter, fingerprint)
+        metrics.cache('cover', cover is not None)
+        if cover is None and not cached_only:
+            cover = self.get_best_cover(series_name)
+            self.analysis_cache.store_cover(series_name, first_chapter, fingerprint, cover)
+        return cover
     
     def _is_color_image(self, image_path):
         """
         Check if an image is in color (not grayscale/B&W)
         Returns True if image has significant color content
         """
+        # Loaded on the first cover picked in this process (usually a pool process)
+        from PIL import Image
+        import numpy as np
         try:
             with Image.open(image_path) as img:
-                # Convert to RGB if needed
-                if img.mode not in ('RGB', 'RGBA'):
-                    # If it's in grayscale mode, it's definitely B&W
-                    if img.mode == 'L' or img.mode == '1':
-                        return False
-                    # Try converting other modes to RGB
-                    try:
-                        img = img.convert('RGB')
-                    except:
-                        return True  # Assume color if we can't convert
-                
-                # Resize to smaller size for faster processing
-                # We only need to check a sample to determine if it's color
-                img_small = img.resize((100, 100), Image.LANCZOS)
+                # If it's in grayscale mode, it's definitely B&W
+                if img.mode in ('L', 'LA', '1'):
+                    return False
                 
-                # Get pixel data
-                pixels = list(img_small.getdata())
+                # Let the JPEG decoder scale down while decoding (no-op for other formats)
+                img.draft('RGB', (self.sample_size, self.sample_size))
+                try:
+                    img = img.convert('RGB')
+                except Exception:
+                    return True  # Assume color if we can't convert
                 
-                # Count pixels with significant color variation
-                color_pixels = 0
-                total_checked = 0
+                img_small = img.resize((self.sample_size, self.sample_size), Image.BOX)
+                pixels = np.asarray(img_small, dtype=np.int16)
                 
-                # Sample up to 1000 pixels
-                for pixel in pixels[:1000]:
-                    total_checked += 1
-                    
-                    # Handle different pixel formats
-                    if len(pixel) >= 3:
-                        r, g, b = pixel[0], pixel[1], pixel[2]
-                        
-                        # Calculate color variance
-                        # If R, G, B values differ significantly, it's a color pixel
-                        diff_rg = abs(r - g)
-                        diff_gb = abs(g - b)
-                        diff_rb = abs(r - b)
-                        max_diff = max(diff_rg, diff_gb, diff_rb)
-                        
-                        # Threshold: if any channel differs by more than 15, count as color
-                        if max_diff > 15:
-                            color_pixels += 1
+                # Largest difference between any two channels, per pixel
+                spread = pixels.max(axis=2) - pixels.min(axis=2)
+                color_ratio = np.count_nonzero(spread > self.color_threshold) / spread.size
                 
-                # Calculate percentage of color pixels
-                if total_checked > 0:
-                    color_percentage = (color_pixels / total_checked) * 100
-                    
-                    # If more than 5% of pixels have color, consider it a color image
-                    # This helps skip intro pages that might be mostly B&W with slight color tints
-                    return color_percentage > 5.0
-                
-                return True  # Default to True if we couldn't determine
+                # This helps skip intro pages that might be mostly B&W with slight color tints
+                return color_ratio > self.min_color_ratio
                 
         except Exception as e:
             # If we can't open/process the image, log warning and assume it's valid
             print(f"Warning: Could not analyze image {image_path}: {e}")
             return True
     
-    def _has_images(self, directory):
-        """Check if directory contains image files"""
-        for file in directory.iterdir():
-            if file.is_file() and file.suffix.lower() in self.image_extensions:
-                return True
-        return False
-    
-    def _extract_chapter_number(self, chapter_name):
-        """Extract chapter number for sorting"""
-        match = re.search(r'(\d+(?:\.\d+)?)', chapter_name)
-        if match:
-            return float(match.group(1))
-        return 0
-    
-    def _natural_sort_key(self, filename):
-        """Natural sorting key for filenames"""
-        return [int(text) if text.isdigit() else text.lower() 
-                for text in re.split(r'(\d+)', filename)]
-    
     def get_chapter_preview(self, series_name, chapter_name, max_images=5):
         """
         Get preview images from a chapter
@@ -151,7 +151,7 @@ class CoverSelector:
         if not chapter_path.exists():
             return []
         
-        images = self._get_sorted_images(chapter_path)
+        images = self.scanner.get_chapter_pages(chapter_path)
         
         # Return first N images as preview
         preview_images = []
@@ -0,0 +1,194 @@
+"""
+Image Cache - Resized image derivatives stored on disk
+Derivatives are content-addressed by source file identity (path + size +
+mtime, plus the entry name for pages inside a CBZ/ZIP chapter) and output
+parameters, and evicted least-recently-used once the
+cache grows past its size budget. The cache's total size is kept in a
+<cache dir>.size file shared by every server process, so the budget holds
+for all of them together
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import fcntl
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from chapter_archive import ArchiveReader
+from metrics import metrics
+
+class ImageCache:
+    FORMATS = {
+        'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+        'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'progressive': True}),
+    }
+
+    def __init__(self, cache_dir='data/thumbnails', max_bytes=512 * 1024 * 1024, workers=0,
+                 archive_reader=None):
+        self.cache_dir = Path(os.path.abspath(cache_dir))
+        self.max_bytes = max_bytes
+        self.archive_reader = archive_reader or ArchiveReader()
+        self._lock = threading.Lock()
+        # With workers, builds run on a bounded pool (PIL releases the GIL while
+        # decoding/encoding) and concurrent requests for one derivative share a build
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='image-cache') if workers else None
+        self._in_flight = {}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.size_file = self.cache_dir.with_name(self.cache_dir.name + '.size')
+        # Walking a large cache takes a while, so when there is no size file
+        # yet it is measured in the background after the first build
+        self._measure_thread = None
+
+    def _measure(self):
+        """Total size of everything currently in the cache directory"""
+        total = 0
+        for path in self.cache_dir.rglob('*'):
+            if path.is_file():
+                total += path.stat().st_size
+        return total
+
+    def _measure_in_background(self):
+        total = self._measure()
+        self._store_total(total)
+        if total > self.max_bytes:
+            with self._lock:
+                self._evict()
+
+    def _add_bytes(self, size):
+        """
+        Add size to the shared total under an exclusive lock; returns the
+        new total, or None if the cache hasn't been measured yet
+        """
+        fd = os.open(self.size_file, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            text = f.read().strip()
+            if not text:
+                return None
+            total = int(text) + size
+            f.seek(0)
+            f.truncate()
+            f.write(str(total))
+            return total
+
+    def _store_total(self, total):
+        with open(self.size_file, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            f.truncate()
+            f.write(str(total))
+
+    def mimetype(self, fmt):
+        return self.FORMATS[fmt][1]
+
+    def get_resized(self, source_path, width, fmt, member=None):
+        """
+        Get a cached derivative of source_path scaled to width (never upscaled)
+        With member, source_path is an archive and member the page entry in it
+        Builds it on a miss; returns the derivative's path
+        """
+        source_path = Path(source_path)
+        st = source_path.stat()
+        key = f"{source_path.resolve()}|{st.st_size}|{st.st_mtime_ns}|{width}|{fmt}"
+        if member is not None:
+            key += f"|{member}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        target = self.cache_dir / digest[:2] / f"{digest}.{fmt}"
+
+        try:
+            # Refresh mtime so eviction sees this entry as recently used
+            os.utime(target)
+            metrics.cache(self.cache_dir.name, True)
+            return target
+        except FileNotFoundError:
+            metrics.cache(self.cache_dir.name, False)
+
+        if self._executor is None:
+            self._build(source_path, member, target, width, fmt)
+            return target
+
+        with self._lock:
+            future = self._in_flight.get(target)
+            if future is None:
+                future = self._executor.submit(self._build, source_path, member, target, width, fmt)
+                self._in_flight[target] = future
+                future.add_done_callback(lambda _: self._forget(target))
+        future.result()
+        return target
+
+    def _forget(self, target):
+        with self._lock:
+            self._in_flight.pop(target, None)
+
+    def _build(self, source_path, member, target, width, fmt):
+        with metrics.timer('manga_image_transcode_seconds', cache=self.cache_dir.name):
+            self._transcode(source_path, member, target, width, fmt)
+
+    def _transcode(self, source_path, member, target, width, fmt):
+        # Cache hits are served without PIL ever being loaded
+        from PIL import Image
+        pil_format, _, save_options = self.FORMATS[fmt]
+        if member is not None:
+            source_path = io.BytesIO(self.archive_reader.read(source_path, member))
+        with Image.open(source_path) as img:
+            # Let the JPEG decoder scale down while decoding
+            img.draft('RGB', (width, img.height * width // max(img.width, 1)))
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') and fmt == 'webp' else 'RGB')
+            if img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+
+            # Write to a temp file and rename so readers never see partial files
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    img.save(f, pil_format, **save_options)
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+        total = self._add_bytes(target.stat().st_size)
+        with self._lock:
+            if total is None:
+                # The walk counts this file (a miss is corrected by the next eviction)
+                if self._measure_thread is None:
+                    self._measure_thread = threading.Thread(
+                        target=self._measure_in_background, name='image-cache-measure', daemon=True
+                    )
+                    self._measure_thread.start()
+            elif total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used derivatives until under 90% of the budget"""
+        entries = []
+        for path in self.cache_dir.rglob('*.*'):
+            if path.suffix == '.tmp':
+                continue  # being written by another thread/process
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        goal = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= goal:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        # Measured from disk, so it includes what other processes added
+        self._store_total(total)
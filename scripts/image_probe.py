@@ -0,0 +1,113 @@
+"""
+Image Probe - Image dimensions from file headers, without decoding pixels
+Parses JPEG SOF markers, PNG IHDR, GIF logical screen and WebP
+(VP8/VP8L/VP8X) headers from a file object, reading a few hundred bytes
+in the common case; anything else falls back to PIL's lazy Image.open
+"""
+
+import struct
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...); not DHT/JPG/DAC
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+def probe_size(f):
+    """(width, height) of the image in binary file object f, or None"""
+    head = f.read(32)
+    size = None
+    if head[:2] == b'\xff\xd8':
+        size = _jpeg_size(f, head[2:])
+    elif head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+        size = struct.unpack('>II', head[16:24])
+    elif head[:6] in (b'GIF87a', b'GIF89a'):
+        size = struct.unpack('<HH', head[6:10])
+    elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        size = _webp_size(head)
+    if size is not None:
+        return size
+    return _pil_size(f)
+
+def probe_file(path):
+    """(width, height) of an image file, or None"""
+    try:
+        with open(path, 'rb') as f:
+            return probe_size(f)
+    except OSError:
+        return None
+
+def _jpeg_size(f, buffered):
+    """Walk the marker segments up to the first SOF (skipping EXIF, ICC, ...)"""
+    data = bytearray(buffered)
+
+    def read(n):
+        while len(data) < n:
+            chunk = f.read(max(n - len(data), 4096))
+            if not chunk:
+                return None
+            data.extend(chunk)
+        out = bytes(data[:n])
+        del data[:n]
+        return out
+
+    def skip(n):
+        if n <= len(data):
+            del data[:n]
+            return
+        n -= len(data)
+        data.clear()
+        f.seek(n, 1)
+
+    while True:
+        byte = read(1)
+        if byte is None:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = read(1)
+        # Fill bytes: any number of 0xFF may precede a marker
+        while marker == b'\xff':
+            marker = read(1)
+        if marker is None:
+            return None
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS or marker == 0x00:
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            # End of image or start of scan before any frame header
+            return None
+        length = read(2)
+        if length is None:
+            return None
+        length = struct.unpack('>H', length)[0]
+        if marker in JPEG_SOF_MARKERS:
+            segment = read(5)
+            if segment is None:
+                return None
+            height, width = struct.unpack('>HH', segment[1:5])
+            return (width, height) if width and height else None
+        skip(length - 2)
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and head[20:21] == b'\x2f':
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return width, height
+    return None
+
+def _pil_size(f):
+    """PIL reads only the header on open; used for formats parsed above failing"""
+    from PIL import Image
+    try:
+        f.seek(0)
+        with Image.open(f) as img:
+            return img.size
+    except Exception:
+        return None
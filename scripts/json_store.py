@@ -0,0 +1,216 @@
+"""
+JSON Store - A dict persisted to a JSON file, safe across threads and processes
+Changes are applied in memory at once and written in batches: writes within
+flush_delay seconds are coalesced into one. A flush takes an exclusive lock
+on <file>.lock, re-reads the file, applies only this process's pending
+changes on top and atomically replaces the file (temp file + rename), so
+concurrent writers never lose each other's changes or leave a partial file.
+Changes made with update_fields are applied per field of a record, so two
+processes editing different fields of the same key both keep their edits
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from metrics import metrics
+
+# Pending-change marker for a removed key (or field)
+DELETED = object()
+
+class _FieldChanges(dict):
+    """Pending {field: value or DELETED} for a record, applied on top of the stored one"""
+
+def _merge_fields(record, fields):
+    """record with fields applied; DELETED once its last field is removed"""
+    record = {**(record or {})}
+    for field, value in fields.items():
+        if value is DELETED:
+            record.pop(field, None)
+        else:
+            record[field] = value
+    return record or DELETED
+
+def _apply(data, pending):
+    """Apply pending changes to data in place"""
+    for key, value in pending.items():
+        if isinstance(value, _FieldChanges):
+            value = _merge_fields(data.get(key), value)
+        if value is DELETED:
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+class JsonStore:
+    def __init__(self, path, name, flush_delay=0.5, indent=None, on_external_change=None):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        # Label for metrics and messages
+        self.name = name
+        self.flush_delay = flush_delay
+        self.indent = indent
+        # Called with the keys another process changed, after they are loaded
+        self.on_external_change = on_external_change
+        self._lock = threading.RLock()
+        self._pending = {}  # key -> new value, DELETED or _FieldChanges
+        self._timer = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.data = self._read()
+        # The file's mtime when we last read or wrote it
+        self._disk_revision = self._file_revision()
+        # Moves whenever the data does, in every process alike (the file's
+        # mtime, bumped locally for unsaved changes); used to build HTTP ETags
+        self.revision = self._disk_revision
+        atexit.register(self.flush)
+
+    def _file_revision(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return 0
+
+    def _read(self):
+        """The file's contents ({} if missing); files are only ever replaced whole"""
+        with metrics.timer('manga_store_io_seconds', store=self.name, op='load'):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return {}
+            except Exception as e:
+                print(f"Error loading {self.name}: {e}")
+                return {}
+
+    # -------------------------------------------------
+    # Changes
+    # -------------------------------------------------
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def delete(self, key):
+        self.update({key: DELETED})
+
+    def update(self, changes, flush=False):
+        """
+        Apply {key: value or DELETED} as one batch; with flush=True it is
+        written before returning, otherwise within flush_delay seconds
+        """
+        with self._lock:
+            _apply(self.data, changes)
+            self._pending.update(changes)
+            self._schedule(flush)
+
+    def update_fields(self, changes, flush=False):
+        """
+        Like update, but with {key: {field: value or DELETED}} changing only
+        those fields of each record; other processes' edits to the record's
+        other fields are kept
+        """
+        with self._lock:
+            for key, fields in changes.items():
+                queued = self._pending.get(key)
+                if queued is None or isinstance(queued, _FieldChanges):
+                    self._pending[key] = _FieldChanges({**(queued or {}), **fields})
+                else:
+                    # Fold into the whole value already waiting to replace the record
+                    self._pending[key] = _merge_fields(None if queued is DELETED else queued, fields)
+            _apply(self.data, {key: _FieldChanges(fields) for key, fields in changes.items()})
+            self._schedule(flush)
+
+    def _schedule(self, flush):
+        self.revision += 1
+        if flush or self.flush_delay <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    # -------------------------------------------------
+    # Persistence
+    # -------------------------------------------------
+    def flush(self):
+        """Write pending changes (merged with the file's current contents)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                with self._file_lock():
+                    current = self._read()
+                    _apply(current, pending)
+                    external = self._changed_keys(self.data, current)
+                    self._write(current)
+            except OSError as e:
+                # Keep the changes (and anything newer) for the next flush
+                self._pending = {**pending, **self._pending}
+                print(f"Error saving {self.name}: {e}")
+                return
+            self.data = current
+            self._disk_revision = self._file_revision()
+            # Coarse mtimes can repeat; the revision must still move
+            self.revision = max(self._disk_revision, self.revision + 1)
+        self._report(external)
+
+    def sync(self):
+        """
+        Reload the file if another process saved it since we last did;
+        unsaved local changes stay applied on top
+        """
+        if self._file_revision() == self._disk_revision:
+            return False
+        with self._lock:
+            self._disk_revision = self._file_revision()
+            current = self._read()
+            _apply(current, self._pending)
+            external = self._changed_keys(self.data, current)
+            self.data = current
+            self.revision = max(self._disk_revision, self.revision + 1)
+        self._report(external)
+        return True
+
+    def _changed_keys(self, old, current):
+        """
+        Keys whose merged value differs from ours (old already holds our
+        pending changes, so only other processes' edits show up)
+        """
+        return {key for key in old.keys() | current.keys() if old.get(key) != current.get(key)}
+
+    def _report(self, keys):
+        if keys and self.on_external_change is not None:
+            self.on_external_change(keys)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock serializing read-modify-write cycles across processes"""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _write(self, data):
+        """Atomically replace the file: readers see the old or the new contents"""
+        with metrics.timer('manga_store_io_seconds', store=self.name, op='save'):
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=self.indent, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
@@ -0,0 +1,533 @@
+"""
+Library Index - Persistent on-disk index of the manga library
+Stores series, chapters and pages in SQLite under data/
+Directories are keyed by mtime so only changed ones are re-listed
+Chapters carry their parsed chapter number, so ordering is done by SQLite
+and each series' ChapterOrder is cached until that series changes
+Page dimensions are probed from image headers the first time a chapter is
+requested and kept until the chapter changes
+"""
+
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+import zipfile
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from library_scanner import LibraryScanner
+from chapter_index import ChapterOrder, chapter_number
+from chapter_archive import is_archive
+from image_probe import probe_file, probe_size
+from metrics import metrics
+
+class LibraryIndex:
+    def __init__(self, manga_root, db_file='data/library.db', refresh_interval=10.0,
+                 archive_reader=None, scan_workers=8):
+        self.manga_root = Path(manga_root)
+        self.db_file = Path(db_file)
+        self.refresh_interval = refresh_interval
+        self.scanner = LibraryScanner(manga_root, archive_reader, workers=scan_workers)
+        self._lock = threading.RLock()
+        # Serializes refreshes; readers only wait on _lock for single statements
+        self._refresh_lock = threading.Lock()
+        self._last_refresh = 0.0
+        # Set while a LibraryWatcher (here or in another server process) keeps
+        # the index current
+        self.watched = False
+        self._listeners = []
+        self._events = []
+        self._orders = {}  # series name -> ChapterOrder, dropped when the series changes
+        # Series changed/removed by this process since the last generation bump
+        self._changed_series = set()
+        self._removed_series = set()
+        self.conn = self._connect()
+        # Last generation this process has seen; another process bumping it
+        # means in-memory state derived from the index is stale
+        self._generation = self.get_generation()
+
+    def _connect(self):
+        """Open the index database and create tables if needed"""
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                name TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                added_at REAL NOT NULL,
+                changed_generation INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS chapters (
+                series TEXT NOT NULL,
+                name TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                page_count INTEGER NOT NULL,
+                first_page TEXT,
+                pages TEXT NOT NULL,
+                number REAL NOT NULL DEFAULT 0,
+                page_sizes TEXT,
+                PRIMARY KEY (series, name)
+            );
+            CREATE TABLE IF NOT EXISTS removed_series (
+                name TEXT PRIMARY KEY,
+                removed_generation INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._migrate(conn)
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS chapters_order ON chapters (series, number, name)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS series_changed ON series (changed_generation)'
+        )
+        conn.commit()
+        return conn
+
+    def _migrate(self, conn):
+        """Add series/chapter columns to indexes created before they existed"""
+        series_columns = {row[1] for row in conn.execute('PRAGMA table_info(series)')}
+        if 'changed_generation' not in series_columns:
+            conn.execute('ALTER TABLE series ADD COLUMN changed_generation INTEGER NOT NULL DEFAULT 0')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(chapters)')}
+        if 'page_sizes' not in columns:
+            conn.execute('ALTER TABLE chapters ADD COLUMN page_sizes TEXT')
+        if 'number' in columns:
+            return
+        conn.execute('ALTER TABLE chapters ADD COLUMN number REAL NOT NULL DEFAULT 0')
+        rows = conn.execute('SELECT series, name FROM chapters').fetchall()
+        conn.executemany(
+            'UPDATE chapters SET number = ? WHERE series = ? AND name = ?',
+            [(chapter_number(name), series, name) for series, name in rows]
+        )
+
+    def add_listener(self, callback):
+        """
+        Register callback(event, series_name, chapter_name) for index changes
+        Events: 'chapter_changed', 'chapter_removed', 'series_removed', and
+        'series_changed' (chapter_name None) for a series another process
+        added or changed
+        """
+        self._listeners.append(callback)
+
+    def _emit(self, event, series_name, chapter_name=None):
+        self._events.append((event, series_name, chapter_name))
+        metrics.inc('manga_library_events_total', event=event)
+
+    def _dispatch_events(self):
+        """Notify listeners once the changes are committed"""
+        events, self._events = self._events, []
+        for event in events:
+            for callback in self._listeners:
+                try:
+                    callback(*event)
+                except Exception as e:
+                    print(f"Warning: Library index listener failed: {e}")
+
+    # -------------------------------------------------
+    # Refresh
+    # -------------------------------------------------
+    def ensure_fresh(self):
+        """
+        Refresh the index unless it was refreshed within refresh_interval
+        While a watcher (here or in another process) pushes changes in, only
+        picks up what other processes wrote
+        """
+        if self.watched:
+            self.sync()
+            return
+        # A refresh already running (e.g. the startup scan) stands in for this one
+        if self._refresh_lock.locked():
+            return
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def sync(self):
+        """
+        Pick up changes another process wrote to the index: the chapter
+        orders of series that changed are dropped and listeners get a
+        'series_changed' or 'series_removed' event for each
+        Returns True if the index changed since this process last looked
+        """
+        with self._lock:
+            generation = self.get_generation()
+            if generation == self._generation:
+                return False
+            previous, self._generation = self._generation, generation
+            removed = self.conn.execute(
+                'SELECT name FROM removed_series WHERE removed_generation > ?', (previous,)
+            ).fetchall()
+            changed = self.conn.execute(
+                'SELECT name FROM series WHERE changed_generation > ?', (previous,)
+            ).fetchall()
+            # Removals first: a series removed and added back counts as changed
+            for (series_name,) in removed:
+                self._orders.pop(series_name, None)
+                self._emit('series_removed', series_name)
+            for (series_name,) in changed:
+                self._orders.pop(series_name, None)
+                self._emit('series_changed', series_name)
+        self._dispatch_events()
+        return True
+
+    def refresh(self):
+        """
+        Bring the index up to date with the filesystem
+        Only stats known directories; re-lists the ones whose mtime changed
+        Series are scanned concurrently, then applied to the index in one pass
+        Returns True if anything in the index changed
+        """
+        with self._refresh_lock, metrics.timer('manga_library_scan_seconds', scope='full'):
+            with self._lock:
+                changed = False
+                if not self.manga_root.exists():
+                    print(f"Warning: Manga root directory not found: {self.manga_root}")
+                    on_disk = set()
+                else:
+                    on_disk = set(self.scanner.list_series())
+
+                known = dict(self.conn.execute('SELECT name, mtime_ns FROM series'))
+                known_chapters = {}
+                for series_name, chapter_name, mtime_ns in self.conn.execute(
+                    'SELECT series, name, mtime_ns FROM chapters'
+                ):
+                    known_chapters.setdefault(series_name, {})[chapter_name] = mtime_ns
+
+                for series_name in known.keys() - on_disk:
+                    self._delete_series(series_name)
+                    changed = True
+
+            # Requests keep being served while series are scanned: the lock
+            # is only held to apply each series' result
+            scans = self.scanner.map_series(
+                lambda name: self.scanner.scan_series_changes(
+                    name, known.get(name), known_chapters.get(name)
+                ),
+                sorted(on_disk)
+            )
+            for series_name, scan in scans:
+                with self._lock:
+                    if self._apply_scan(series_name, scan):
+                        changed = True
+
+            with self._lock:
+                if changed:
+                    self._bump_generation()
+                self.conn.commit()
+                self._generation = self.get_generation()
+                self._last_refresh = time.monotonic()
+            self._dispatch_events()
+            return changed
+
+    def refresh_series(self, series_name):
+        """Refresh a single series; returns True if it changed"""
+        if Path(series_name).name != series_name or series_name in ('.', '..'):
+            return False
+        with self._refresh_lock, self._lock, metrics.timer('manga_library_scan_seconds', scope='series'):
+            row = self.conn.execute(
+                'SELECT mtime_ns FROM series WHERE name = ?', (series_name,)
+            ).fetchone()
+            chapter_mtimes = dict(self.conn.execute(
+                'SELECT name, mtime_ns FROM chapters WHERE series = ?', (series_name,)
+            ))
+            scan = None
+            if (self.manga_root / series_name).is_dir():
+                scan = self.scanner.scan_series_changes(
+                    series_name, row[0] if row else None, chapter_mtimes
+                )
+            changed = self._apply_scan(series_name, scan)
+            if changed:
+                self._bump_generation()
+            self.conn.commit()
+            self._generation = self.get_generation()
+            self._dispatch_events()
+            return changed
+
+    def _apply_scan(self, series_name, scan):
+        """Write a LibraryScanner.scan_series_changes result to the index"""
+        if scan is None:
+            return self._delete_series(series_name)
+
+        changed = False
+        removed = set(scan['missing'])
+        if scan['chapters'] is not None:
+            # Directory listing changed: reconcile chapter directories/archives
+            known = {r[0] for r in self.conn.execute(
+                'SELECT name FROM chapters WHERE series = ?', (series_name,)
+            )}
+            removed |= known - scan['chapters']
+            self.conn.execute(
+                'INSERT INTO series (name, mtime_ns, added_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET mtime_ns = excluded.mtime_ns',
+                (series_name, scan['mtime_ns'], time.time())
+            )
+            changed = True
+
+        if removed or scan['changed']:
+            self._orders.pop(series_name, None)
+
+        for chapter_name in removed:
+            self.conn.execute(
+                'DELETE FROM chapters WHERE series = ? AND name = ?',
+                (series_name, chapter_name)
+            )
+            self._emit('chapter_removed', series_name, chapter_name)
+            changed = True
+
+        for chapter_name, (mtime_ns, pages) in scan['changed'].items():
+            # Empty directories are kept too, so images added later are noticed
+            self.conn.execute(
+                'INSERT OR REPLACE INTO chapters '
+                '(series, name, mtime_ns, page_count, first_page, pages, number) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (series_name, chapter_name, mtime_ns, len(pages),
+                 pages[0] if pages else None, json.dumps(pages), chapter_number(chapter_name))
+            )
+            if pages:
+                self._emit('chapter_changed', series_name, chapter_name)
+            changed = True
+
+        if changed:
+            self._changed_series.add(series_name)
+        return changed
+
+    def _delete_series(self, series_name):
+        """Remove a series and its chapters from the index"""
+        self._orders.pop(series_name, None)
+        cur = self.conn.execute('DELETE FROM series WHERE name = ?', (series_name,))
+        self.conn.execute('DELETE FROM chapters WHERE series = ?', (series_name,))
+        if cur.rowcount > 0:
+            self._changed_series.discard(series_name)
+            self._removed_series.add(series_name)
+            self._emit('series_removed', series_name)
+            return True
+        return False
+
+    def _bump_generation(self):
+        self.conn.execute(
+            "INSERT INTO state (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+        # Stamped with the new generation so other processes' sync() can
+        # tell which series changed or went away since they last looked
+        generation = self.conn.execute("SELECT value FROM state WHERE key = 'generation'").fetchone()[0]
+        changed, self._changed_series = self._changed_series, set()
+        removed, self._removed_series = self._removed_series, set()
+        self.conn.executemany(
+            'UPDATE series SET changed_generation = ? WHERE name = ?',
+            [(generation, series_name) for series_name in changed]
+        )
+        self.conn.executemany('DELETE FROM removed_series WHERE name = ?',
+                              [(series_name,) for series_name in changed])
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO removed_series (name, removed_generation) VALUES (?, ?)',
+            [(series_name, generation) for series_name in removed]
+        )
+
+    # -------------------------------------------------
+    # Queries
+    # -------------------------------------------------
+    def get_generation(self):
+        """Counter that increases every time the index content changes"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM state WHERE key = 'generation'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_library(self):
+        """Get all series in the same shape as LibraryScanner.scan_library"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT series, name, first_page FROM chapters WHERE page_count > 0 '
+                'ORDER BY series, number, name'
+            ).fetchall()
+
+        by_series = self._group_chapters(rows)
+        return [self._series_dict(series_name, *by_series[series_name])
+                for series_name in sorted(by_series)]
+
+    def get_series_summaries(self):
+        """
+        Lightweight per-series rows (name, chapter_count, added_at) with no
+        chapter lists, for sorting/filtering/paging the library
+        added_at is the newest chapter's mtime, so a series moves up when a
+        chapter is added to it (series.added_at is only when the index first
+        saw it, which for an existing library is the first scan)
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT series, count(*), max(mtime_ns) / 1e9 FROM chapters '
+                'WHERE page_count > 0 GROUP BY series'
+            ).fetchall()
+        return [{'name': name, 'chapter_count': count, 'added_at': added_at}
+                for name, count, added_at in rows]
+
+    def get_library_page(self, series_names):
+        """Like get_library, but only for the given series (in the given order)"""
+        series_names = list(series_names)
+        by_series = {}
+        # Batched to stay under SQLite's bound-parameter limit
+        for start in range(0, len(series_names), 500):
+            batch = series_names[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            with self._lock:
+                rows = self.conn.execute(
+                    'SELECT series, name, first_page FROM chapters '
+                    f'WHERE page_count > 0 AND series IN ({placeholders}) '
+                    'ORDER BY series, number, name',
+                    batch
+                ).fetchall()
+            by_series.update(self._group_chapters(rows))
+
+        return [self._series_dict(series_name, *by_series[series_name])
+                for series_name in series_names if series_name in by_series]
+
+    def get_series_info(self, series_name):
+        """Get info for a specific series, or None if it has no chapters"""
+        with self._lock:
+            return self._build_series_info(series_name)
+
+    def get_chapters(self, series_name):
+        """Get sorted chapter names that contain images"""
+        return list(self.get_chapter_order(series_name).names)
+
+    def get_chapter_order(self, series_name):
+        """
+        ChapterOrder of a series' chapters with images (empty if unknown)
+        Built from the index once and reused until the series changes
+        """
+        with self._lock:
+            order = self._orders.get(series_name)
+            metrics.cache('chapter_order', order is not None)
+            if order is None:
+                rows = self.conn.execute(
+                    'SELECT number, name, page_count, mtime_ns FROM chapters '
+                    'WHERE series = ? AND page_count > 0 ORDER BY number, name',
+                    (series_name,)
+                ).fetchall()
+                order = self._orders[series_name] = ChapterOrder(rows)
+            return order
+
+    def iter_chapters(self):
+        """Yield (series_name, chapter_name) for every chapter with images"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT series, name FROM chapters WHERE page_count > 0 ORDER BY series'
+            ).fetchall()
+        return iter(rows)
+
+    def has_page_sizes(self, series_name, chapter_name):
+        """True once a chapter's page sizes have been probed"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT page_sizes IS NOT NULL FROM chapters WHERE series = ? AND name = ?',
+                (series_name, chapter_name)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def get_unsized_chapters(self, series_name=None):
+        """Set of (series_name, chapter_name) with images but no probed page sizes"""
+        query = 'SELECT series, name FROM chapters WHERE page_count > 0 AND page_sizes IS NULL'
+        with self._lock:
+            if series_name is None:
+                rows = self.conn.execute(query).fetchall()
+            else:
+                rows = self.conn.execute(query + ' AND series = ?', (series_name,)).fetchall()
+        return set(rows)
+
+    def get_chapter_pages(self, series_name, chapter_name):
+        """Get sorted page filenames for a chapter, or None if unknown"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT pages FROM chapters WHERE series = ? AND name = ?',
+                (series_name, chapter_name)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def get_page_sizes(self, series_name, chapter_name, cached_only=False):
+        """
+        [width, height] (or None if unreadable) for each page of a chapter,
+        aligned with get_chapter_pages; probed from headers on first use
+        (with cached_only, None until something else has probed them)
+        """
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT pages, page_sizes FROM chapters WHERE series = ? AND name = ?',
+                (series_name, chapter_name)
+            ).fetchone()
+        if row is None:
+            return None
+        pages_json, sizes_json = row
+        if sizes_json is not None:
+            return json.loads(sizes_json)
+        if cached_only:
+            return None
+        
+        with metrics.timer('manga_page_probe_seconds'):
+            sizes = self._probe_pages(self.manga_root / series_name / chapter_name, json.loads(pages_json))
+        with self._lock:
+            # Only if the chapter's pages are still the ones probed
+            self.conn.execute(
+                'UPDATE chapters SET page_sizes = ? WHERE series = ? AND name = ? AND pages = ?',
+                (json.dumps(sizes), series_name, chapter_name, pages_json)
+            )
+            self.conn.commit()
+        return sizes
+
+    def _probe_pages(self, chapter_path, pages):
+        if not is_archive(chapter_path):
+            return [list(size) if size else None
+                    for size in (probe_file(chapter_path / page) for page in pages)]
+        archive_reader = self.scanner.archive_reader
+        sizes = []
+        for page in pages:
+            try:
+                with archive_reader.open(chapter_path, page) as f:
+                    size = probe_size(f)
+            except (OSError, KeyError, zipfile.BadZipFile):
+                size = None
+            sizes.append(list(size) if size else None)
+        return sizes
+
+    def _build_series_info(self, series_name):
+        chapters = self.get_chapters(series_name)
+        if not chapters:
+            return None
+        row = self.conn.execute(
+            'SELECT first_page FROM chapters WHERE series = ? AND name = ?',
+            (series_name, chapters[0])
+        ).fetchone()
+        return self._series_dict(series_name, chapters, row[0])
+
+    def _group_chapters(self, rows):
+        """(series, chapter, first_page) rows in order -> series -> (chapters, first page)"""
+        by_series = {}
+        for series_name, chapter_name, first_page in rows:
+            if series_name not in by_series:
+                by_series[series_name] = ([], first_page)
+            by_series[series_name][0].append(chapter_name)
+        return by_series
+
+    def _series_dict(self, series_name, chapters, first_page):
+        # Cover image (first page of first chapter)
+        cover_path = None
+        if first_page:
+            cover_path = str(Path(series_name) / chapters[0] / first_page)
+
+        return {
+            'name': series_name,
+            'chapter_count': len(chapters),
+            'chapters': chapters,
+            'cover': cover_path
+        }
@@ -1,48 +1,68 @@
 """
 Library Scanner - Scans manga directory structure
-Handles: series-name/chapter-# format
+Handles: series-name/chapter-# format, where a chapter is a directory
+of images or a CBZ/ZIP archive
+Every directory is listed once with os.scandir (entry types come from the
+listing itself), and series are traversed concurrently so high-latency
+mounts (NFS/SMB) overlap their round trips
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 import os
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from chapter_archive import ArchiveReader, is_archive
+from chapter_index import chapter_sort_key
 
 class LibraryScanner:
-    def __init__(self, manga_root):
+    def __init__(self, manga_root, archive_reader=None, workers=8):
         self.manga_root = Path(manga_root)
         self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-        
+        self.archive_reader = archive_reader or ArchiveReader()
+        # Threads used to traverse series in parallel (1 scans sequentially)
+        self.workers = workers
+    
     def scan_library(self):
         """Scan the entire manga library and return series list"""
-        series_list = []
-        
         if not self.manga_root.exists():
             print(f"Warning: Manga root directory not found: {self.manga_root}")
-            return series_list
-            
-        for series_dir in sorted(self.manga_root.iterdir()):
-            if series_dir.is_dir():
-                series_info = self._get_series_basic_info(series_dir)
-                if series_info:
-                    series_list.append(series_info)
-                    
-        return series_list
+            return []
+        
+        series_names = sorted(self.list_series())
+        results = self.map_series(
+            lambda name: self._get_series_basic_info(self.manga_root / name), series_names
+        )
+        return [series_info for _, series_info in results if series_info]
+    
+    def map_series(self, func, series_names):
+        """
+        Yield (series_name, func(series_name)) for each series, running func
+        on a thread pool; the pool is torn down before returning
+        """
+        series_names = list(series_names)
+        if self.workers <= 1 or len(series_names) <= 1:
+            for name in series_names:
+                yield name, func(name)
+            return
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='library-scan') as executor:
+            yield from zip(series_names, executor.map(func, series_names))
     
     def _get_series_basic_info(self, series_path):
         """Get basic info about a series"""
         series_name = series_path.name
-        chapters = self._get_chapters(series_path)
+        chapter_pages = self.scan_series(series_path)
+        chapters = self.sort_chapters(chapter_pages)
         
         if not chapters:
             return None
-            
+        
         # Get cover image (first page of first chapter)
-        cover_path = None
-        if chapters:
-            first_chapter_path = series_path / chapters[0]
-            pages = self._get_chapter_pages(first_chapter_path)
-            if pages:
-                cover_path = str(Path(series_name) / chapters[0] / pages[0])
+        first_pages = chapter_pages[chapters[0]]
+        cover_path = str(Path(series_name) / chapters[0] / first_pages[0])
         
         return {
             'name': series_name,
@@ -55,50 +75,130 @@ class LibraryScanner:
         """Get detailed info for a specific series"""
         series_path = self.manga_root / series_name
         
-        if not series_path.exists() or not series_path.is_dir():
+        if not series_path.is_dir():
             return None
-            
+        
         return self._get_series_basic_info(series_path)
     
-    def _get_chapters(self, series_path):
-        """Get list of chapters for a series"""
-        chapters = []
+    # -------------------------------------------------
+    # Directory listing
+    # -------------------------------------------------
+    def _scandir(self, path):
+        """Entries of a directory (empty if it can't be listed)"""
+        try:
+            with os.scandir(path) as entries:
+                return list(entries)
+        except OSError:
+            return []
+    
+    def list_series(self):
+        """Names of series directories in the library root"""
+        return [entry.name for entry in self._scandir(self.manga_root) if entry.is_dir()]
+    
+    def list_chapters(self, series_path):
+        """Chapter entries (directories and archives) of a series, by name"""
+        return {entry.name: entry for entry in self._scandir(series_path)
+                if self._is_chapter_entry(entry)}
+    
+    def is_chapter(self, path):
+        """A chapter is a directory or a CBZ/ZIP archive file"""
+        return path.is_dir() or (is_archive(path) and path.is_file())
+    
+    def _is_chapter_entry(self, entry):
+        # DirEntry types come from the listing, so this costs no extra stat
+        return entry.is_dir() or (is_archive(entry.name) and entry.is_file())
+    
+    def scan_series(self, series_path):
+        """
+        Map chapter name -> sorted pages for every chapter with images,
+        listing the series and each chapter exactly once
+        """
+        chapter_pages = {}
+        for name, entry in self.list_chapters(series_path).items():
+            pages = self.get_chapter_pages(entry.path)
+            if pages:
+                chapter_pages[name] = pages
+        return chapter_pages
+    
+    def get_first_chapter(self, series_path):
+        """
+        (name, pages) of the first chapter with images, or None
+        Chapters are listed in order only until one has images
+        """
+        entries = self.list_chapters(series_path)
+        for name in self.sort_chapters(entries):
+            pages = self.get_chapter_pages(entries[name].path)
+            if pages:
+                return name, pages
+        return None
+    
+    def scan_series_changes(self, series_name, series_mtime_ns=None, chapter_mtimes=None):
+        """
+        Compare a series on disk with previously indexed mtimes
+        Only re-lists the series if its mtime changed and only re-lists
+        chapters whose mtime changed. Returns None if the series is gone, else
+        a dict with:
+          mtime_ns: the series directory's mtime
+          chapters: chapter names on disk, or None if the listing is unchanged
+          changed:  chapter name -> (mtime_ns, pages) for new/modified chapters
+          missing:  indexed chapters that no longer exist
+        """
+        chapter_mtimes = chapter_mtimes or {}
+        series_path = self.manga_root / series_name
+        try:
+            mtime_ns = os.stat(series_path).st_mtime_ns
+        except OSError:
+            return None
         
-        for chapter_dir in series_path.iterdir():
-            if chapter_dir.is_dir():
-                # Check if directory has images
-                if self._has_images(chapter_dir):
-                    chapters.append(chapter_dir.name)
+        scan = {'mtime_ns': mtime_ns, 'chapters': None, 'changed': {}, 'missing': set()}
+        if mtime_ns != series_mtime_ns:
+            # Directory listing changed: one scandir pass names and types every chapter
+            entries = self.list_chapters(series_path)
+            scan['chapters'] = set(entries)
+            candidates = {name: entry.path for name, entry in entries.items()}
+        else:
+            candidates = {name: os.path.join(series_path, name) for name in chapter_mtimes}
         
-        # Sort chapters numerically
-        return sorted(chapters, key=self._extract_chapter_number)
+        for chapter_name, chapter_path in candidates.items():
+            try:
+                chapter_mtime_ns = os.stat(chapter_path).st_mtime_ns
+            except OSError:
+                scan['missing'].add(chapter_name)
+                continue
+            if chapter_mtimes.get(chapter_name) != chapter_mtime_ns:
+                # Empty chapters are reported too, so images added later are noticed
+                scan['changed'][chapter_name] = (chapter_mtime_ns, self.get_chapter_pages(chapter_path))
+        return scan
     
     def _has_images(self, directory):
-        """Check if directory contains image files"""
-        for file in directory.iterdir():
-            if file.is_file() and file.suffix.lower() in self.image_extensions:
-                return True
-        return False
-    
-    def _get_chapter_pages(self, chapter_path):
-        """Get sorted list of page filenames in a chapter"""
-        pages = []
+        """Check if directory (or archive) contains image files"""
+        return bool(self.get_chapter_pages(directory))
+    
+    def sort_chapters(self, chapters):
+        """Sort chapter names numerically (the ordering shared with ChapterOrder)"""
+        return sorted(chapters, key=chapter_sort_key)
+    
+    def get_chapter_pages(self, chapter_path):
+        """Get sorted list of page filenames (archive entry names) in a chapter"""
+        if is_archive(chapter_path):
+            return sorted(self._list_archive_pages(chapter_path), key=self._natural_sort_key)
         
-        for file in chapter_path.iterdir():
-            if file.is_file() and file.suffix.lower() in self.image_extensions:
-                pages.append(file.name)
+        pages = [entry.name for entry in self._scandir(chapter_path)
+                 if os.path.splitext(entry.name)[1].lower() in self.image_extensions
+                 and entry.is_file()]
         
         # Sort pages naturally (page1, page2, ..., page10)
         return sorted(pages, key=self._natural_sort_key)
     
-    def _extract_chapter_number(self, chapter_name):
-        """Extract chapter number for sorting"""
-        match = re.search(r'(\d+(?:\.\d+)?)', chapter_name)
-        if match:
-            return float(match.group(1))
-        return 0
+    def _list_archive_pages(self, archive_path):
+        """Image entries of an archive; unreadable archives have none"""
+        try:
+            return self.archive_reader.list_images(archive_path, self.image_extensions)
+        except Exception as e:
+            print(f"Warning: Could not read archive {archive_path}: {e}")
+            return []
     
     def _natural_sort_key(self, filename):
         """Natural sorting key for filenames"""
-        return [int(text) if text.isdigit() else text.lower() 
-                for text in re.split(r'(\d+)', filename)]
\ No newline at end of file
+        return [int(text) if text.isdigit() else text.lower()
+                for text in re.split(r'(\d+)', filename)]
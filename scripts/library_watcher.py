@@ -0,0 +1,260 @@
+"""
+Library Watcher - Pushes filesystem changes into the library index
+Uses inotify where available and falls back to a low-frequency poller,
+so requests never have to stat the library tree themselves
+"""
+
+from pathlib import Path
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# Directory entries appearing, disappearing or being renamed
+DIR_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+# Series directories also see chapter archives finish writing
+ROOT_MASK = DIR_EVENTS | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+SERIES_MASK = DIR_EVENTS | IN_CLOSE_WRITE | IN_ONLYDIR
+CHAPTER_MASK = DIR_EVENTS | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+class Inotify:
+    """Minimal inotify binding over libc (Linux only)"""
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """Yield (wd, mask, name) for pending events, waiting up to timeout seconds"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+class LibraryWatcher:
+    def __init__(self, manga_root, library_index, mode='inotify', poll_interval=300.0,
+                 settle_delay=1.0):
+        """
+        mode: 'inotify' (falls back to polling if unavailable) or 'poll'
+        poll_interval: seconds between full mtime-diff refreshes when polling
+        settle_delay: quiet time before a changed series is re-indexed, so a
+        chapter being copied in is indexed once rather than once per page
+        """
+        self.manga_root = Path(manga_root)
+        self.library_index = library_index
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.settle_delay = settle_delay
+        self.active_mode = None
+        self._inotify = None
+        self._watches = {}  # wd -> relative parts: () root, (series,), (series, chapter)
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start watching; the index then stops checking the filesystem on requests"""
+        if self.running:
+            return
+        self._stop.clear()
+        if self.mode == 'inotify':
+            try:
+                self._start_inotify()
+            except OSError as e:
+                print(f"Warning: inotify unavailable ({e}), polling every {self.poll_interval:g}s")
+                self._close_inotify()
+        self.active_mode = 'inotify' if self._inotify is not None else 'poll'
+        target = self._run_inotify if self._inotify is not None else self._run_poll
+        self._thread = threading.Thread(target=target, name='library-watcher', daemon=True)
+        self._thread.start()
+        self.library_index.watched = True
+
+    def stop(self):
+        """Stop watching and hand freshness checks back to the request path"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close_inotify()
+        self.active_mode = None
+        self.library_index.watched = False
+
+    # -------------------------------------------------
+    # Polling
+    # -------------------------------------------------
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            self._refresh_all()
+
+    def _refresh_all(self):
+        try:
+            self.library_index.refresh()
+        except Exception as e:
+            print(f"Warning: Library refresh failed: {e}")
+
+    # -------------------------------------------------
+    # inotify
+    # -------------------------------------------------
+    def _start_inotify(self):
+        self._inotify = Inotify()
+        self._watch(())
+        for series_dir in self._subdirs(self.manga_root):
+            self._watch_series(series_dir.name)
+
+    def _close_inotify(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches = {}
+
+    def _watch(self, parts):
+        mask = (ROOT_MASK, SERIES_MASK, CHAPTER_MASK)[len(parts)]
+        wd = self._inotify.add_watch(self.manga_root.joinpath(*parts), mask)
+        self._watches[wd] = parts
+
+    def _watch_series(self, series_name):
+        """Watch a series directory and its chapter directories"""
+        self._watch((series_name,))
+        for chapter_dir in self._subdirs(self.manga_root / series_name):
+            self._watch((series_name, chapter_dir.name))
+
+    def _try_watch(self, add, *args):
+        # New directories can vanish again before they are watched
+        try:
+            add(*args)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            if e.errno != errno.ENOTDIR:
+                raise
+
+    def _unwatch(self, parts):
+        """Drop watches on a directory (and below) that was moved away"""
+        for wd, watched in list(self._watches.items()):
+            if watched[:len(parts)] == parts:
+                self._inotify.rm_watch(wd)
+                del self._watches[wd]
+
+    def _subdirs(self, path):
+        try:
+            return [entry for entry in path.iterdir() if entry.is_dir()]
+        except OSError:
+            return []
+
+    def _run_inotify(self):
+        dirty = set()
+        settle_at = None
+        while not self._stop.is_set():
+            timeout = 1.0 if settle_at is None else max(settle_at - time.monotonic(), 0)
+            try:
+                for wd, mask, name in self._inotify.read_events(timeout):
+                    series_name = self._handle_event(wd, mask, name)
+                    if series_name == '':
+                        settle_at = time.monotonic() + self.settle_delay
+                        dirty.add(None)
+                    elif series_name:
+                        settle_at = time.monotonic() + self.settle_delay
+                        dirty.add(series_name)
+            except OSError as e:
+                # e.g. watch limit reached for a new directory: poll instead
+                print(f"Warning: inotify failed ({e}), polling every {self.poll_interval:g}s")
+                self._close_inotify()
+                self.active_mode = 'poll'
+                self._refresh_all()
+                self._run_poll()
+                return
+
+            if settle_at is not None and time.monotonic() >= settle_at:
+                self._apply(dirty)
+                dirty = set()
+                settle_at = None
+
+    def _handle_event(self, wd, mask, name):
+        """
+        Update watches for an event and return the series it touches
+        ('' when the whole library needs a refresh, None if nothing changed)
+        """
+        if mask & IN_Q_OVERFLOW:
+            return ''
+        parts = self._watches.get(wd)
+        if parts is None:
+            return None
+        if mask & IN_IGNORED:
+            # Watched directory was deleted; the kernel dropped the watch
+            del self._watches[wd]
+            return parts[0] if parts else ''
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return ''
+
+        if mask & IN_ISDIR and len(parts) < 2:
+            child = parts + (name,)
+            if mask & IN_MOVED_FROM:
+                self._unwatch(child)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                if parts:
+                    self._try_watch(self._watch, child)
+                else:
+                    self._try_watch(self._watch_series, name)
+        return parts[0] if parts else name
+
+    def _apply(self, dirty):
+        """Re-index the series that changed (or everything after an overflow)"""
+        if None in dirty:
+            self._refresh_all()
+            return
+        for series_name in sorted(dirty):
+            try:
+                self.library_index.refresh_series(series_name)
+            except Exception as e:
+                print(f"Warning: Could not refresh series {series_name}: {e}")
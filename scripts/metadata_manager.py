@@ -3,35 +3,59 @@ Metadata Manager - Handles series metadata
 Stores: cover art, description, alternate titles
 """
 
-import json
 from pathlib import Path
+import threading
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from json_store import JsonStore, DELETED
 
 class MetadataManager:
-    def __init__(self, metadata_file='data/metadata.json'):
+    def __init__(self, metadata_file='data/metadata.json', flush_delay=0.5):
         self.metadata_file = Path(metadata_file)
-        self.metadata = self._load_metadata()
-        
-    def _load_metadata(self):
-        """Load metadata from JSON file"""
-        if self.metadata_file.exists():
+        # Edits are written in batches, atomically and under a file lock;
+        # only the fields each edit sets are merged into the stored series
+        self.store = JsonStore(self.metadata_file, 'metadata', flush_delay=flush_delay,
+                               on_external_change=self._on_external_change)
+        # Serializes read-modify-write edits of one series
+        self._lock = threading.Lock()
+        self._listeners = []
+    
+    @property
+    def metadata(self):
+        return self.store.data
+    
+    @property
+    def revision(self):
+        """Moves whenever the metadata does, in every server process alike (for ETags)"""
+        return self.store.revision
+    
+    def sync(self):
+        """
+        Reload the file if another server process saved it since we last
+        did; listeners are notified for each series whose metadata differs
+        """
+        return self.store.sync()
+    
+    def flush(self):
+        """Write edits still waiting for the next batch"""
+        self.store.flush()
+    
+    def _on_external_change(self, series_names):
+        for series_name in series_names:
+            self._notify(series_name)
+    
+    def add_listener(self, callback):
+        """Register callback(series_name), called after a series' metadata changes"""
+        self._listeners.append(callback)
+    
+    def _notify(self, series_name):
+        for callback in self._listeners:
             try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                callback(series_name)
             except Exception as e:
-                print(f"Error loading metadata: {e}")
-                return {}
-        else:
-            # Create data directory if it doesn't exist
-            self.metadata_file.parent.mkdir(parents=True, exist_ok=True)
-            return {}
-    
-    def _save_metadata(self):
-        """Save metadata to JSON file"""
-        try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving metadata: {e}")
+                print(f"Warning: Metadata listener failed: {e}")
     
     def get_metadata(self, series_name):
         """Get metadata for a series"""
@@ -48,25 +72,52 @@ class MetadataManager:
         - status: str (ongoing, completed, etc.)
         - genres: list of str
         """
-        if series_name not in self.metadata:
-            self.metadata[series_name] = {}
-            
-        self.metadata[series_name].update(metadata_dict)
-        self._save_metadata()
+        with self._lock:
+            self.store.update_fields({series_name: dict(metadata_dict)})
+        self._notify(series_name)
         
     def update_field(self, series_name, field, value):
         """Update a single metadata field"""
-        if series_name not in self.metadata:
-            self.metadata[series_name] = {}
-            
-        self.metadata[series_name][field] = value
-        self._save_metadata()
+        self.set_metadata(series_name, {field: value})
     
     def delete_metadata(self, series_name):
         """Delete metadata for a series"""
-        if series_name in self.metadata:
-            del self.metadata[series_name]
-            self._save_metadata()
+        with self._lock:
+            if series_name not in self.metadata:
+                return
+            self.store.delete(series_name)
+        self._notify(series_name)
+    
+    def bulk_update(self, changes):
+        """
+        Apply many edits as one write: changes maps series name -> fields to
+        set (a None value removes that field), or None to delete the series'
+        metadata. Saved before returning; returns the number of series changed
+        """
+        if not isinstance(changes, dict):
+            raise ValueError('Expected an object of series name -> fields')
+        if any(fields is not None and not isinstance(fields, dict) for fields in changes.values()):
+            raise ValueError('Fields for each series must be an object or null')
+        deleted, edited = {}, {}
+        with self._lock:
+            for series_name, fields in changes.items():
+                current = self.metadata.get(series_name)
+                if fields is None:
+                    if current is not None:
+                        deleted[series_name] = DELETED
+                    continue
+                changed = {field: DELETED if value is None else value
+                           for field, value in fields.items()
+                           if (current or {}).get(field) != value}
+                if changed:
+                    edited[series_name] = changed
+            if deleted:
+                self.store.update(deleted, flush=not edited)
+            if edited:
+                self.store.update_fields(edited, flush=True)
+        for series_name in [*deleted, *edited]:
+            self._notify(series_name)
+        return len(deleted) + len(edited)
     
     def search_metadata(self, query):
         """Search for series by name or alternate titles"""
@@ -0,0 +1,221 @@
+"""
+Metrics - Timing and cache counters for the hot paths
+Counters and latency histograms rendered in the Prometheus text format,
+without extra dependencies. Every process (server workers, analysis pool
+processes) writes its values to <directory>/<pid>.json at most once per
+flush_interval, and render() merges all of them
+"""
+
+from contextlib import ContextDecorator
+from pathlib import Path
+import atexit
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name -> (type, help); every metric recorded anywhere is listed here
+METRICS = {
+    'manga_http_request_seconds': ('histogram', 'Time spent handling requests, by endpoint'),
+    'manga_library_scan_seconds': ('histogram', 'Library index refreshes (full or one series)'),
+    'manga_library_events_total': ('counter', 'Library index changes, by event'),
+    'manga_pairing_seconds': ('histogram', 'Page pairing time, by stage'),
+    'manga_page_features_total': ('counter', 'Page feature records, extracted or reused from cache'),
+    'manga_cover_selection_seconds': ('histogram', 'Smart cover selection for one series'),
+    'manga_image_transcode_seconds': ('histogram', 'Resizing/re-encoding a page, by cache'),
+    'manga_page_probe_seconds': ('histogram', 'Reading the page dimensions of one chapter'),
+    'manga_images_served_total': ('counter', 'Image responses, by delivery mode'),
+    'manga_store_io_seconds': ('histogram', 'JSON store reads and writes, by store and operation'),
+    'manga_cache_requests_total': ('counter', 'Cache lookups, by cache and hit/miss'),
+    'manga_analysis_jobs_total': ('counter', 'Background analysis jobs, by kind and result'),
+    'manga_warmup_seconds': ('histogram', 'Background warm-up of a server process after startup'),
+}
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Timer(ContextDecorator):
+    """Observe the time spent in a with-block (or decorated function)"""
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # Decorated functions get a fresh timer per call, so threads don't share a start time
+        return Timer(self.registry, self.name, self.labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self._start, **self.labels)
+        return False
+
+class Metrics:
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, label key) -> value
+        self._histograms = {}  # (name, label key) -> [bucket counts..., sum, count]
+        self._last_flush = time.monotonic()
+        # Forked processes start from zero, or they'd report the parent's values again
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush)
+
+    def configure(self, directory, flush_interval=1.0):
+        """Share values through directory (e.g. data/metrics) across processes"""
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = time.monotonic()
+
+    # -------------------------------------------------
+    # Recording
+    # -------------------------------------------------
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += seconds
+            values[-1] += 1
+        self._maybe_flush()
+
+    def timer(self, name, **labels):
+        """Context manager/decorator observing elapsed seconds into a histogram"""
+        return Timer(self, name, labels)
+
+    def cache(self, cache_name, hit):
+        """Count a cache lookup"""
+        self.inc('manga_cache_requests_total', cache=cache_name, result='hit' if hit else 'miss')
+
+    # -------------------------------------------------
+    # Sharing between processes
+    # -------------------------------------------------
+    def _maybe_flush(self):
+        if self.directory is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def flush(self):
+        """Write this process's values to <directory>/<pid>.json"""
+        if self.directory is None:
+            return
+        self._last_flush = time.monotonic()
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, self.directory / f"{os.getpid()}.json")
+        except OSError as e:
+            print(f"Warning: Could not write metrics: {e}")
+
+    def remove_stale(self):
+        """Delete the files of processes that no longer run (e.g. at server start)"""
+        if self.directory is None:
+            return
+        for path in self.directory.glob('*.json'):
+            try:
+                os.kill(int(path.stem), 0)
+            except ProcessLookupError:
+                path.unlink(missing_ok=True)
+            except (ValueError, PermissionError):
+                pass
+
+    def _collect(self):
+        """This process's values merged with every other process's last flush"""
+        snapshots = [self.snapshot()]
+        if self.directory is not None:
+            own = f"{os.getpid()}.json"
+            for path in self.directory.glob('*.json'):
+                if path.name == own:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    merged[i] += value
+        return counters, histograms
+
+    # -------------------------------------------------
+    # Exposition
+    # -------------------------------------------------
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        counters, histograms = self._collect()
+        series = {}
+        for (name, labels), value in counters.items():
+            series.setdefault(name, []).append((labels, value))
+        for (name, labels), values in histograms.items():
+            series.setdefault(name, []).append((labels, values))
+
+        lines = []
+        for name in sorted(series):
+            kind, help_text = METRICS.get(name, ('untyped', ''))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series[name]):
+                if kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+# Shared by every module; app.py points it at data/metrics. Sibling scripts
+# import this file as 'metrics' and app.py as 'scripts.metrics', so the
+# second import reuses the first one's registry
+metrics = (getattr(sys.modules.get('metrics'), 'metrics', None)
+           or getattr(sys.modules.get('scripts.metrics'), 'metrics', None)
+           or Metrics())
@@ -1,79 +1,173 @@
+from pathlib import Path
 import os
 import re
+import sys
+import time
+import zipfile
 import cv2
 import numpy as np
 
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from metrics import metrics
+from chapter_features import ChapterFeatures
+
 class MangaPagePairer:
-    def __init__(self, image_dir):
+    def __init__(self, image_dir, known_features=None, batch=False, workers=None):
+        # A directory of images, or a CBZ/ZIP archive read in memory
         self.image_dir = image_dir
+        self.is_archive = os.path.isfile(image_dir)
+        self._archive = None
         self.image_files = self._load_images()
+        # Extract all missing pages at once (ChapterFeatures) on this many
+        # decode threads, instead of one full page at a time. Opt-in: stacked
+        # pages are decoded smaller and resized, so their features drift from
+        # the ones the detector thresholds below were tuned on
+        self.batch = batch
+        # Previously extracted features by file name (e.g. from AnalysisCache);
+        # records from another extraction path (or an older decode) are
+        # measured again, so a chapter's pages are never judged on a mix
+        source = 'stack' if batch else 'page'
+        self.known_features = {
+            name: record for name, record in (known_features or {}).items()
+            if record is None or record.get('source') == source
+        }
+        self.workers = workers
+        self._features = None
 
     # -------------------------------------------------
     # Load & sort numeric filenames
     # -------------------------------------------------
     def _load_images(self):
+        if self.is_archive:
+            with zipfile.ZipFile(self.image_dir) as zf:
+                names = [n for n in zf.namelist() if not n.endswith("/")]
+        else:
+            names = os.listdir(self.image_dir)
+
+        # Archive entries may sit in a folder; the number comes from the file name
         files = []
-        for f in os.listdir(self.image_dir):
+        for f in names:
             if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
-                m = re.match(r"(\d+)", f)
+                m = re.match(r"(\d+)", os.path.basename(f))
                 if m:
                     files.append(f)
-        return sorted(files, key=lambda x: int(re.match(r"(\d+)", x).group(1)))
+        return sorted(files, key=lambda x: int(re.match(r"(\d+)", os.path.basename(x)).group(1)))
 
     # -------------------------------------------------
-    # Full paths
+    # Decode one page (full-resolution grayscale)
     # -------------------------------------------------
-    def _get_image_paths(self):
-        return [os.path.join(self.image_dir, f) for f in self.image_files]
+    def _decode_page(self, name):
+        # Full resolution: the detector thresholds are tuned on it, and a
+        # reduced DCT decode shifts white density enough to flip pairings
+        if self._archive is not None:
+            data = np.frombuffer(self._archive.read(name), np.uint8)
+            return cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+        return cv2.imread(os.path.join(self.image_dir, name), cv2.IMREAD_GRAYSCALE)
 
     # -------------------------------------------------
-    # Double spread detection
+    # Per-page feature extraction (single decode)
     # -------------------------------------------------
-    def _is_double_spread(self, image_path, ratio=1.35):
-        img = cv2.imread(image_path)
+    def _extract_features(
+        self,
+        name,
+        dark_threshold=40,
+        white_threshold=230,
+        region_fraction=0.33
+    ):
+        # One decode per page; every detector reads from this record
+        start = time.perf_counter()
+        img = self._decode_page(name)
+        decoded = time.perf_counter()
+        metrics.observe('manga_pairing_seconds', decoded - start, stage='decode')
         if img is None:
+            return None
+        h, w = img.shape
+        region_w = max(int(w * region_fraction), 1)
+        region_size = h * region_w
+        features = {
+            "aspect": w / h,
+            "dark_ratio": np.count_nonzero(img < dark_threshold) / img.size,
+            "std": float(np.std(img)),
+            "left_white": np.count_nonzero(img[:, :region_w] >= white_threshold) / region_size,
+            "right_white": np.count_nonzero(img[:, -region_w:] >= white_threshold) / region_size,
+            "source": "page",
+        }
+        metrics.observe('manga_pairing_seconds', time.perf_counter() - decoded, stage='features')
+        return features
+
+    def _read_page(self, name):
+        if self._archive is not None:
+            return self._archive.read(name)
+        with open(os.path.join(self.image_dir, name), 'rb') as f:
+            return f.read()
+
+    def _extract_batch(self, names):
+        """Feature records for names, decoded and analysed as one stack"""
+        with metrics.timer('manga_pairing_seconds', stage='batch_features'):
+            features = ChapterFeatures.extract(names, self._read_page, workers=self.workers)
+        return dict(zip(names, features.records()))
+
+    def get_page_features(self):
+        """Feature record for every page, aligned with image_files"""
+        if self._features is None:
+            if self.is_archive:
+                self._archive = zipfile.ZipFile(self.image_dir)
+            try:
+                missing = [name for name in self.image_files if name not in self.known_features]
+                if self.batch and missing:
+                    extracted = self._extract_batch(missing)
+                else:
+                    extracted = {name: self._extract_features(name) for name in missing}
+                self._features = [
+                    self.known_features[name] if name in self.known_features else extracted[name]
+                    for name in self.image_files
+                ]
+                metrics.inc('manga_page_features_total', len(self.image_files) - len(missing),
+                            source='cached')
+                metrics.inc('manga_page_features_total', len(missing), source='extracted')
+            finally:
+                if self._archive is not None:
+                    self._archive.close()
+                    self._archive = None
+        return self._features
+
+    def get_features_by_name(self):
+        """Feature records keyed by file name"""
+        return dict(zip(self.image_files, self.get_page_features()))
+
+    # -------------------------------------------------
+    # Double spread detection
+    # -------------------------------------------------
+    def _is_double_spread(self, features, ratio=1.35):
+        if features is None:
             return False
-        h, w = img.shape[:2]
-        return (w / h) >= ratio
+        return features["aspect"] >= ratio
 
     # -------------------------------------------------
     # Black page detection
     # -------------------------------------------------
-    def _is_black_page(self, image_path, threshold=40, min_ratio=0.65):
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
+    def _is_black_page(self, features, min_ratio=0.65):
+        if features is None:
             return False
-        dark = np.sum(img < threshold)
-        return (dark / img.size) >= min_ratio
+        return features["dark_ratio"] >= min_ratio
 
     # -------------------------------------------------
     # Solid-color page detection (artsy edge cases)
     # -------------------------------------------------
-    def _is_solid_color_page(self, image_path, std_threshold=4.0):
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
+    def _is_solid_color_page(self, features, std_threshold=4.0):
+        if features is None:
             return False
-        return np.std(img) <= std_threshold
+        return features["std"] <= std_threshold
 
     # -------------------------------------------------
     # Detect page side using white-density analysis
     # -------------------------------------------------
-    def _detect_page_side_with_confidence(
-        self,
-        image_path,
-        region_fraction=0.33,
-        white_threshold=230
-    ):
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
+    def _detect_page_side_with_confidence(self, features):
+        if features is None:
             return "left", 0.0
-        h, w = img.shape
-        region_w = int(w * region_fraction)
-        left_region = img[:, :region_w]
-        right_region = img[:, -region_w:]
-        
-        left_white = np.sum(left_region >= white_threshold)
-        right_white = np.sum(right_region >= white_threshold)
+        left_white = features["left_white"]
+        right_white = features["right_white"]
         
         total = left_white + right_white
         if total == 0:
@@ -87,12 +181,12 @@ class MangaPagePairer:
     # -------------------------------------------------
     # Determine first page side using MOST confident page
     # -------------------------------------------------
-    def _determine_first_page_side(self, image_paths):
+    def _determine_first_page_side(self, page_features):
         # --- PRIORITY CHECK: Double Spread Parity ---
         # If we find a double spread at index N, we can mathematically determine
         # if the first page (Index 0) should stand alone to ensure N lands correctly.
-        for idx, path in enumerate(image_paths):
-            if self._is_double_spread(path):
+        for idx, features in enumerate(page_features):
+            if self._is_double_spread(features):
                 # If index is Even (0, 2, 4...), the pages before it (even count)
                 # can pair up perfectly [0,1], [2,3]. So P0 is NOT alone. (Return False)
                 # If index is Odd (1, 3...), we need P0 to stand alone [0], [1,2] 
@@ -106,12 +200,12 @@ class MangaPagePairer:
             "side": None
         }
         
-        for idx, path in enumerate(image_paths):
+        for idx, features in enumerate(page_features):
             # Skip unusable pages for density check
-            if self._is_black_page(path) or self._is_solid_color_page(path):
+            if self._is_black_page(features) or self._is_solid_color_page(features):
                 continue
                 
-            side, conf = self._detect_page_side_with_confidence(path)
+            side, conf = self._detect_page_side_with_confidence(features)
             
             if conf > best["confidence"]:
                 best.update({
@@ -136,21 +230,23 @@ class MangaPagePairer:
     # Pair pages
     # -------------------------------------------------
     def pair_pages(self):
-        image_paths = self._get_image_paths()
+        page_features = self.get_page_features()
         paired = []
-        if not image_paths:
+        if not page_features:
             return paired
 
         # Determine if we need to offset the first page
-        start_left = self._determine_first_page_side(image_paths)
+        with metrics.timer('manga_pairing_seconds', stage='first_page_side'):
+            start_left = self._determine_first_page_side(page_features)
+        start = time.perf_counter()
         
         i = 0
         if start_left:
             paired.append([self.image_files[0]])
             i = 1
 
-        while i < len(image_paths):
-            current = image_paths[i]
+        while i < len(page_features):
+            current = page_features[i]
             
             # 1. Handle actual double spread
             if self._is_double_spread(current):
@@ -165,8 +261,8 @@ class MangaPagePairer:
                 continue
 
             # 3. Handle Pairing
-            if i + 1 < len(image_paths):
-                next_page = image_paths[i + 1]
+            if i + 1 < len(page_features):
+                next_page = page_features[i + 1]
                 
                 # Check if the NEXT page prevents pairing (is double/black/solid)
                 if (
@@ -182,4 +278,5 @@ class MangaPagePairer:
             paired.append([self.image_files[i]])
             i += 1
             
-        return paired
\ No newline at end of file
+        metrics.observe('manga_pairing_seconds', time.perf_counter() - start, stage='pairing')
+        return paired
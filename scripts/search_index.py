@@ -0,0 +1,388 @@
+"""
+Search Index - In-memory trigram index over series names and metadata
+Indexes folder names (which double as display names once normalized),
+alternate titles, author and genres. Exact, prefix and substring matches
+come from a trigram index over whole texts; typo-tolerant matches from a
+trigram index over the (much smaller) word vocabulary. Kept current
+incrementally from library index and metadata change events; the first
+full build happens on first use (ensure_built), not at construction
+"""
+
+from bisect import bisect_left, insort
+from collections import Counter
+import heapq
+import re
+import threading
+
+# Metadata fields that are searched besides the series name
+SEARCH_FIELDS = ('alternate_titles', 'author', 'genres')
+
+# Trigrams one edit can break (a transposition touches up to four)
+GRAMS_PER_EDIT = 4
+
+# Most candidates scored per query phase (with a limit). Candidates are
+# scored in rank order, so very broad queries rank the best of the first ones
+MAX_SCORED = 1000
+
+# Best scores of a name prefix, a word prefix and a typo-tolerant match:
+# candidates come in rank order, so once limit matches reach their phase's
+# best score, no later candidate can outrank them
+PREFIX_SCORE = 0.9
+WORD_PREFIX_SCORE = 0.85
+FUZZY_SCORE = 0.7
+
+def normalize(text):
+    """Lowercase, with separators and punctuation folded to single spaces"""
+    return ' '.join(re.sub(r'[\W_]+', ' ', text.lower()).split())
+
+def trigrams(text):
+    """Trigrams of each word, padded like pg_trgm ('  w', ' wo', ..., 'rd ')"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def required_trigrams(text):
+    """
+    Trigrams every text containing this one must have: its unpadded trigrams,
+    the padded ones at word boundaries inside it, or for a single one/two-letter
+    word the word-start trigram (so those match prefixes)
+    """
+    words = text.split()
+    grams = set()
+    for i, word in enumerate(words):
+        grams.update(word[j:j + 3] for j in range(len(word) - 2))
+        # Words after the first start a word of the text, those before the last end one
+        if i > 0:
+            grams.add(f"  {word}"[:3])
+            if len(word) > 1:
+                grams.add(f" {word}"[:3])
+        if i < len(words) - 1 and (i > 0 or len(word) > 1):
+            grams.add(f" {word} "[-3:])
+    if not grams:
+        word = text.split()[0]
+        grams.add(f"  {word}"[-3:] if len(word) == 1 else f" {word}")
+    return grams
+
+def rank_key(series_name):
+    """Equal scores rank by this: the normalized name, then the name itself"""
+    return normalize(series_name), series_name
+
+def typo_budget(word):
+    """
+    Edits tolerated in a query word: none for short words, more for long
+    ones, and none with digits (a volume or chapter number one edit away is
+    another number, and numbers share so many trigrams that checking them
+    all is slow)
+    """
+    if len(word) < 4 or any(c.isdigit() for c in word):
+        return 0
+    return 1 if len(word) < 8 else 2
+
+def edit_distance(a, b, limit):
+    """Damerau-Levenshtein (optimal string alignment) distance, or limit + 1 if above limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+        prev2, prev = prev, row
+    return prev[-1]
+
+class SearchIndex:
+    def __init__(self, library_index=None, metadata_manager=None):
+        self.library_index = library_index
+        self.metadata_manager = metadata_manager
+        self._lock = threading.Lock()
+        self._texts = {}          # series name -> [(field, normalized text, words)]
+        self._keys = {}           # series name -> rank_key(name)
+        self._names = []          # rank keys of all series, sorted
+        self._sorted_texts = []   # (normalized text, *rank key) of all texts, sorted
+        self._grams = {}          # series name -> trigrams of all its texts
+        self._postings = {}       # trigram -> series names
+        self._word_series = {}    # word -> series names
+        self._word_postings = {}  # trigram -> words
+        self._built = False
+        self._build_lock = threading.Lock()
+
+        if library_index is not None:
+            library_index.add_listener(self._on_index_event)
+        if metadata_manager is not None:
+            metadata_manager.add_listener(self._on_metadata_event)
+
+    def ensure_built(self):
+        """Index the whole library once (about half a second per 10k series)"""
+        if self._built:
+            return
+        with self._build_lock:
+            if not self._built:
+                self.rebuild()
+                self._built = True
+
+    def rebuild(self):
+        """Index every series currently in the library index"""
+        if self.library_index is None:
+            return
+        names = {summary['name'] for summary in self.library_index.get_series_summaries()}
+        for series_name in set(self._texts) - names:
+            self.remove_series(series_name)
+        for series_name in names:
+            self.update_series(series_name)
+
+    # -------------------------------------------------
+    # Incremental updates
+    # -------------------------------------------------
+    def update_series(self, series_name, metadata=None):
+        """(Re-)index one series from its name and metadata"""
+        if metadata is None and self.metadata_manager is not None:
+            metadata = self.metadata_manager.get_metadata(series_name)
+        texts = [('name', normalize(series_name))]
+        for field in SEARCH_FIELDS:
+            value = (metadata or {}).get(field)
+            values = value if isinstance(value, list) else [value]
+            texts.extend((field, normalize(v)) for v in values if isinstance(v, str))
+        texts = [(field, text, text.split()) for field, text in texts if text]
+
+        grams = set()
+        for _, text, _ in texts:
+            grams |= trigrams(text)
+
+        with self._lock:
+            if not self._remove(series_name):
+                self._keys[series_name] = rank_key(series_name)
+                insort(self._names, self._keys[series_name])
+            self._texts[series_name] = texts
+            for _, text, _ in texts:
+                insort(self._sorted_texts, (text, *self._keys[series_name]))
+            self._grams[series_name] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(series_name)
+            for _, _, words in texts:
+                for word in words:
+                    if word not in self._word_series:
+                        self._word_series[word] = set()
+                        for gram in trigrams(word):
+                            self._word_postings.setdefault(gram, set()).add(word)
+                    self._word_series[word].add(series_name)
+
+    def remove_series(self, series_name):
+        with self._lock:
+            if self._remove(series_name):
+                del self._names[bisect_left(self._names, self._keys.pop(series_name))]
+
+    def _remove(self, series_name):
+        """Drop a series' texts and postings (not its rank key); True if it was indexed"""
+        for gram in self._grams.pop(series_name, ()):
+            self._discard(self._postings, gram, series_name)
+        texts = self._texts.pop(series_name, None)
+        for _, text, words in texts or ():
+            del self._sorted_texts[bisect_left(self._sorted_texts, (text, *self._keys[series_name]))]
+            for word in words:
+                if self._discard(self._word_series, word, series_name):
+                    for gram in trigrams(word):
+                        self._discard(self._word_postings, gram, word)
+        return texts is not None
+
+    def _discard(self, postings, key, value):
+        """Remove value from postings[key]; returns True if the key is now gone"""
+        values = postings.get(key)
+        if values is None:
+            return False
+        values.discard(value)
+        if not values:
+            del postings[key]
+            return True
+        return False
+
+    def _on_index_event(self, event, series_name, chapter_name):
+        if event == 'series_changed':
+            # Changed in another process; indexed only while it has chapters, as in rebuild()
+            if len(self.library_index.get_chapter_order(series_name)):
+                self.update_series(series_name)
+            else:
+                self.remove_series(series_name)
+        elif event == 'series_removed':
+            self.remove_series(series_name)
+        elif event == 'chapter_changed' and series_name not in self._texts:
+            self.update_series(series_name)
+
+    def _on_metadata_event(self, series_name):
+        # Metadata can exist for series that aren't in the library (yet)
+        if series_name in self._texts:
+            self.update_series(series_name)
+
+    # -------------------------------------------------
+    # Queries
+    # -------------------------------------------------
+    def search(self, query, limit=20):
+        """
+        Ranked matches for a query: list of (series_name, score, field)
+        Exact > prefix > substring > typo-tolerant; limit=None returns every
+        match, otherwise at most MAX_SCORED candidates are scored per phase
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        query_words = query.split()
+        self.ensure_built()
+
+        with self._lock:
+            # Exact and prefix matches: a range of the sorted texts. A series
+            # counts towards a full page at its name's entry, and those come
+            # in rank order, so once limit are found nothing later outranks them
+            matches = {}
+            top = 0
+            for text, name_key, series_name in self._prefixed(query, limit):
+                if limit is not None and top >= limit:
+                    break
+                if series_name not in matches:
+                    matches[series_name] = self._score(series_name, query)
+                if text == name_key and matches[series_name][0] >= PREFIX_SCORE:
+                    top += 1
+
+            # Other matches as typed (word prefixes and substrings score below
+            # every prefix): candidates hold every required trigram (rarest first)
+            if limit is None or len(matches) < limit:
+                postings = sorted((self._postings.get(gram, set())
+                                   for gram in required_trigrams(query)), key=len)
+                top = len(matches)
+                for series_name in self._candidates(postings, limit):
+                    if limit is not None and top >= limit:
+                        break
+                    if series_name in matches:
+                        continue
+                    score, field = self._score(series_name, query)
+                    if score:
+                        matches[series_name] = (score, field)
+                        top += score >= WORD_PREFIX_SCORE
+
+            # Typo-tolerant, only when the as-typed matches don't fill the results:
+            # every query word must resemble some word of one text
+            fuzzy = limit is None or len(matches) < limit
+            similar = [self._similar_words(word) for word in query_words] if fuzzy else []
+            if similar and all(similar):
+                candidates = None
+                for words in similar:
+                    series = set().union(*(self._word_series[w] for w in words))
+                    candidates = series if candidates is None else candidates & series
+                top = len(matches)
+                for series_name in self._candidates([candidates], limit):
+                    if limit is not None and top >= limit:
+                        break
+                    if series_name in matches:
+                        continue
+                    score, field = self._fuzzy_score(series_name, similar)
+                    if score:
+                        matches[series_name] = (score, field)
+                        top += score >= FUZZY_SCORE
+
+            ranked = ((name, score, field) for name, (score, field) in matches.items())
+            key = lambda m: (-m[1], self._keys[m[0]])
+            if limit is None:
+                return sorted(ranked, key=key)
+            return heapq.nsmallest(limit, ranked, key=key)
+
+    def _prefixed(self, query, limit):
+        """
+        (text, *rank key) of the texts starting with query, in order; at most
+        MAX_SCORED of them with a limit
+        """
+        texts = self._sorted_texts
+        i = bisect_left(texts, (query,))
+        end = len(texts) if limit is None else min(len(texts), i + MAX_SCORED)
+        while i < end and texts[i][0].startswith(query):
+            yield texts[i]
+            i += 1
+
+    def _candidates(self, postings, limit):
+        """
+        Series in every one of postings (smallest first), in rank order and
+        at most MAX_SCORED of them with a limit
+        """
+        smallest, rest = postings[0], postings[1:]
+        if limit is None:
+            yield from smallest.intersection(*rest)
+        elif len(smallest) <= MAX_SCORED:
+            yield from sorted(smallest.intersection(*rest), key=self._keys.__getitem__)
+        else:
+            # Walk the sorted rank keys instead of intersecting and sorting large sets
+            scored = 0
+            for _, series_name in self._names:
+                if series_name in smallest and all(series_name in p for p in rest):
+                    yield series_name
+                    scored += 1
+                    if scored == MAX_SCORED:
+                        return
+
+    def _score(self, series_name, query):
+        """Best (score, field) of an as-typed match over a series' texts"""
+        best = (0.0, None)
+        for field, text, _ in self._texts[series_name]:
+            if text == query:
+                score = 1.0
+            elif text.startswith(query):
+                score = 0.9
+            elif f" {query}" in f" {text}":
+                score = 0.85  # prefix of a later word
+            elif query in text:
+                score = 0.8
+            else:
+                continue
+            if field != 'name':
+                score -= 0.01  # prefer the folder name on ties
+            if score > best[0]:
+                best = (score, field)
+        return best
+
+    def _similar_words(self, query_word):
+        """Vocabulary words the query word is a prefix of or a few edits from -> similarity"""
+        budget = typo_budget(query_word)
+        grams = trigrams(query_word)
+        if not budget:
+            # Prefixes only: they hold every trigram but the trailing padded one
+            grams.discard(f" {query_word} "[-3:])
+            postings = sorted((self._word_postings.get(gram, set()) for gram in grams), key=len)
+            return {word: 1.0 for word in postings[0].intersection(*postings[1:])
+                    if word.startswith(query_word)}
+        counts = Counter()
+        for gram in grams:
+            counts.update(self._word_postings.get(gram, ()))
+        # A prefix misses only the trailing padded trigram
+        needed = max(len(grams) - max(GRAMS_PER_EDIT * budget, 1), 1)
+
+        similar = {}
+        for word, shared in counts.items():
+            if shared < needed:
+                continue
+            if word.startswith(query_word):
+                similar[word] = 1.0
+            elif budget and len(word) >= len(query_word) - budget:
+                # Against the word's prefix too, so typos in a partial word match
+                distance = min(edit_distance(query_word, word, budget),
+                               edit_distance(query_word, word[:len(query_word)], budget))
+                if distance <= budget:
+                    similar[word] = 1 - distance / len(query_word)
+        return similar
+
+    def _fuzzy_score(self, series_name, similar):
+        """Best (score, field) over texts containing a similar word for every query word"""
+        best = (0.0, None)
+        for field, _, words in self._texts[series_name]:
+            total = 0.0
+            for candidates in similar:
+                match = max((candidates.get(word, 0.0) for word in words), default=0.0)
+                if not match:
+                    break
+                total += match
+            else:
+                score = 0.7 * total / len(similar)
+                if score > best[0]:
+                    best = (score, field)
+        return best
@@ -4,11 +4,15 @@ Stores: reader mode, reading direction, and other settings
 Includes dual-page mode
 """
 
-import json
 from pathlib import Path
+import sys
+
+# Add scripts directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+from json_store import JsonStore
 
 class SettingsManager:
-    def __init__(self, settings_file='data/settings.json'):
+    def __init__(self, settings_file='data/settings.json', flush_delay=0.5):
         self.settings_file = Path(settings_file)
         self.default_settings = {
             'reader_mode': 'scroll',  # 'scroll', 'single', or 'dual'
@@ -17,57 +21,41 @@ class SettingsManager:
             'fit_mode': 'width',  # 'width', 'height', 'original'
             'background_color': '#0a0a0a'
         }
-        self.settings = self._load_settings()
-        
-    def _load_settings(self):
-        """Load settings from JSON file"""
-        if self.settings_file.exists():
-            try:
-                with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    loaded = json.load(f)
-                    # Merge with defaults to ensure all keys exist
-                    return {**self.default_settings, **loaded}
-            except Exception as e:
-                print(f"Error loading settings: {e}")
-                return self.default_settings.copy()
-        else:
-            # Create data directory if it doesn't exist
-            self.settings_file.parent.mkdir(parents=True, exist_ok=True)
-            self._save_settings()
-            return self.default_settings.copy()
+        # Only changed settings are stored; defaults fill in the rest
+        self.store = JsonStore(self.settings_file, 'settings', flush_delay=flush_delay, indent=2)
+    
+    @property
+    def settings(self):
+        return {**self.default_settings, **self.store.data}
+    
+    def sync(self):
+        """Reload the file if another server process saved it"""
+        return self.store.sync()
     
-    def _save_settings(self):
-        """Save settings to JSON file"""
-        try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=2)
-        except Exception as e:
-            print(f"Error saving settings: {e}")
+    def flush(self):
+        """Write changes still waiting for the next batch"""
+        self.store.flush()
     
     def get_all_settings(self):
         """Get all settings"""
-        return self.settings.copy()
+        return self.settings
     
     def get_setting(self, key):
         """Get a specific setting"""
-        return self.settings.get(key, self.default_settings.get(key))
+        return self.settings.get(key)
     
     def update_setting(self, key, value):
         """Update a single setting"""
         if key in self.default_settings:
-            self.settings[key] = value
-            self._save_settings()
+            self.store.set(key, value)
             return True
         return False
     
     def update_settings(self, settings_dict):
         """Update multiple settings"""
-        for key, value in settings_dict.items():
-            if key in self.default_settings:
-                self.settings[key] = value
-        self._save_settings()
+        self.store.update({key: value for key, value in settings_dict.items()
+                           if key in self.default_settings})
     
     def reset_to_defaults(self):
         """Reset all settings to defaults"""
-        self.settings = self.default_settings.copy()
-        self._save_settings()
\ No newline at end of file
+        self.store.update(dict(self.default_settings))
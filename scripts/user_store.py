@@ -0,0 +1,157 @@
+"""
+User Store - Per-user settings and reading progress
+Settings a user changed are stored per user (the global settings remain
+the defaults); progress is the last chapter/page read in each series.
+Page positions arrive every page turn, so they are kept in memory and
+written in one transaction every flush_interval seconds (latest position
+per series wins). Lookups go through the (user, ...) primary keys and the
+(user, updated_at) index, so their cost doesn't grow with the library
+"""
+
+from pathlib import Path
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+class UserStore:
+    def __init__(self, db_file='data/users.db', flush_interval=2.0):
+        self.db_file = Path(db_file)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # (user, series) -> (chapter, page, page_count, updated_at), not yet written
+        self._pending = {}
+        self._timer = None
+        self.conn = self._connect()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Open the user database and create tables if needed"""
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (user, key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS progress (
+                user TEXT NOT NULL,
+                series TEXT NOT NULL,
+                chapter TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                page_count INTEGER,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user, series)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS progress_recent ON progress (user, updated_at DESC);
+        """)
+        conn.commit()
+        return conn
+
+    # -------------------------------------------------
+    # Settings
+    # -------------------------------------------------
+    def get_settings(self, user):
+        """Settings this user changed (key -> value)"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT key, value FROM user_settings WHERE user = ?', (user,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def update_settings(self, user, changes):
+        """Store changed settings for a user (written immediately)"""
+        with self._lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO user_settings (user, key, value) VALUES (?, ?, ?)',
+                [(user, key, json.dumps(value)) for key, value in changes.items()]
+            )
+            self.conn.commit()
+
+    def reset_settings(self, user):
+        with self._lock:
+            self.conn.execute('DELETE FROM user_settings WHERE user = ?', (user,))
+            self.conn.commit()
+
+    # -------------------------------------------------
+    # Reading progress
+    # -------------------------------------------------
+    def record_progress(self, user, series_name, chapter_name, page, page_count=None):
+        """Remember the page a user is on; written within flush_interval seconds"""
+        with self._lock:
+            self._pending[(user, series_name)] = (chapter_name, page, page_count, time.time())
+            if self.flush_interval <= 0:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def get_progress(self, user, series_name):
+        """Last position in a series as a dict, or None if never read"""
+        with self._lock:
+            pending = self._pending.get((user, series_name))
+            if pending is not None:
+                return self._progress_dict(series_name, *pending)
+            row = self.conn.execute(
+                'SELECT chapter, page, page_count, updated_at FROM progress '
+                'WHERE user = ? AND series = ?', (user, series_name)
+            ).fetchone()
+        return self._progress_dict(series_name, *row) if row else None
+
+    def recent(self, user, limit=10):
+        """The user's most recently read series, newest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT series, chapter, page, page_count, updated_at FROM progress '
+                'WHERE user = ? ORDER BY updated_at DESC LIMIT ?', (user, limit)
+            ).fetchall()
+            latest = {row[0]: row[1:] for row in rows}
+            # Unwritten positions are newer than anything in the table
+            for (pending_user, series_name), position in self._pending.items():
+                if pending_user == user:
+                    latest[series_name] = position
+        ordered = sorted(latest.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [self._progress_dict(series_name, *position) for series_name, position in ordered]
+
+    def remove_progress(self, user, series_name):
+        with self._lock:
+            self._pending.pop((user, series_name), None)
+            self.conn.execute('DELETE FROM progress WHERE user = ? AND series = ?', (user, series_name))
+            self.conn.commit()
+
+    def _progress_dict(self, series_name, chapter_name, page, page_count, updated_at):
+        return {'series': series_name, 'chapter': chapter_name, 'page': page,
+                'page_count': page_count, 'updated_at': updated_at}
+
+    def flush(self):
+        """Write all pending positions in one transaction"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            # Another server process may have written a newer position meanwhile
+            self.conn.executemany(
+                'INSERT INTO progress (user, series, chapter, page, page_count, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user, series) DO UPDATE SET '
+                'chapter = excluded.chapter, page = excluded.page, page_count = excluded.page_count, '
+                'updated_at = excluded.updated_at WHERE excluded.updated_at >= progress.updated_at',
+                [(user, series_name, *position) for (user, series_name), position in pending.items()]
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            # Keep the positions (unless newer ones arrived) for the next flush
+            self._pending = {**pending, **self._pending}
+            print(f"Error saving reading progress: {e}")
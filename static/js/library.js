@@ -1,56 +1,120 @@
 // Library view JavaScript
 
-let allSeries = [];
+// Series per request; later pages load as the user scrolls
+const PAGE_SIZE = 60;
+// Only what the cards show, so responses leave out chapter lists
+const CARD_FIELDS = 'name,cover,chapter_count,description';
+
+let libraryState = {
+    query: '',
+    sort: 'name',
+    offset: 0,
+    total: null,
+    loading: false,
+    generation: 0  // bumped on every reset so stale responses are dropped
+};
 
 // Load library on page load
 document.addEventListener('DOMContentLoaded', () => {
-    loadLibrary();
+    setupInfiniteScroll();
     setupSearch();
+    setupSort();
+    resetLibrary();
 });
 
-async function loadLibrary() {
+function resetLibrary() {
+    libraryState.offset = 0;
+    libraryState.total = null;
+    libraryState.loading = false;
+    libraryState.generation++;
+    document.getElementById('libraryGrid').innerHTML = '';
+    loadNextPage();
+}
+
+async function loadNextPage() {
+    const state = libraryState;
+    if (state.loading || (state.total !== null && state.offset >= state.total)) {
+        return;
+    }
+    
     const loading = document.getElementById('loading');
-    const grid = document.getElementById('libraryGrid');
+    const generation = state.generation;
+    state.loading = true;
+    
+    const params = new URLSearchParams({
+        offset: state.offset,
+        limit: PAGE_SIZE,
+        fields: CARD_FIELDS
+    });
+    if (state.query) {
+        // Best matches first unless a sort was picked
+        params.set('q', state.query);
+        params.set('sort', state.sort === 'name' ? 'relevance' : state.sort);
+    } else {
+        params.set('sort', state.sort);
+    }
     
     try {
-        const response = await fetch('/api/library');
+        const response = await fetch(`/api/library?${params}`);
         const series = await response.json();
+        if (generation !== state.generation) {
+            return;
+        }
         
-        allSeries = series;
-        
+        state.total = parseInt(response.headers.get('X-Total-Count') || series.length, 10);
+        state.offset += series.length;
         loading.style.display = 'none';
         
-        if (series.length === 0) {
-            showNoResults('No manga series found in library');
+        if (state.total === 0) {
+            showNoResults(state.query ? 'No series found' : 'No manga series found in library');
             return;
         }
         
         displaySeries(series);
+        state.loading = false;
+        
+        // Keep going until the screen is filled
+        if (series.length > 0 && sentinelVisible()) {
+            loadNextPage();
+        }
     } catch (error) {
         console.error('Error loading library:', error);
-        loading.textContent = 'Error loading library';
+        if (generation === state.generation) {
+            state.loading = false;
+            loading.textContent = 'Error loading library';
+            loading.style.display = 'block';
+        }
     }
 }
 
+function setupInfiniteScroll() {
+    const sentinel = document.getElementById('scrollSentinel');
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    }, { rootMargin: '800px 0px' });
+    observer.observe(sentinel);
+}
+
+function sentinelVisible() {
+    const sentinel = document.getElementById('scrollSentinel');
+    return sentinel.getBoundingClientRect().top < window.innerHeight + 800;
+}
+
 function displaySeries(series) {
+    // Appends a page of series to the grid
     const grid = document.getElementById('libraryGrid');
     const noResults = document.getElementById('noResults');
     
-    grid.innerHTML = '';
-    
-    if (series.length === 0) {
-        grid.style.display = 'none';
-        noResults.style.display = 'block';
-        return;
-    }
-    
     grid.style.display = 'grid';
     noResults.style.display = 'none';
     
+    const fragment = document.createDocumentFragment();
     series.forEach(s => {
-        const card = createSeriesCard(s);
-        grid.appendChild(card);
+        fragment.appendChild(createSeriesCard(s));
     });
+    grid.appendChild(fragment);
 }
 
 function createSeriesCard(series) {
@@ -63,7 +127,7 @@ function createSeriesCard(series) {
     
     if (series.cover) {
         const img = document.createElement('img');
-        img.src = `/api/image/${series.cover}`;
+        img.src = `/api/thumbnail/${series.cover}?w=320`;
         img.alt = series.name;
         img.onerror = () => {
             cover.innerHTML = '📖';
@@ -142,38 +206,27 @@ function extractChapterNumber(chapterName) {
 
 function setupSearch() {
     const searchInput = document.getElementById('searchInput');
+    let debounce = null;
     
+    // Searching happens server-side (names, alternate titles, author, genres; typo tolerant)
     searchInput.addEventListener('input', (e) => {
-        const query = e.target.value.toLowerCase().trim();
-        
-        if (query === '') {
-            displaySeries(allSeries);
-            return;
-        }
-        
-        const filtered = allSeries.filter(series => {
-            // Search in series name (formatted)
-            const formattedName = formatSeriesName(series.name).toLowerCase();
-            if (formattedName.includes(query)) {
-                return true;
-            }
-            
-            // Search in original series name
-            if (series.name.toLowerCase().includes(query)) {
-                return true;
+        clearTimeout(debounce);
+        debounce = setTimeout(() => {
+            const query = e.target.value.toLowerCase().trim();
+            if (query !== libraryState.query) {
+                libraryState.query = query;
+                resetLibrary();
             }
-            
-            // Search in alternate titles
-            if (series.alternate_titles) {
-                return series.alternate_titles.some(title => 
-                    title.toLowerCase().includes(query)
-                );
-            }
-            
-            return false;
-        });
-        
-        displaySeries(filtered);
+        }, 200);
+    });
+}
+
+function setupSort() {
+    const sortSelect = document.getElementById('sortSelect');
+    
+    sortSelect.addEventListener('change', (e) => {
+        libraryState.sort = e.target.value;
+        resetLibrary();
     });
 }
 
@@ -10,10 +10,28 @@ let settings = {
     reading_direction: 'ltr',
     fit_mode: 'width'
 };
-let preloadedChapters = {
-    next: null,
-    prev: null
-};
+// Prefetched chapter manifests by chapter name, and batch requests in flight
+let preloadedChapters = {};
+let pendingPrefetches = new Set();
+
+// Chapters fetched ahead in one /api/chapters request
+const PREFETCH_CHAPTERS = 3;
+
+// Chapters served before their pages were paired ('pairs_pending') are
+// fetched again every PAIRS_RETRY_DELAY ms until the real pairs arrive
+const PAIRS_RETRY_DELAY = 2000;
+const PAIRS_RETRY_LIMIT = 15;
+
+// Page to open the first chapter at (?page=, e.g. from "Continue reading")
+let resumePage = parseInt(new URLSearchParams(window.location.search).get('page')) || 1;
+// The reading position is reported once page turns settle for this long (ms)
+const PROGRESS_SAVE_DELAY = 1000;
+let progressTimer = null;
+
+// Page widths the server keeps resized copies for (READER_WIDTHS in app.py)
+const IMAGE_WIDTHS = [480, 720, 1080, 1440, 1920, 2560];
+// Widest the scroll/single readers ever display a page (see reader.css)
+const MAX_PAGE_CSS_WIDTH = 1200;
 
 document.addEventListener('DOMContentLoaded', () => {
     loadSettings();
@@ -176,6 +194,7 @@ async function loadChapter() {
         updateHeaderInfo();
         updateNavigation();
         applySettings();
+        schedulePairsRefresh();
         
         // Preload adjacent chapters in background
         preloadAdjacentChapters();
@@ -191,69 +210,110 @@ async function preloadAdjacentChapters() {
     
     const nav = currentChapter.navigation;
     
-    // Preload next chapter
-    if (nav.next_chapter) {
-        preloadChapter(nav.next_chapter, 'next');
+    // Preload the next few chapters in one request
+    if (nav.next_chapter && !preloadedChapters[nav.next_chapter]) {
+        preloadChapters(nav.next_chapter, PREFETCH_CHAPTERS, 'next');
     }
     
     // Preload previous chapter
-    if (nav.prev_chapter) {
-        preloadChapter(nav.prev_chapter, 'prev');
+    if (nav.prev_chapter && !preloadedChapters[nav.prev_chapter]) {
+        preloadChapters(nav.prev_chapter, 1, 'prev');
     }
 }
 
-async function preloadChapter(chapterNum, direction) {
+async function preloadChapters(startChapter, count, direction) {
+    if (pendingPrefetches.has(startChapter)) return;
+    pendingPrefetches.add(startChapter);
+    
     try {
-        console.log(`Preloading ${direction} chapter: ${chapterNum}`);
+        console.log(`Preloading ${count} ${direction} chapter(s) from: ${startChapter}`);
         
-        const response = await fetch(`/api/chapter/${encodeURIComponent(seriesName)}/${chapterNum}`);
+        const response = await fetch(
+            `/api/chapters/${encodeURIComponent(seriesName)}/${encodeURIComponent(startChapter)}?count=${count}`
+        );
         
         if (!response.ok) {
-            console.warn(`Failed to preload ${direction} chapter`);
+            console.warn(`Failed to preload ${direction} chapters`);
             return;
         }
         
-        const chapterData = await response.json();
-        
-        // Store preloaded data
-        preloadedChapters[direction] = {
-            chapterNum: chapterNum,
-            data: chapterData,
-            timestamp: Date.now()
-        };
-        
-        // Preload first few images
-        const imagesToPreload = direction === 'next' ? 
-            chapterData.pages.slice(0, 3) : // Preload first 3 pages of next chapter
-            chapterData.pages.slice(-3);     // Preload last 3 pages of prev chapter
+        const batch = await response.json();
         
-        imagesToPreload.forEach(imagePath => {
-            const img = new Image();
-            img.src = `/api/image/${imagePath}`;
+        batch.chapters.forEach(chapterData => {
+            // Store preloaded data
+            preloadedChapters[chapterData.chapter] = {
+                data: chapterData,
+                timestamp: Date.now()
+            };
+            
+            // Preload first few images
+            const imagesToPreload = direction === 'next' ? 
+                chapterData.pages.slice(0, 3) : // Preload first 3 pages of next chapters
+                chapterData.pages.slice(-3);     // Preload last 3 pages of prev chapter
+            
+            imagesToPreload.forEach(imagePath => {
+                const img = new Image();
+                img.src = pageImageUrl(imagePath);
+            });
         });
         
-        console.log(`Successfully preloaded ${direction} chapter: ${chapterNum}`);
+        console.log(`Successfully preloaded ${batch.chapters.length} ${direction} chapter(s)`);
         
     } catch (error) {
-        console.error(`Error preloading ${direction} chapter:`, error);
+        console.error(`Error preloading ${direction} chapters:`, error);
+    } finally {
+        pendingPrefetches.delete(startChapter);
     }
 }
 
+function schedulePairsRefresh(attempt = 0) {
+    if (!currentChapter?.pairs_pending || attempt >= PAIRS_RETRY_LIMIT) return;
+    const chapter = currentChapter;
+    
+    setTimeout(async () => {
+        if (currentChapter !== chapter) return;
+        try {
+            const response = await fetch(
+                `/api/chapter/${encodeURIComponent(seriesName)}/${encodeURIComponent(chapter.chapter)}`
+            );
+            if (!response.ok || currentChapter !== chapter) return;
+            const data = await response.json();
+            if (data.pairs_pending) {
+                schedulePairsRefresh(attempt + 1);
+                return;
+            }
+            
+            // Keep the page being read on screen under the new pairs
+            let firstPage = 0;
+            for (let i = 0; i < currentPairIndex; i++) {
+                firstPage += chapter.page_pairs[i].length;
+            }
+            chapter.page_pairs = data.page_pairs;
+            chapter.pair_count = data.pair_count;
+            chapter.page_sizes ??= data.page_sizes;
+            delete chapter.pairs_pending;
+            if (settings.reader_mode === 'dual') {
+                let remaining = firstPage + 1;
+                const index = chapter.page_pairs.findIndex(pair => (remaining -= pair.length) <= 0);
+                showPair(Math.max(index, 0));
+            }
+        } catch (error) {
+            console.error('Error refreshing page pairs:', error);
+        }
+    }, PAIRS_RETRY_DELAY);
+}
+
 function getPreloadedChapter(chapterNum) {
     // Check if we have this chapter preloaded
-    if (preloadedChapters.next?.chapterNum == chapterNum) {
-        const data = preloadedChapters.next.data;
-        preloadedChapters.next = null; // Clear after use
-        return data;
-    }
+    const preloaded = preloadedChapters[chapterNum];
+    if (!preloaded) return null;
+    delete preloadedChapters[chapterNum]; // Clear after use
     
-    if (preloadedChapters.prev?.chapterNum == chapterNum) {
-        const data = preloadedChapters.prev.data;
-        preloadedChapters.prev = null; // Clear after use
-        return data;
+    // Prefetched before its pages were paired: dual mode needs the real pairs
+    if (preloaded.data.pairs_pending && settings.reader_mode === 'dual') {
+        return null;
     }
-    
-    return null;
+    return preloaded.data;
 }
 
 function updateHeaderInfo() {
@@ -289,6 +349,30 @@ function formatChapterName(chapterName) {
     return chapterName.replace(/-/g, ' ').replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase());
 }
 
+// ===== Page Image URLs =====
+function pageImageUrl(pagePath) {
+    // Original fit needs the full-size scan
+    if (settings.fit_mode === 'original') {
+        return `/api/image/${pagePath}`;
+    }
+    
+    let cssWidth = Math.min(window.innerWidth, MAX_PAGE_CSS_WIDTH);
+    if (settings.reader_mode === 'dual') {
+        cssWidth = window.innerWidth * 0.48;
+    }
+    if (settings.fit_mode === 'height') {
+        // Portrait pages are roughly 0.7 as wide as they are tall
+        cssWidth = Math.min(cssWidth, window.innerHeight * 0.75);
+    }
+    
+    const target = cssWidth * (window.devicePixelRatio || 1);
+    const width = IMAGE_WIDTHS.find(w => w >= target);
+    if (!width) {
+        return `/api/image/${pagePath}`;
+    }
+    return `/api/image/${pagePath}?w=${width}`;
+}
+
 // ===== Scroll Reader Mode =====
 function displayScrollReader() {
     const container = document.getElementById('scrollPageContainer');
@@ -300,16 +384,25 @@ function displayScrollReader() {
         pageDiv.dataset.pageNumber = index + 1;
         
         const img = document.createElement('img');
-        img.src = `/api/image/${page}`;
+        img.src = pageImageUrl(page);
         img.alt = `Page ${index + 1}`;
         img.loading = 'lazy';
+        // Reserve the page's height before it loads, so the layout doesn't jump
+        const size = currentChapter.page_sizes?.[index];
+        if (size) {
+            img.style.aspectRatio = `auto ${size[0]} / ${size[1]}`;
+        }
         
         pageDiv.appendChild(img);
         container.appendChild(pageDiv);
     });
     
     setupScrollTracking();
-    updatePageIndicator(1, currentChapter.page_count);
+    const startPage = Math.min(takeResumePage(), currentChapter.pages.length);
+    updatePageIndicator(startPage, currentChapter.page_count);
+    if (startPage > 1) {
+        setTimeout(() => container.children[startPage - 1].scrollIntoView(), 0);
+    }
 }
 
 function setupScrollTracking() {
@@ -340,7 +433,7 @@ function setupScrollTracking() {
 
 // ===== Single Page Reader Mode =====
 function displaySingleReader() {
-    currentPageIndex = 0;
+    currentPageIndex = Math.min(takeResumePage(), currentChapter.pages.length) - 1;
     showPage(currentPageIndex);
     setupSinglePageControls();
     
@@ -355,7 +448,7 @@ function showPage(index) {
     
     currentPageIndex = index;
     const img = document.getElementById('currentPageImg');
-    img.src = `/api/image/${currentChapter.pages[index]}`;
+    img.src = pageImageUrl(currentChapter.pages[index]);
     
     updateSinglePageControls();
     updatePageIndicator(index + 1, currentChapter.page_count);
@@ -371,9 +464,8 @@ function checkPreloadTrigger() {
     if (settings.reader_mode === 'single') {
         const pagesFromEnd = currentChapter.pages.length - currentPageIndex - 1;
         if (pagesFromEnd <= 3 && currentChapter.navigation?.next_chapter) {
-            if (!preloadedChapters.next || 
-                preloadedChapters.next.chapterNum != currentChapter.navigation.next_chapter) {
-                preloadChapter(currentChapter.navigation.next_chapter, 'next');
+            if (!preloadedChapters[currentChapter.navigation.next_chapter]) {
+                preloadChapters(currentChapter.navigation.next_chapter, PREFETCH_CHAPTERS, 'next');
             }
         }
     }
@@ -381,9 +473,8 @@ function checkPreloadTrigger() {
     // In dual mode, preload immediately (pairing script is slow)
     if (settings.reader_mode === 'dual') {
         if (currentChapter.navigation?.next_chapter) {
-            if (!preloadedChapters.next || 
-                preloadedChapters.next.chapterNum != currentChapter.navigation.next_chapter) {
-                preloadChapter(currentChapter.navigation.next_chapter, 'next');
+            if (!preloadedChapters[currentChapter.navigation.next_chapter]) {
+                preloadChapters(currentChapter.navigation.next_chapter, PREFETCH_CHAPTERS, 'next');
             }
         }
     }
@@ -471,7 +562,10 @@ function setupSinglePageControls() {
 
 // ===== Dual Page Reader Mode =====
 function displayDualReader() {
-    currentPairIndex = 0;
+    // Open at the pair holding the resume page
+    let remaining = takeResumePage();
+    currentPairIndex = currentChapter.page_pairs.findIndex(pair => (remaining -= pair.length) <= 0);
+    if (currentPairIndex < 0) currentPairIndex = 0;
     showPair(currentPairIndex);
     setupDualPageControls();
     
@@ -496,14 +590,14 @@ function showPair(index) {
     if (pair.length === 2) {
         // Two pages - pair[0] is right, pair[1] is left in the array
         // But we need to display: left image on left side, right image on right side
-        leftImg.src = `/api/image/${pair[0]}`;
-        rightImg.src = `/api/image/${pair[1]}`;
+        leftImg.src = pageImageUrl(pair[0]);
+        rightImg.src = pageImageUrl(pair[1]);
         rightImg.style.display = 'block';
         leftImg.style.display = 'block';
         wrapper.classList.remove('single-in-pair');
     } else if (pair.length === 1) {
         // Single page (likely double-spread or last page) - center it
-        rightImg.src = `/api/image/${pair[0]}`;
+        rightImg.src = pageImageUrl(pair[0]);
         rightImg.style.display = 'block';
         leftImg.style.display = 'none';
         wrapper.classList.add('single-in-pair');
@@ -657,11 +751,42 @@ function updatePageIndicator(page, total) {
     const indicator = document.getElementById('pageIndicator');
     if (typeof page === 'number') {
         indicator.textContent = `Page ${page} of ${total}`;
+        scheduleProgressSave(page);
     } else {
         indicator.textContent = `Pages ${page} of ${total}`;
+        // A "3-4" spread counts as read up to its last page
+        scheduleProgressSave(parseInt(page.split('-')[1]));
     }
 }
 
+// ===== Reading Progress =====
+function takeResumePage() {
+    // Only the chapter opened first resumes mid-way
+    const page = resumePage;
+    resumePage = 1;
+    return page;
+}
+
+function scheduleProgressSave(page) {
+    clearTimeout(progressTimer);
+    const chapter = currentChapter;
+    progressTimer = setTimeout(() => {
+        fetch('/api/progress', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                series: seriesName,
+                chapter: chapter.chapter,
+                page: page,
+                page_count: chapter.page_count
+            }),
+            keepalive: true
+        }).catch(error => console.error('Error saving progress:', error));
+    }, PROGRESS_SAVE_DELAY);
+}
+
 // ===== Navigation =====
 function setupNavigation() {
     const backBtn = document.getElementById('backBtn');
@@ -745,6 +870,7 @@ function navigateToChapter(chapterNum) {
             updateHeaderInfo();
             updateNavigation();
             applySettings();
+            schedulePairsRefresh();
             
             // Reset page/pair indices
             currentPageIndex = 0;
@@ -28,6 +28,7 @@ async function loadSeries() {
         displaySeriesInfo();
         displayChapters();
         setupSortButton();
+        loadProgress();
         
     } catch (error) {
         console.error('Error loading series:', error);
@@ -47,7 +48,7 @@ function displaySeriesInfo() {
     
     // Set cover image and banner background
     if (seriesData.cover) {
-        const coverUrl = `/api/image/${seriesData.cover}`;
+        const coverUrl = `/api/thumbnail/${seriesData.cover}?w=480`;
         coverImg.src = coverUrl;
         coverImg.alt = seriesData.display_name || seriesData.name;
         
@@ -127,6 +128,26 @@ function displayChapters() {
     });
 }
 
+async function loadProgress() {
+    const continueBtn = document.getElementById('continueBtn');
+    try {
+        const response = await fetch(`/api/progress/${encodeURIComponent(seriesName)}`);
+        if (!response.ok) {
+            return; // Not started yet
+        }
+        const progress = await response.json();
+        continueBtn.textContent = `▶ Continue ${formatChapterName(progress.resume_chapter)}`
+            + (progress.resume_page > 1 ? `, page ${progress.resume_page}` : '');
+        continueBtn.addEventListener('click', () => {
+            window.location.href = `/reader/${encodeURIComponent(seriesName)}/`
+                + `${encodeURIComponent(progress.resume_chapter)}?page=${progress.resume_page}`;
+        });
+        continueBtn.style.display = 'inline-block';
+    } catch (error) {
+        console.error('Error loading progress:', error);
+    }
+}
+
 function getCurrentSortedChapters() {
     // Clone the array to avoid mutating original
     const chapters = [...seriesData.chapters];